@@ -0,0 +1,142 @@
+from fastapi import Request
+from slowapi.util import get_remote_address
+from app.core.state_store import get_state_store
+import hashlib
+import os
+import time
+
+NAMESPACE = "token_buckets"
+
+# Hourly budgets in estimated LLM tokens (input + output). 0 disables a bucket.
+# Requests on the shared OpenRouter key draw from the caller's bucket and from
+# the shared bucket; requests with their own key only draw from that key's bucket.
+CLIENT_TOKENS_PER_HOUR = int(os.getenv("COST_LIMIT_CLIENT_TOKENS_PER_HOUR", "1000000"))
+SHARED_TOKENS_PER_HOUR = int(os.getenv("COST_LIMIT_SHARED_TOKENS_PER_HOUR", "20000000"))
+API_KEY_TOKENS_PER_HOUR = int(os.getenv("COST_LIMIT_API_KEY_TOKENS_PER_HOUR", "5000000"))
+
+
+class BudgetExceededError(Exception):
+    """Raised when a request's estimated token spend exceeds the caller's budget."""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(
+            f"Token budget exceeded. Please try again in {max(1, round(retry_after))} seconds."
+        )
+
+
+class TokenBucket:
+    """
+    Token bucket measured in estimated LLM tokens, kept in the shared state
+    store so all workers draw from the same budget.
+
+    A bucket holds up to `capacity` tokens and refills continuously at
+    `capacity` per `period` seconds. A request costing more than the capacity
+    is charged the full capacity, so it waits for a full bucket instead of
+    being rejected forever.
+    """
+
+    def __init__(self, name: str, capacity: int, period: float = 3600):
+        self.name = name
+        self.capacity = capacity
+        self.refill_rate = capacity / period
+
+    def _level(self, state: dict | None, now: float) -> float:
+        if state is None:
+            return float(self.capacity)
+        elapsed = max(0.0, now - state["updated"])
+        return min(float(self.capacity), state["tokens"] + elapsed * self.refill_rate)
+
+    def consume(self, key: str, cost: int) -> tuple[int, float]:
+        """
+        Takes `cost` tokens if the bucket has them.
+
+        Returns:
+            tuple[int, float]: Tokens charged, and seconds until the request
+                               would fit if nothing was charged
+        """
+        cost = min(cost, self.capacity)
+
+        def take(state):
+            now = time.time()
+            level = self._level(state, now)
+            if level >= cost:
+                return {"tokens": level - cost, "updated": now}, (cost, 0.0)
+            wait = (cost - level) / self.refill_rate
+            return {"tokens": level, "updated": now}, (0, wait)
+
+        # A bucket left alone for a full period is full, so its row can expire
+        return get_state_store().update(
+            NAMESPACE, f"{self.name}:{key}", take, ttl=self.capacity / self.refill_rate
+        )
+
+    def refund(self, key: str, amount: int):
+        """Returns tokens to the bucket, never above capacity."""
+
+        def give(state):
+            now = time.time()
+            level = min(float(self.capacity), self._level(state, now) + amount)
+            return {"tokens": level, "updated": now}, None
+
+        get_state_store().update(
+            NAMESPACE, f"{self.name}:{key}", give, ttl=self.capacity / self.refill_rate
+        )
+
+
+client_bucket = TokenBucket("client", CLIENT_TOKENS_PER_HOUR)
+shared_bucket = TokenBucket("shared", SHARED_TOKENS_PER_HOUR)
+api_key_bucket = TokenBucket("api_key", API_KEY_TOKENS_PER_HOUR)
+
+
+class Reservation:
+    """Tokens charged for one request, across every bucket it drew from."""
+
+    def __init__(self, charges: list[tuple[TokenBucket, str, int]]):
+        self.charges = charges
+
+    def refund(self, tokens: int):
+        """Returns up to `tokens` of the estimate to each bucket that was charged."""
+        if tokens <= 0:
+            return
+        remaining = []
+        for bucket, key, charged in self.charges:
+            amount = min(tokens, charged)
+            if amount:
+                bucket.refund(key, amount)
+            remaining.append((bucket, key, charged - amount))
+        self.charges = remaining
+
+
+def reserve_tokens(request: Request, api_key: str | None, cost: int) -> Reservation:
+    """
+    Charges a request's estimated token spend to its buckets, all or nothing.
+
+    Args:
+        request (Request): The incoming request, identifying the client
+        api_key (str | None): User-supplied OpenRouter key, which gets its own bucket
+        cost (int): Estimated input plus output tokens
+
+    Raises:
+        BudgetExceededError: If any bucket cannot cover the cost
+
+    Returns:
+        Reservation: The charges, for refunding unused budget later
+    """
+    if api_key:
+        # Bucketed by a hash so the key itself is never stored
+        key_id = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+        buckets = [(api_key_bucket, key_id)]
+    else:
+        client = get_remote_address(request)
+        buckets = [(client_bucket, client), (shared_bucket, "default")]
+
+    charges = []
+    for bucket, key in buckets:
+        if bucket.capacity <= 0:
+            continue
+        charged, wait = bucket.consume(key, cost)
+        if wait > 0:
+            Reservation(charges).refund(cost)
+            raise BudgetExceededError(wait)
+        charges.append((bucket, key, charged))
+    return Reservation(charges)
@@ -0,0 +1,120 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from app.core import profiling
+from functools import partial
+from typing import Any, Callable
+import asyncio
+import os
+import threading
+import time
+
+# Where CPU-heavy request stages run once their input passes the threshold:
+# "thread" (tokenization and orjson release the GIL), "process" (full
+# isolation, functions and arguments must be picklable) or "inline"
+CPU_EXECUTOR = os.getenv("CPU_EXECUTOR", "thread")
+CPU_EXECUTOR_WORKERS = int(os.getenv("CPU_EXECUTOR_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Inputs smaller than this many characters run inline, where the hand-off
+# to the executor would cost more than the work itself
+CPU_OFFLOAD_THRESHOLD = int(os.getenv("CPU_OFFLOAD_THRESHOLD", "50000"))
+
+# How often the event loop lag is sampled
+LOOP_LAG_INTERVAL = 0.25
+
+_executor: Executor | None = None
+_executor_lock = threading.Lock()
+_stats: dict[str, dict] = {}
+_stats_lock = threading.Lock()
+_loop_lag = {"last_ms": 0.0, "max_ms": 0.0}
+
+
+def _get_executor() -> Executor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            if CPU_EXECUTOR == "process":
+                _executor = ProcessPoolExecutor(max_workers=CPU_EXECUTOR_WORKERS)
+            else:
+                _executor = ThreadPoolExecutor(
+                    max_workers=CPU_EXECUTOR_WORKERS, thread_name_prefix="cpu"
+                )
+        return _executor
+
+
+def record_stage(stage: str, seconds: float, offloaded: bool = False):
+    """Adds one timing sample for a stage."""
+    with _stats_lock:
+        stats = _stats.setdefault(
+            stage, {"calls": 0, "offloaded": 0, "total_ms": 0.0, "max_ms": 0.0}
+        )
+        ms = seconds * 1000
+        stats["calls"] += 1
+        stats["offloaded"] += offloaded
+        stats["total_ms"] += ms
+        stats["max_ms"] = max(stats["max_ms"], ms)
+
+
+@contextmanager
+def timed_stage(stage: str):
+    """Times a block that already runs off the event loop."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        record_stage(stage, end - start)
+        profiling.record_span(stage, start, end)
+
+
+async def run_cpu(stage: str, func: Callable[..., Any], *args, size: int = 0) -> Any:
+    """
+    Runs a CPU-bound function, inline for small inputs and on the CPU
+    executor otherwise, and records how long the stage took.
+
+    Args:
+        stage (str): Name for the timing statistics
+        func (Callable): The function to call with `args`
+        size (int): Input size in characters, compared to the offload threshold
+
+    Returns:
+        Any: The function's result
+    """
+    start = time.perf_counter()
+    offload = CPU_EXECUTOR != "inline" and size >= CPU_OFFLOAD_THRESHOLD
+    try:
+        if not offload:
+            return func(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), partial(func, *args))
+    finally:
+        end = time.perf_counter()
+        record_stage(stage, end - start, offload)
+        profiling.record_span(stage, start, end, offloaded=offload, size=size)
+
+
+async def monitor_loop_lag():
+    """Measures how late the event loop wakes up compared to when it was due."""
+    while True:
+        due = time.perf_counter() + LOOP_LAG_INTERVAL
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag_ms = max(0.0, (time.perf_counter() - due) * 1000)
+        _loop_lag["last_ms"] = lag_ms
+        _loop_lag["max_ms"] = max(_loop_lag["max_ms"], lag_ms)
+
+
+def snapshot() -> dict:
+    """Per-stage timings and event loop lag of this worker."""
+    with _stats_lock:
+        stages = {
+            stage: {
+                **stats,
+                "avg_ms": stats["total_ms"] / stats["calls"] if stats["calls"] else 0.0,
+            }
+            for stage, stats in _stats.items()
+        }
+    return {
+        "executor": CPU_EXECUTOR,
+        "workers": CPU_EXECUTOR_WORKERS,
+        "offload_threshold": CPU_OFFLOAD_THRESHOLD,
+        "stages": stages,
+        "loop_lag_ms": dict(_loop_lag),
+    }
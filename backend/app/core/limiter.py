@@ -1,4 +1,52 @@
+from limits.storage import Storage
 from slowapi import Limiter
 from slowapi.util import get_remote_address
+from app.core.state_store import get_state_store
+import sqlite3
+import time
 
-limiter = Limiter(key_func=get_remote_address)
+NAMESPACE = "rate_limits"
+
+
+class StateStoreStorage(Storage):
+    """
+    `limits` storage backed by the shared state store, so every worker on the
+    host counts against the same limits. Registered as the "state://" scheme.
+    """
+
+    STORAGE_SCHEME = ["state"]
+
+    def __init__(self, uri: str | None = None, wrap_exceptions: bool = False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.store = get_state_store()
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def incr(self, key: str, expiry: int, elastic_expiry: bool = False, amount: int = 1) -> int:
+        return self.store.incr(
+            NAMESPACE, key, amount, ttl=expiry, refresh_ttl=elastic_expiry
+        )
+
+    def get(self, key: str) -> int:
+        return self.store.get(NAMESPACE, key) or 0
+
+    def get_expiry(self, key: str) -> int:
+        return int(self.store.expires_at(NAMESPACE, key) or time.time())
+
+    def check(self) -> bool:
+        try:
+            self.store.get(NAMESPACE, "__healthcheck__")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> int | None:
+        return self.store.clear(NAMESPACE)
+
+    def clear(self, key: str) -> None:
+        self.store.delete(NAMESPACE, key)
+
+
+limiter = Limiter(key_func=get_remote_address, storage_uri="state://")
@@ -0,0 +1,247 @@
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from collections import Counter
+from typing import AsyncIterator
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+
+# Operator-only: a request is profiled when it carries this token in the
+# X-Profile-Token header. Without a token configured nothing is profiled
+# and spans cost a single context variable lookup.
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")
+PROFILE_HEADER = "X-Profile-Token"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+# Stacks deeper than this are cut at the root end
+MAX_STACK_DEPTH = 128
+# Sampling stops after this long even if the request never finishes, e.g.
+# when a client disconnects before its stream started
+MAX_PROFILE_SECONDS = 900
+
+_active: ContextVar["RequestProfile | None"] = ContextVar("request_profile", default=None)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    # Semicolons separate frames in the collapsed stack format
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(
+        ";", ":"
+    )
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples the stacks of every thread in the process at a fixed interval and
+    counts them in collapsed form ("thread;outer;...;inner"), the input
+    format of flamegraph.pl and speedscope.
+
+    Waiting on the network shows up as the event loop's selector, so samples
+    also tell time spent waiting on GitHub or the model from CPU work.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + MAX_PROFILE_SECONDS
+        while not self._stop_event.wait(self.interval) and time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        """Asks the sampler to stop after its current sample, without waiting."""
+        self._stop_event.set()
+
+
+class RequestProfile:
+    """
+    Sampled stacks and timed spans of one request, written to
+    `PROFILE_DIR/<request id>/` when the request finishes:
+
+    - profile.folded: collapsed stacks, for flamegraph.pl or speedscope
+    - timeline.json: spans in the Chrome trace format, for Perfetto or chrome://tracing
+    - summary.json: total time and time per span name
+    """
+
+    def __init__(self, endpoint: str, details: dict | None = None):
+        self.request_id = uuid.uuid4().hex
+        self.endpoint = endpoint
+        self.details = details or {}
+        self.spans: list[dict] = []
+        self._lock = threading.Lock()
+        self._finished = False
+        self.started = time.perf_counter()
+        self.sampler = StackSampler(PROFILE_SAMPLE_INTERVAL)
+        self.sampler.start()
+
+    def add_span(self, name: str, start: float, end: float, **args):
+        """Records a span from perf_counter() timestamps."""
+        with self._lock:
+            self.spans.append(
+                {
+                    "name": name,
+                    "start": start - self.started,
+                    "end": end - self.started,
+                    "thread": threading.current_thread().name,
+                    "args": args,
+                }
+            )
+
+    @contextmanager
+    def span(self, name: str, **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, time.perf_counter(), **args)
+
+    def mark(self, name: str):
+        """Records an instant, such as the first token of a phase."""
+        now = time.perf_counter()
+        self.add_span(name, now, now)
+
+    def finish(self):
+        """
+        Stops sampling and writes the artifacts. Only the first call has an
+        effect. It is called on the event loop, so waiting for the sampler and
+        writing the files happen on a thread of their own.
+        """
+        if self._finished:
+            return
+        self._finished = True
+        total = time.perf_counter() - self.started
+        self.sampler.stop()
+        threading.Thread(
+            target=self._write_after_sampling, args=(total,), name="profile-writer"
+        ).start()
+
+    def _write_after_sampling(self, total: float):
+        self.sampler.join()
+        try:
+            self._write(total)
+        except OSError as e:
+            print(f"Failed to write profile {self.request_id}: {str(e)}")
+
+    def _write(self, total: float):
+        directory = os.path.join(PROFILE_DIR, self.request_id)
+        os.makedirs(directory, exist_ok=True)
+
+        with open(os.path.join(directory, "profile.folded"), "w") as f:
+            for stack, count in self.sampler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        threads = sorted({span["thread"] for span in self.spans})
+        thread_ids = {thread: i + 1 for i, thread in enumerate(threads)}
+        events = [
+            {"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": thread}}
+            for thread, tid in thread_ids.items()
+        ]
+        for span in self.spans:
+            event = {
+                "name": span["name"],
+                "ph": "X" if span["end"] > span["start"] else "i",
+                "ts": span["start"] * 1e6,
+                "pid": 1,
+                "tid": thread_ids[span["thread"]],
+                "args": span["args"],
+            }
+            if event["ph"] == "X":
+                event["dur"] = (span["end"] - span["start"]) * 1e6
+            else:
+                event["s"] = "t"
+            events.append(event)
+        with open(os.path.join(directory, "timeline.json"), "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+        by_name: dict[str, dict] = {}
+        for span in self.spans:
+            stats = by_name.setdefault(span["name"], {"count": 0, "seconds": 0.0})
+            stats["count"] += 1
+            stats["seconds"] += span["end"] - span["start"]
+        with open(os.path.join(directory, "summary.json"), "w") as f:
+            json.dump(
+                {
+                    "request_id": self.request_id,
+                    "endpoint": self.endpoint,
+                    **self.details,
+                    "total_seconds": total,
+                    "samples": self.sampler.samples,
+                    "sample_interval": PROFILE_SAMPLE_INTERVAL,
+                    "spans": by_name,
+                },
+                f,
+                indent=2,
+            )
+        print(f"Wrote profile of {self.endpoint} to {directory}")
+
+
+def is_operator(request) -> bool:
+    """Whether the request carries the operator token, which also guards internal metrics."""
+    if not PROFILING_TOKEN:
+        return False
+    token = request.headers.get(PROFILE_HEADER)
+    return bool(token) and hmac.compare_digest(token.encode(), PROFILING_TOKEN.encode())
+
+
+def start_profile(request, endpoint: str, **details) -> RequestProfile | None:
+    """
+    Starts profiling the request if it carries the operator token.
+
+    Returns:
+        RequestProfile | None: The active profile, or None for normal requests
+    """
+    if not is_operator(request):
+        return None
+    profile = RequestProfile(endpoint, details)
+    _active.set(profile)
+    return profile
+
+
+async def profiled_stream(profile: RequestProfile, stream: AsyncIterator) -> AsyncIterator:
+    """Relays a streaming body with the profile active, finishing it when the stream ends."""
+    _active.set(profile)
+    try:
+        async for item in stream:
+            yield item
+    finally:
+        profile.finish()
+
+
+def span(name: str, **args):
+    """Times a block as a span of the active profile, if any."""
+    profile = _active.get()
+    if profile is None:
+        return nullcontext()
+    return profile.span(name, **args)
+
+
+def record_span(name: str, start: float, end: float, **args):
+    """Records an already timed span on the active profile, if any."""
+    profile = _active.get()
+    if profile is not None:
+        profile.add_span(name, start, end, **args)
+
+
+def mark(name: str):
+    profile = _active.get()
+    if profile is not None:
+        profile.mark(name)
@@ -0,0 +1,317 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Callable
+
+# "sqlite" shares state between every worker on the host, "memory" keeps it
+# per process (single worker, or platforms without a writable temp directory)
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite")
+STATE_DB_PATH = os.getenv("STATE_DB_PATH") or os.path.join(
+    tempfile.gettempdir(), "gitdiagram-state.sqlite3"
+)
+
+# Expired rows are deleted on roughly one in this many writes
+PURGE_EVERY_WRITES = 500
+
+
+class SQLiteStateStore:
+    """
+    Namespaced key-value store in a local SQLite database, shared by all
+    workers on the host.
+
+    The database runs in WAL mode so readers never block the writer, and
+    read-modify-write operations (`incr`, `add`, `update`) run in IMMEDIATE
+    transactions so they are atomic across processes. Values are stored as
+    JSON and may have a TTL.
+    """
+
+    def __init__(self, path: str = STATE_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        with self._connection() as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS state (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    expires_at REAL,
+                    PRIMARY KEY (namespace, key)
+                ) WITHOUT ROWID
+                """
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=10, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _after_write(self, connection: sqlite3.Connection):
+        self._writes += 1
+        if self._writes % PURGE_EVERY_WRITES == 0:
+            connection.execute(
+                "DELETE FROM state WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                (time.time(),),
+            )
+
+    @staticmethod
+    def _expiry(ttl: float | None) -> float | None:
+        return time.time() + ttl if ttl is not None else None
+
+    def get(self, namespace: str, key: str) -> Any:
+        """Returns the stored value, or None if it is missing or expired."""
+        row = (
+            self._connection()
+            .execute(
+                "SELECT value FROM state WHERE namespace = ? AND key = ? "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, time.time()),
+            )
+            .fetchone()
+        )
+        return json.loads(row[0]) if row else None
+
+    def expires_at(self, namespace: str, key: str) -> float | None:
+        """Returns the expiry timestamp of a live key, or None."""
+        row = (
+            self._connection()
+            .execute(
+                "SELECT expires_at FROM state WHERE namespace = ? AND key = ? "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, time.time()),
+            )
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float | None = None):
+        """Stores a JSON-serializable value, replacing any previous one."""
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO state (namespace, key, value, expires_at) "
+            "VALUES (?, ?, ?, ?)",
+            (namespace, key, json.dumps(value), self._expiry(ttl)),
+        )
+        self._after_write(connection)
+
+    def add(self, namespace: str, key: str, value: Any, ttl: float | None = None) -> bool:
+        """Stores a value only if the key is missing or expired. Returns whether it did."""
+        connection = self._connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "DELETE FROM state WHERE namespace = ? AND key = ? AND expires_at <= ?",
+                (namespace, key, now),
+            )
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO state (namespace, key, value, expires_at) "
+                "VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), self._expiry(ttl)),
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        self._after_write(connection)
+        return cursor.rowcount == 1
+
+    def incr(
+        self,
+        namespace: str,
+        key: str,
+        amount: int = 1,
+        ttl: float | None = None,
+        refresh_ttl: bool = False,
+    ) -> int:
+        """
+        Atomically adds `amount` to a counter and returns the new value. A
+        missing or expired counter starts at zero with the given TTL, which is
+        only extended on later increments if `refresh_ttl` is set.
+        """
+        connection = self._connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT value, expires_at FROM state WHERE namespace = ? AND key = ? "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, now),
+            ).fetchone()
+            value = (json.loads(row[0]) if row else 0) + amount
+            expires_at = (
+                row[1] if row and not refresh_ttl else self._expiry(ttl)
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO state (namespace, key, value, expires_at) "
+                "VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), expires_at),
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        self._after_write(connection)
+        return value
+
+    def update(
+        self,
+        namespace: str,
+        key: str,
+        update: Callable[[Any], tuple[Any, Any]],
+        ttl: float | None = None,
+    ) -> Any:
+        """
+        Atomically replaces a value with `update(current)`, which returns the
+        new value and a result to hand back. `current` is None for a missing
+        or expired key.
+        """
+        connection = self._connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT value FROM state WHERE namespace = ? AND key = ? "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, now),
+            ).fetchone()
+            value, result = update(json.loads(row[0]) if row else None)
+            connection.execute(
+                "INSERT OR REPLACE INTO state (namespace, key, value, expires_at) "
+                "VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), self._expiry(ttl)),
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        self._after_write(connection)
+        return result
+
+    def delete(self, namespace: str, key: str):
+        """Removes a key if present."""
+        self._connection().execute(
+            "DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+        )
+
+    def clear(self, namespace: str) -> int:
+        """Removes every key in a namespace and returns how many there were."""
+        cursor = self._connection().execute(
+            "DELETE FROM state WHERE namespace = ?", (namespace,)
+        )
+        return cursor.rowcount
+
+
+class MemoryStateStore:
+    """Per-process store with the same interface as `SQLiteStateStore`."""
+
+    def __init__(self):
+        self._data: dict[tuple[str, str], tuple[str, float | None]] = {}
+        self._lock = threading.RLock()
+
+    def _live(self, namespace: str, key: str) -> tuple[str, float | None] | None:
+        entry = self._data.get((namespace, key))
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self._data[(namespace, key)]
+            return None
+        return entry
+
+    def get(self, namespace: str, key: str) -> Any:
+        with self._lock:
+            entry = self._live(namespace, key)
+            return json.loads(entry[0]) if entry else None
+
+    def expires_at(self, namespace: str, key: str) -> float | None:
+        with self._lock:
+            entry = self._live(namespace, key)
+            return entry[1] if entry else None
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float | None = None):
+        with self._lock:
+            expires_at = time.time() + ttl if ttl is not None else None
+            self._data[(namespace, key)] = (json.dumps(value), expires_at)
+
+    def add(self, namespace: str, key: str, value: Any, ttl: float | None = None) -> bool:
+        with self._lock:
+            if self._live(namespace, key) is not None:
+                return False
+            self.set(namespace, key, value, ttl)
+            return True
+
+    def incr(
+        self,
+        namespace: str,
+        key: str,
+        amount: int = 1,
+        ttl: float | None = None,
+        refresh_ttl: bool = False,
+    ) -> int:
+        with self._lock:
+            entry = self._live(namespace, key)
+            value = (json.loads(entry[0]) if entry else 0) + amount
+            if entry and not refresh_ttl:
+                expires_at = entry[1]
+            else:
+                expires_at = time.time() + ttl if ttl is not None else None
+            self._data[(namespace, key)] = (json.dumps(value), expires_at)
+            return value
+
+    def update(
+        self,
+        namespace: str,
+        key: str,
+        update: Callable[[Any], tuple[Any, Any]],
+        ttl: float | None = None,
+    ) -> Any:
+        with self._lock:
+            entry = self._live(namespace, key)
+            value, result = update(json.loads(entry[0]) if entry else None)
+            self.set(namespace, key, value, ttl)
+            return result
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            self._data.pop((namespace, key), None)
+
+    def clear(self, namespace: str) -> int:
+        with self._lock:
+            keys = [entry for entry in self._data if entry[0] == namespace]
+            for entry in keys:
+                del self._data[entry]
+            return len(keys)
+
+
+_state_store = None
+_state_store_lock = threading.Lock()
+
+
+def get_state_store() -> SQLiteStateStore | MemoryStateStore:
+    """
+    Returns the process-wide state store selected by STATE_BACKEND, falling
+    back to memory if the SQLite database cannot be opened.
+    """
+    global _state_store
+    with _state_store_lock:
+        if _state_store is None:
+            if STATE_BACKEND == "memory":
+                _state_store = MemoryStateStore()
+            else:
+                try:
+                    _state_store = SQLiteStateStore(STATE_DB_PATH)
+                except sqlite3.Error as e:
+                    print(
+                        f"Warning: could not open state database {STATE_DB_PATH} ({str(e)}), state is per-process"
+                    )
+                    _state_store = MemoryStateStore()
+        return _state_store
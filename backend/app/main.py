@@ -1,16 +1,34 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
-from app.routers import generate, modify
+from app.routers import generate, modify, webhooks
 from app.core.limiter import limiter
+from app.core import profiling
+from app.services.github_credentials import get_default_credential_pool
+from app.services.showcase import SHOWCASE_BUNDLE_PATH, showcase_store
+from app.utils.tokenizer import warm_encoding
+from app.core.cpu_executor import monitor_loop_lag, snapshot as cpu_snapshot
+from contextlib import asynccontextmanager
 from typing import cast
 from starlette.exceptions import ExceptionMiddleware
-from api_analytics.fastapi import Analytics
+import asyncio
 import os
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the tokenizer off the startup path, ready for the first request
+    warm_encoding()
+    # Showcase diagrams are served from memory without touching any storage
+    showcase_store.load(SHOWCASE_BUNDLE_PATH)
+    # Samples event loop lag, which CPU work left on the loop shows up as
+    lag_monitor = asyncio.create_task(monitor_loop_lag())
+    yield
+    lag_monitor.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 origins = ["http://localhost:3000", "https://gitdiagram.com"]
@@ -25,6 +43,8 @@ app.add_middleware(
 
 API_ANALYTICS_KEY = os.getenv("API_ANALYTICS_KEY")
 if API_ANALYTICS_KEY:
+    from api_analytics.fastapi import Analytics
+
     app.add_middleware(Analytics, api_key=API_ANALYTICS_KEY)
 
 app.state.limiter = limiter
@@ -34,9 +54,25 @@ app.add_exception_handler(
 
 app.include_router(generate.router)
 app.include_router(modify.router)
+app.include_router(webhooks.router)
 
 
 @app.get("/")
 # @limiter.limit("100/day")
 async def root(request: Request):
     return {"message": "Hello from GitDiagram API!"}
+
+
+@app.get("/metrics/github")
+async def github_rate_limits(request: Request):
+    # Remaining GitHub API budget of each shared credential. Credential labels
+    # identify PATs and app installations, so only operators may read them.
+    if not profiling.is_operator(request):
+        raise HTTPException(status_code=403, detail="Operator token required")
+    return {"credentials": get_default_credential_pool().snapshot()}
+
+
+@app.get("/metrics/cpu")
+async def cpu_stages(request: Request):
+    # Time spent in CPU-heavy request stages and event loop lag of this worker
+    return cpu_snapshot()
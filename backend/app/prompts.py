@@ -12,7 +12,7 @@
 #    - Takes the explanation from the first prompt and the file tree.
 #    - Creates a detailed mapping of identifiable code elements (files, functions, classes) to their full repository paths.
 #    - This mapping is crucial for diagram interactivity and linking diagram nodes to specific code locations.
-#    - Output: XML-like structure mapping component names and types to their paths.
+#    - Output: One JSON array of name, kind and path per line.
 
 # 3. SYSTEM_THIRD_PROMPT(explanation, component_mapping, file_tree, readme, ?instructions) -> Mermaid.js diagram
 #    - Uses the explanation, component mapping, original file tree, README, and optional user instructions.
@@ -86,28 +86,25 @@ You are an AI assistant tasked with creating a structured mapping of code compon
 Your goal is to parse the `<explanation>` and the `<file_tree>` to identify all unique, addressable code components (files, and within them, specific functions or classes if they were identified in the explanation) and map them to their full repository paths.
 
 Output Format:
-Produce an XML-like structure enclosed in `<component_mapping></component_mapping>` tags. Each component should be represented by a `<component>` tag with the following attributes:
--   `type`: (string) "file", "function", "class", "module", "service" (for things like Docker services).
--   `path`: (string) The full path to the component. For functions/classes, use the format `path/to/file.ext#FunctionName` or `path/to/file.ext#ClassName`. For files, just the file path.
--   `name`: (string) The name of the component (e.g., "Button.tsx", "fetchData", "UserClass", "web_service").
--   `parent_file`: (string, optional) If the component is a function or class, this is the path to the file containing it.
+Output one component per line as a JSON array of three strings, `["name","kind","path"]`, and nothing else: no surrounding tags, code fences, or commentary.
+-   `name`: The name of the component (e.g., "Button.tsx", "fetchData", "UserClass", "web").
+-   `kind`: "file", "directory", "function", "class", "module", or "service" (for things like Docker services).
+-   `path`: The full path to the component. For functions/classes, use the format `path/to/file.ext#FunctionName` or `path/to/file.ext#ClassName`. For files and directories, just the path.
 
 Example:
-<component_mapping>
-  <component type="file" path="src/components/Button.tsx" name="Button.tsx" />
-  <component type="function" path="src/components/Button.tsx#Button" name="Button" parent_file="src/components/Button.tsx" />
-  <component type="file" path="src/utils/api.ts" name="api.ts" />
-  <component type="function" path="src/utils/api.ts#fetchData" name="fetchData" parent_file="src/utils/api.ts" />
-  <component type="function" path="src/utils/api.ts#postData" name="postData" parent_file="src/utils/api.ts" />
-  <component type="file" path="backend/main.py" name="main.py" />
-  <component type="class" path="backend/main.py#app" name="app" parent_file="backend/main.py" />
-  <component type="service" path="docker-compose.yml#web" name="web" parent_file="docker-compose.yml" />
-</component_mapping>
+["Button.tsx","file","src/components/Button.tsx"]
+["Button","function","src/components/Button.tsx#Button"]
+["api.ts","file","src/utils/api.ts"]
+["fetchData","function","src/utils/api.ts#fetchData"]
+["postData","function","src/utils/api.ts#postData"]
+["main.py","file","backend/main.py"]
+["app","class","backend/main.py#app"]
+["web","service","docker-compose.yml#web"]
 
 Instructions:
 1.  Thoroughly analyze the `<explanation>` to find all mentioned files, directories, functions, classes, and other distinct code elements.
 2.  Cross-reference with the `<file_tree>` to ensure paths are correct and complete.
-3.  For each identified element, create a `<component>` entry as specified above.
+3.  For each identified element, output one line as specified above. List each path once.
 4.  Ensure paths are relative to the repository root.
 5.  If a function or class is mentioned in the explanation but its specific file isn't clear, try to infer it from the context or the file tree structure. If it cannot be reliably mapped, you may omit it.
 6.  The primary goal is to create a comprehensive list of clickable/mappable elements for diagram generation. Do NOT attempt to infer dependencies or relationships in this step.
@@ -143,7 +140,7 @@ Diagram Requirements:
     *   Apply these styles to the respective nodes (e.g., `:::fileStyle`, `:::functionStyle`, `:::codeClassStyle`).
 4.  **Interactivity (Click Events)**:
     *   For every node in the diagram that corresponds to an entry in the `<component_mapping>`, add a `click` event.
-    *   The click target should be the `path` attribute from the `<component_mapping>` for that element.
+    *   The click target should be the path (the last field of the element's line in the `<component_mapping>`).
     *   Example: `click NodeID_FunctionX "path/to/file.ext#FunctionX"` or `click NodeID_FileY "path/to/fileY.ext"`
     *   NodeIDs should be unique and ideally derived from the component's path or name to avoid collisions (e.g., `src_utils_api_ts_fetchData` for a function, `src_utils_api_ts` for a file).
 
@@ -189,6 +186,19 @@ Important Instructions:
 -   Pay close attention to defining unique node IDs for functions/classes within subgraphs and for the subgraphs themselves to ensure click events work correctly. A good convention is to replace `/` and `#` in paths with `_` for Node IDs. E.g., `src/utils/api.ts#fetchData` becomes node ID `src_utils_api_ts_fetchData`.
 """
 
+SYSTEM_OVERVIEW_PROMPT = """
+This diagram is the top level of a hierarchical view. Users open a detailed diagram of any area separately, so override the node requirements above and keep this one small:
+-   Group the project into at most 10 subgraphs, one per major area (a top-level directory, package, service or layer). The subgraph label should be the area's directory path or a short name for the layer.
+-   Inside each subgraph, use at most 5 nodes for the area's most important files or modules. Do NOT add nodes for individual functions or classes.
+-   Draw edges between areas or their main nodes only where the explanation shows a significant interaction.
+-   Every subgraph MUST have a unique ID and a `click` event whose target is the directory path the area covers, e.g. `click sg_src_api "src/api"`. Keep the `click` events of the nodes inside as usual.
+"""
+
+SYSTEM_DRILLDOWN_PROMPT = """
+This diagram is a drill-down of a single area of a larger architecture diagram: <area>{{area}}</area>
+The explanation, component mapping and file tree you received are limited to this area. Diagram it in full detail following the requirements above, with file subgraphs, function and class nodes and their click events. Components outside the area may appear as at most a few plain nodes at the edge of the diagram, without subgraphs, where the area clearly depends on them.
+"""
+
 ADDITIONAL_SYSTEM_INSTRUCTIONS_PROMPT = """
 The user may provide additional instructions enclosed in <instructions>{{instructions}}</instructions> tags.
 These instructions should be given priority when generating the explanation, component mapping, or diagram.
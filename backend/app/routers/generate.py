@@ -1,36 +1,193 @@
-from fastapi import APIRouter, Request, HTTPException
-from fastapi.responses import StreamingResponse
-from dotenv import load_dotenv
+from fastapi import APIRouter, BackgroundTasks, Request, HTTPException
+from fastapi.responses import Response, StreamingResponse
 from app.services.github_service import GitHubService
 from app.services.o4_mini_openai_service import OpenAIo4Service
+from app.utils.token_packer import pack_repository_context
+from app.utils.mermaid import repair_mermaid, validate_mermaid
+from app.utils.click_events import ClickEventRewriter
+from app.utils.component_mapping import MappingParser
+from app.utils.file_tree_index import FileTreeIndex
+from app.utils.artifact_codec import encode_artifacts
+from app.utils.sse import ChunkFrame, sse_event
+from app.utils.tokenizer import count_tokens, get_encoding
+from app.utils.relevance import prune_file_tree
+from app.core.cpu_executor import run_cpu
+from app.core import profiling
+from app.services.diagram_store import diagram_store, drilldown_store, overview_store
+from app.services.drilldown import (
+    describe_area,
+    generation_scope,
+    overview_areas,
+    overview_id,
+    scope_context,
+)
+from app.core.state_store import get_state_store
+from app.core.cost_limiter import BudgetExceededError, reserve_tokens
+from app.services.cost_estimator import calibrated_estimate, record_calibration
+from app.services.showcase import is_showcase_repo, showcase_store
+from app.services.model_router import record_phase_output, route_phase
 from app.prompts import (
     SYSTEM_FIRST_PROMPT,
     SYSTEM_SECOND_PROMPT,
     SYSTEM_THIRD_PROMPT,
+    SYSTEM_OVERVIEW_PROMPT,
+    SYSTEM_DRILLDOWN_PROMPT,
     ADDITIONAL_SYSTEM_INSTRUCTIONS_PROMPT,
 )
-from anthropic._exceptions import RateLimitError
-from pydantic import BaseModel
-from functools import lru_cache
-import re
-import json
+from pydantic import BaseModel, field_validator
+from functools import lru_cache, partial
+import base64
+import hashlib
 import asyncio
+import os
+import re
+import time
 
 # from app.services.claude_service import ClaudeService
 # from app.core.limiter import limiter
 
-load_dotenv()
-
 router = APIRouter(prefix="/generate", tags=["OpenAI o4-mini"])
 
 # Initialize services
 # claude_service = ClaudeService()
 o4_service = OpenAIo4Service()
 
+# Frame templates for the per-token events
+EXPLANATION_CHUNK_FRAME = ChunkFrame("explanation_chunk")
+MAPPING_CHUNK_FRAME = ChunkFrame("mapping_chunk")
+DIAGRAM_CHUNK_FRAME = ChunkFrame("diagram_chunk")
+
+# "api" fetches the tree and README through the REST API, "tarball" ingests
+# the whole repository (including file contents) from a single archive download
+GITHUB_INGESTION_MODE = os.getenv("GITHUB_INGESTION_MODE", "api")
+
+
+# Repository data is shared by all workers for this long
+GITHUB_DATA_CACHE_TTL = int(os.getenv("GITHUB_DATA_CACHE_TTL", "3600"))
+
+# Fields of the fetched repository data that requests read. Anything else
+# (such as the file contents of a tarball ingestion) is not cached
+GITHUB_DATA_FIELDS = (
+    "default_branch",
+    "commit",
+    "path",
+    "file_tree",
+    "directories",
+    "readme",
+)
+
+
+@lru_cache(maxsize=32)
+def _file_tree_index(file_tree: str, directories: str | None = None) -> FileTreeIndex:
+    return FileTreeIndex(file_tree, directories)
+
+
+# Ingestions in progress are registered in the state store, so concurrent
+# requests on any worker wait for the running one instead of fetching again
+INGEST_CLAIM_TTL = 300
+INGEST_POLL_SECONDS = 0.25
+
+
+# Branches and tags resolved to commits are reused for this long
+REF_CACHE_TTL = 60
+
+COMMIT_SHA_PATTERN = re.compile(r"[0-9a-f]{40}")
+
 
-# cache github data to avoid double API calls from cost and generate
-@lru_cache(maxsize=100)
-def get_cached_github_data(username: str, repo: str, github_pat: str | None = None):
+def _credential_key(github_pat: str | None) -> str:
+    # Never store the PAT itself, only which credential the data was fetched with
+    return hashlib.sha256(github_pat.encode()).hexdigest()[:16] if github_pat else "shared"
+
+
+def _github_data_key(
+    username: str, repo: str, github_pat: str | None, scope: str = ""
+) -> str:
+    return f"{username}/{repo}{scope}:{_credential_key(github_pat)}"
+
+
+def peek_cached_github_data(
+    username: str, repo: str, github_pat: str | None = None
+) -> dict | None:
+    """Returns the cached repository data without fetching it, or None."""
+    return get_state_store().get(
+        "github_data", _github_data_key(username, repo, github_pat)
+    )
+
+
+def _resolve_ref(
+    username: str, repo: str, github_pat: str | None, ref: str | None
+) -> tuple[str, str]:
+    """
+    Resolves the requested ref (the default branch if None) to a commit.
+
+    Returns:
+        tuple[str, str]: The branch, tag or SHA to link to, and the commit SHA
+    """
+    if ref and COMMIT_SHA_PATTERN.fullmatch(ref.lower()):
+        return ref, ref.lower()
+
+    store = get_state_store()
+    cache_key = f"{username}/{repo}@{ref or ''}:{_credential_key(github_pat)}"
+    resolved = store.get("github_refs", cache_key)
+    if resolved is None:
+        service = GitHubService(pat=github_pat)
+        branch = ref or service.get_default_branch(username, repo) or "main"
+        resolved = [branch, service.resolve_commit(username, repo, branch)]
+        store.set("github_refs", cache_key, resolved, ttl=REF_CACHE_TTL)
+    return resolved[0], resolved[1]
+
+
+# cache github data to avoid double API calls from cost and generate, in the
+# shared state store so both requests hit it whichever worker serves them.
+# Blocks while fetching, so call it from a thread in async code.
+def get_cached_github_data(
+    username: str,
+    repo: str,
+    github_pat: str | None = None,
+    path: str = "",
+    ref: str | None = None,
+):
+    if path or ref:
+        # Scoped data is cached per (repository, path, commit), so a moved
+        # branch is fetched again while a pinned commit never is
+        branch, commit = _resolve_ref(username, repo, github_pat, ref)
+        cache_key = _github_data_key(username, repo, github_pat, f"/{path}@{commit}")
+        fetch = partial(
+            _fetch_scoped_github_data, username, repo, github_pat, path, branch, commit
+        )
+    else:
+        cache_key = _github_data_key(username, repo, github_pat)
+        fetch = partial(_fetch_github_data, username, repo, github_pat)
+
+    store = get_state_store()
+    data = store.get("github_data", cache_key)
+    if data is None:
+        claim = f"ingest:{cache_key}"
+        while data is None and not store.add(
+            "jobs", claim, os.getpid(), ttl=INGEST_CLAIM_TTL
+        ):
+            time.sleep(INGEST_POLL_SECONDS)
+            data = store.get("github_data", cache_key)
+        if data is None:
+            try:
+                # Another request may have finished just before the claim
+                data = store.get("github_data", cache_key)
+                if data is None:
+                    data = {
+                        field: value
+                        for field, value in fetch().items()
+                        if field in GITHUB_DATA_FIELDS
+                    }
+                    store.set("github_data", cache_key, data, ttl=GITHUB_DATA_CACHE_TTL)
+            finally:
+                store.delete("jobs", claim)
+    return {
+        **data,
+        "file_tree_index": _file_tree_index(data["file_tree"], data.get("directories")),
+    }
+
+
+def _fetch_github_data(username: str, repo: str, github_pat: str | None = None):
     # Create a new service instance for each call with the appropriate PAT
     current_github_service = GitHubService(pat=github_pat)
 
@@ -38,10 +195,61 @@ def get_cached_github_data(username: str, repo: str, github_pat: str | None = No
     if not default_branch:
         default_branch = "main"  # fallback value
 
-    file_tree = current_github_service.get_github_file_paths_as_list(username, repo)
+    if GITHUB_INGESTION_MODE == "tarball":
+        # One tarball download gives the tree, README and file contents
+        snapshot = current_github_service.get_repository_snapshot(
+            username, repo, default_branch
+        )
+        return {"default_branch": default_branch, **snapshot}
+
+    file_tree, directories = current_github_service.get_file_tree(username, repo)
     readme = current_github_service.get_github_readme(username, repo)
 
-    return {"default_branch": default_branch, "file_tree": file_tree, "readme": readme}
+    return {
+        "default_branch": default_branch,
+        "file_tree": file_tree,
+        "directories": directories,
+        "readme": readme,
+    }
+
+
+def _fetch_scoped_github_data(
+    username: str,
+    repo: str,
+    github_pat: str | None,
+    path: str,
+    branch: str,
+    commit: str,
+):
+    current_github_service = GitHubService(pat=github_pat)
+
+    if path:
+        # Only the subtree is listed, with the README closest to it
+        snapshot = current_github_service.get_subtree_snapshot(
+            username, repo, path, commit
+        )
+    else:
+        file_tree, directories = current_github_service.get_file_tree(
+            username, repo, commit
+        )
+        snapshot = {
+            "commit": commit,
+            "file_tree": file_tree,
+            "directories": directories,
+            "readme": current_github_service.get_nearest_readme(
+                username, repo, "", commit
+            ),
+        }
+    # Click events link to the requested ref rather than the default branch
+    return {"default_branch": branch, "path": path, **snapshot}
+
+
+def normalize_repo_path(path: str) -> str:
+    """Strips surrounding slashes and rejects paths that leave the repository."""
+    path = path.strip().strip("/")
+    if path and any(part in ("", ".", "..") for part in path.split("/")):
+        raise ValueError("path must be a directory inside the repository")
+    return path
 
 
 class ApiRequest(BaseModel):
@@ -50,97 +258,238 @@ class ApiRequest(BaseModel):
     instructions: str = ""
     api_key: str | None = None
     github_pat: str | None = None
+    # Directory to diagram instead of the whole repository, e.g. "services/billing"
+    path: str = ""
+    # Branch, tag or commit to read from, defaults to the default branch
+    ref: str | None = None
+    # Generate a small top-level diagram whose areas are drilled into on demand
+    hierarchical: bool = False
+
+    @field_validator("path")
+    @classmethod
+    def normalize_path(cls, path: str) -> str:
+        return normalize_repo_path(path)
+
+
+def context_token_limit(api_key: str | None) -> int:
+    """Repository context is packed into this many tokens before generation."""
+    return 195000 if api_key else 50000
+
+
+def estimate_generation_cost(
+    file_tree_tokens: float, readme_tokens: float, api_key: str | None = None
+) -> float:
+    """Estimated USD cost of generating a diagram for a repository context."""
+    # Oversized contexts are packed into the limit, so they cost no more than that
+    total = file_tree_tokens + readme_tokens
+    limit = context_token_limit(api_key)
+    if total > limit:
+        file_tree_tokens *= limit / total
+        readme_tokens *= limit / total
+
+    # CLAUDE: Calculate approximate cost
+    # Input cost: $3 per 1M tokens ($0.000003 per token)
+    # Output cost: $15 per 1M tokens ($0.000015 per token)
+    # input_cost = ((file_tree_tokens * 2 + readme_tokens) + 3000) * 0.000003
+    # output_cost = 3500 * 0.000015
+    # estimated_cost = input_cost + output_cost
+
+    # Input cost: $1.1 per 1M tokens ($0.0000011 per token)
+    # Output cost: $4.4 per 1M tokens ($0.0000044 per token)
+    input_cost = ((file_tree_tokens * 2 + readme_tokens) + 3000) * 0.0000011
+    output_cost = (
+        8000 * 0.0000044
+    )  # 8k just based on what I've seen (reasoning is expensive)
+    return input_cost + output_cost
+
+
+def warm_github_data(
+    username: str, repo: str, github_pat: str | None, metadata: dict
+):
+    """
+    Runs the full ingestion after a metadata-only cost estimate, so the
+    generation request finds a warm cache, and feeds the estimator calibration.
+    """
+    try:
+        github_data = get_cached_github_data(username, repo, github_pat)
+        actual_tokens = o4_service.count_tokens(
+            github_data["file_tree"]
+        ) + o4_service.count_tokens(github_data["readme"])
+        record_calibration(metadata, actual_tokens)
+    except Exception as e:
+        print(f"Background ingestion of {username}/{repo} failed: {str(e)}")
 
 
 @router.post("/cost")
 # @limiter.limit("5/minute") # TEMP: disable rate limit for growth??
-async def get_generation_cost(request: Request, body: ApiRequest):
+async def get_generation_cost(
+    request: Request, body: ApiRequest, background_tasks: BackgroundTasks
+):
     try:
-        # Get file tree and README content
-        github_data = get_cached_github_data(body.username, body.repo, body.github_pat)
-        file_tree = github_data["file_tree"]
-        readme = github_data["readme"]
-
-        # Calculate combined token count
-        # file_tree_tokens = claude_service.count_tokens(file_tree)
-        # readme_tokens = claude_service.count_tokens(readme)
-
-        file_tree_tokens = o4_service.count_tokens(file_tree)
-        readme_tokens = o4_service.count_tokens(readme)
-
-        # CLAUDE: Calculate approximate cost
-        # Input cost: $3 per 1M tokens ($0.000003 per token)
-        # Output cost: $15 per 1M tokens ($0.000015 per token)
-        # input_cost = ((file_tree_tokens * 2 + readme_tokens) + 3000) * 0.000003
-        # output_cost = 3500 * 0.000015
-        # estimated_cost = input_cost + output_cost
-
-        # Input cost: $1.1 per 1M tokens ($0.0000011 per token)
-        # Output cost: $4.4 per 1M tokens ($0.0000044 per token)
-        input_cost = ((file_tree_tokens * 2 + readme_tokens) + 3000) * 0.0000011
-        output_cost = (
-            8000 * 0.0000044
-        )  # 8k just based on what I've seen (reasoning is expensive)
-        estimated_cost = input_cost + output_cost
-
-        # Format as currency string
-        cost_string = f"${estimated_cost:.2f} USD"
-        return {"cost": cost_string}
+        # Scoped requests only ingest the subtree, which is cheap enough to count exactly
+        if body.path or body.ref:
+            github_data = await asyncio.to_thread(
+                get_cached_github_data,
+                body.username,
+                body.repo,
+                body.github_pat,
+                body.path,
+                body.ref,
+            )
+        else:
+            # Exact token counts when the repository was already ingested
+            github_data = await asyncio.to_thread(
+                peek_cached_github_data, body.username, body.repo, body.github_pat
+            )
+        if github_data is not None:
+            file_tree = github_data["file_tree"]
+            if body.instructions:
+                file_tree = await run_cpu(
+                    "prune_tree",
+                    prune_file_tree,
+                    file_tree,
+                    body.instructions,
+                    size=len(file_tree),
+                )
+            readme = github_data["readme"]
+            file_tree_tokens = await run_cpu(
+                "count_tokens", count_tokens, file_tree, size=len(file_tree)
+            )
+            readme_tokens = await run_cpu(
+                "count_tokens", count_tokens, readme, size=len(readme)
+            )
+            estimated_cost = estimate_generation_cost(
+                file_tree_tokens, readme_tokens, body.api_key
+            )
+            return {"cost": f"${estimated_cost:.2f} USD"}
+
+        # Otherwise estimate from metadata in one GitHub call, and ingest the
+        # repository in the background for the generation request that follows
+        metadata = await asyncio.to_thread(
+            GitHubService(pat=body.github_pat).get_repository_metadata,
+            body.username,
+            body.repo,
+        )
+        (file_tree_tokens, readme_tokens), low, high = calibrated_estimate(metadata)
+        estimated_cost = estimate_generation_cost(
+            file_tree_tokens, readme_tokens, body.api_key
+        )
+        low_cost = estimate_generation_cost(
+            file_tree_tokens * low, readme_tokens * low, body.api_key
+        )
+        high_cost = estimate_generation_cost(
+            file_tree_tokens * high, readme_tokens * high, body.api_key
+        )
+        background_tasks.add_task(
+            warm_github_data, body.username, body.repo, body.github_pat, metadata
+        )
+        return {
+            "cost": f"${estimated_cost:.2f} USD",
+            "cost_range": f"${low_cost:.2f}-${high_cost:.2f} USD",
+            "estimated": True,
+        }
     except Exception as e:
         return {"error": str(e)}
 
 
-def process_click_events(diagram: str, username: str, repo: str, branch: str) -> str:
+@router.get("/cached")
+async def get_cached_diagram(
+    request: Request, username: str, repo: str, since: float | None = None
+):
+    # Latest result for a repository, including refreshes from push webhooks.
+    # The frontend passes when its own copy was saved (Unix seconds) and only
+    # gets a body when the backend has something newer.
+    record = await asyncio.to_thread(diagram_store.get, username, repo)
+    if record is None:
+        return {"error": "No diagram has been generated for this repository"}
+    if since is not None and record["updated_at"] <= since:
+        return Response(status_code=304)
+    artifacts = await run_cpu(
+        "encode_artifacts",
+        encode_artifacts_base64,
+        record["diagram"],
+        record["explanation"],
+        record["mapping"],
+        size=len(record["diagram"])
+        + len(record["explanation"])
+        + len(record["mapping"]),
+    )
+    return {
+        "diagram": record["diagram"],
+        "explanation": record["explanation"],
+        "mapping": record["mapping"],
+        "artifacts": artifacts,
+        "commit": record["commit"],
+        "updated_at": record["updated_at"],
+    }
+
+
+@router.get("/showcase/{username}/{repo}")
+async def get_showcase_diagram(request: Request, username: str, repo: str):
+    # Precomputed bytes from memory; browsers and CDNs revalidate with the ETag
+    entry = showcase_store.get(username, repo)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Not a showcase repository")
+    headers = {
+        "ETag": entry.etag,
+        "Cache-Control": "public, max-age=300, stale-while-revalidate=86400",
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or entry.etag in (
+        tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+    ):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+def estimate_phase_tokens(context_tokens: int) -> list[int]:
     """
-    Process click events in Mermaid diagram to include full GitHub URLs.
-    Detects if path is file or directory and uses appropriate URL format.
+    Estimates the tokens (input + output) each generation phase spends for a
+    repository context of `context_tokens`. Every phase sends the context
+    again; the overheads cover prompts, earlier phases' output and the
+    phase's own output, with phase 3 writing the longest response.
     """
+    return [context_tokens + overhead for overhead in (4000, 6000, 14000)]
+
+
+# Stages handed to the CPU executor; module-level so process pools can pickle them
+def pack_context(file_tree: str, readme: str, token_limit: int):
+    return pack_repository_context(file_tree, readme, token_limit, get_encoding())
+
+
+def finalize_diagram(diagram: str) -> tuple[str, list[str], list[str]]:
+    """Repairs a generated diagram and returns it with the fixes and remaining errors."""
+    diagram, fixes = repair_mermaid(diagram)
+    return diagram, fixes, validate_mermaid(diagram)
+
+
+def encode_artifacts_base64(diagram: str, explanation: str, mapping: str) -> str:
+    return base64.b64encode(encode_artifacts(diagram, explanation, mapping)).decode(
+        "ascii"
+    )
 
-    def replace_path(match):
-        # Extract the path from the click event
-        raw_path = match.group(2).strip("\"'")
-        
-        # Remove fragment if present (e.g., path/to/file.py#functionName)
-        path_without_fragment = raw_path.split("#")[0]
-
-        # Determine if path is likely a file (has extension) or directory
-        is_file = "." in path_without_fragment.split("/")[-1]
-
-        # Construct GitHub URL
-        base_url = f"https://github.com/{username}/{repo}"
-        path_type = "blob" if is_file else "tree"
-        full_url = f"{base_url}/{path_type}/{branch}/{path_without_fragment}"
-
-        # Return the full click event with the new URL, keeping original raw_path for the click parameter if needed by Mermaid/JS
-        # For now, the instruction implies the LLM generates the click unique_id and the path parameter.
-        # The path parameter itself should be the one that can include #fragment if the LLM generates it that way.
-        # However, the URL formed for GitHub navigation must NOT include the #fragment.
-        # The prompt for SYSTEM_THIRD_PROMPT indicates click events like: `click NodeID_FunctionX "path/to/file.ext#FunctionX"`
-        # So, the raw_path (which includes #fragment) should be used in the click parameter passed to Mermaid.
-        # The modification here is only for the URL generation part.
-        # The problem statement: "URL should always point to the file itself, not a fragment"
-        # "if path is src/utils/api.ts#fetchData, the generated GitHub URL should still be for src/utils/api.ts."
-        # This means the `full_url` should use `path_without_fragment`.
-        # The actual click string in mermaid should still use `raw_path` if that's what the LLM is told to make.
-        # The current regex `r'click ([^\s"]+)\s+"([^"]+)"'` captures the node ID and the path argument.
-        # The `SYSTEM_THIRD_PROMPT` asks the LLM to generate `click NodeID "path/to/file#FuncName"`.
-        # So `match.group(2)` is `path/to/file#FuncName`. This `raw_path` is used as the click parameter.
-        # The `full_url` used for actual navigation is what we are fixing.
-        # The line `return f'click {match.group(1)} "{full_url}"'` was in the original code.
-        # This would change the click parameter in Mermaid to not have the fragment.
-        # If the fragment is needed for client-side JS later, this would be wrong.
-        # Re-reading: "The URL should always point to the file itself... For example, if path is src/utils/api.ts#fetchData, the generated GitHub URL should still be for src/utils/api.ts."
-        # This implies that the string that `process_click_events` *outputs* should have the full_url (without fragment) as the click argument.
-        # This seems correct, as the purpose of this function is to make GitHub clickable links.
-        # Client-side JS that might use the fragment would have to be handled differently if it relied on this specific click parameter.
-        # For now, the goal is to make the GitHub link correct.
-
-        return f'click {match.group(1)} "{full_url}"'
-        return f'click {match.group(1)} "{full_url}"'
-
-    # Match click events: click ComponentName "path/to/something"
-    click_pattern = r'click ([^\s"]+)\s+"([^"]+)"'
-    return re.sub(click_pattern, replace_path, diagram)
+
+async def record_output(phase: str, context_tokens: int, output: str) -> int:
+    """Counts a phase's output tokens and feeds them to the output cap statistics."""
+    output_tokens = await run_cpu("count_tokens", count_tokens, output, size=len(output))
+    record_phase_output(phase, context_tokens, output_tokens)
+    return output_tokens
+
+
+def process_click_events(
+    diagram: str,
+    username: str,
+    repo: str,
+    branch: str,
+    file_tree_index: FileTreeIndex | None = None,
+) -> str:
+    """
+    Process click events in Mermaid diagram to include full GitHub URLs.
+    Resolves each path against the file tree index when given, so files and
+    directories get the right URL format even without extensions.
+    """
+    rewriter = ClickEventRewriter(username, repo, branch, file_tree_index)
+    return rewriter.feed(diagram) + rewriter.flush()
 
 
 @router.post("/stream")
@@ -150,38 +499,75 @@ async def generate_stream(request: Request, body: ApiRequest):
         if len(body.instructions) > 1000:
             return {"error": "Instructions exceed maximum length of 1000 characters"}
 
-        if body.repo in [
-            "fastapi",
-            "streamlit",
-            "flask",
-            "api-analytics",
-            "monkeytype",
-        ]:
+        if is_showcase_repo(body.username, body.repo):
             return {"error": "Example repos cannot be regenerated"}
 
         async def event_generator():
+            reservation = None
+            phases_started = 0
+            phase_costs = []
             try:
                 # Get cached github data
-                github_data = get_cached_github_data(
-                    body.username, body.repo, body.github_pat
-                )
+                with profiling.span("github_data"):
+                    github_data = await asyncio.to_thread(
+                        get_cached_github_data,
+                        body.username,
+                        body.repo,
+                        body.github_pat,
+                        body.path,
+                        body.ref,
+                    )
                 default_branch = github_data["default_branch"]
                 file_tree = github_data["file_tree"]
                 readme = github_data["readme"]
 
                 # Send initial status
-                yield f"data: {json.dumps({'status': 'started', 'message': 'Starting generation process...'})}\n\n"
+                yield sse_event({'status': 'started', 'message': 'Starting generation process...'})
                 await asyncio.sleep(0.1)
 
+                # Focused instructions only need the matching part of the tree
+                if body.instructions:
+                    file_tree = await run_cpu(
+                        "prune_tree",
+                        prune_file_tree,
+                        file_tree,
+                        body.instructions,
+                        size=len(file_tree),
+                    )
+
                 # Token count check
                 combined_content = f"{file_tree}\n{readme}"
-                token_count = o4_service.count_tokens(combined_content)
+                token_count = await run_cpu(
+                    "count_tokens",
+                    count_tokens,
+                    combined_content,
+                    size=len(combined_content),
+                )
 
-                if 50000 < token_count < 195000 and not body.api_key:
-                    yield f"data: {json.dumps({'error': f'File tree and README combined exceeds token limit (50,000). Current size: {token_count} tokens. This GitHub repository is too large for my wallet, but you can continue by providing your own OpenAI API key.'})}\n\n"
-                    return
-                elif token_count > 195000:
-                    yield f"data: {json.dumps({'error': f'Repository is too large (>195k tokens) for analysis. OpenAI o4-mini\'s max context length is 200k tokens. Current size: {token_count} tokens.'})}\n\n"
+                # Oversized inputs are packed into the limit instead of rejected
+                token_limit = context_token_limit(body.api_key)
+                if token_count > token_limit:
+                    file_tree, readme, packed_count = await run_cpu(
+                        "pack_context",
+                        pack_context,
+                        file_tree,
+                        readme,
+                        token_limit,
+                        size=len(combined_content),
+                    )
+                    print(
+                        f"Packed {body.username}/{body.repo} from {token_count} to {packed_count} tokens"
+                    )
+                    token_count = packed_count
+
+                # Charge the estimated spend up front; unstarted phases are refunded
+                phase_costs = estimate_phase_tokens(token_count)
+                try:
+                    reservation = await asyncio.to_thread(
+                        reserve_tokens, request, body.api_key, sum(phase_costs)
+                    )
+                except BudgetExceededError as e:
+                    yield sse_event({'error': str(e), 'retry_after': round(e.retry_after)})
                     return
 
                 # Prepare prompts
@@ -198,90 +584,365 @@ async def generate_stream(request: Request, body: ApiRequest):
                         + "\n"
                         + ADDITIONAL_SYSTEM_INSTRUCTIONS_PROMPT
                     )
+                if body.hierarchical:
+                    third_system_prompt = (
+                        third_system_prompt + "\n" + SYSTEM_OVERVIEW_PROMPT
+                    )
 
                 # Phase 1: Get explanation
-                yield f"data: {json.dumps({'status': 'explanation_sent', 'message': 'Sending explanation request to o4-mini...'})}\n\n"
+                phases_started = 1
+                yield sse_event({'status': 'explanation_sent', 'message': 'Sending explanation request to o4-mini...'})
                 await asyncio.sleep(0.1)
-                yield f"data: {json.dumps({'status': 'explanation', 'message': 'Analyzing repository structure...'})}\n\n"
+                yield sse_event({'status': 'explanation', 'message': 'Analyzing repository structure...'})
                 explanation = ""
-                async for chunk in o4_service.call_o4_api_stream(
-                    system_prompt=first_system_prompt,
-                    data={
-                        "file_tree": file_tree,
-                        "readme": readme,
-                        "instructions": body.instructions,
-                    },
-                    api_key=body.api_key,
-                ):
-                    explanation += chunk
-                    yield f"data: {json.dumps({'status': 'explanation_chunk', 'chunk': chunk})}\n\n"
+                # Small repositories go to faster models, every phase gets an
+                # output cap fitted to what similar repositories produced
+                route = route_phase("explanation", token_count)
+                with profiling.span("explanation_phase", model=route.model, max_tokens=route.max_tokens):
+                    async for chunk in o4_service.call_o4_api_stream(
+                        system_prompt=first_system_prompt,
+                        data={
+                            "file_tree": file_tree,
+                            "readme": readme,
+                            "instructions": body.instructions,
+                        },
+                        api_key=body.api_key,
+                        model=route.model,
+                        max_tokens=route.max_tokens,
+                    ):
+                        if not explanation:
+                            profiling.mark("explanation_first_token")
+                        explanation += chunk
+                        yield EXPLANATION_CHUNK_FRAME(chunk)
 
                 if "BAD_INSTRUCTIONS" in explanation:
-                    yield f"data: {json.dumps({'error': 'Invalid or unclear instructions provided'})}\n\n"
+                    yield sse_event({'error': 'Invalid or unclear instructions provided'})
                     return
+                explanation_tokens = await record_output(
+                    "explanation", token_count, explanation
+                )
 
                 # Phase 2: Get component mapping
-                yield f"data: {json.dumps({'status': 'mapping_sent', 'message': 'Sending component mapping request to o4-mini...'})}\n\n"
+                phases_started = 2
+                yield sse_event({'status': 'mapping_sent', 'message': 'Sending component mapping request to o4-mini...'})
                 await asyncio.sleep(0.1)
-                yield f"data: {json.dumps({'status': 'mapping', 'message': 'Creating component mapping...'})}\n\n"
+                yield sse_event({'status': 'mapping', 'message': 'Creating component mapping...'})
                 full_second_response = ""
-                async for chunk in o4_service.call_o4_api_stream(
-                    system_prompt=SYSTEM_SECOND_PROMPT,
-                    data={"explanation": explanation, "file_tree": file_tree},
-                    api_key=body.api_key,
-                ):
-                    full_second_response += chunk
-                    yield f"data: {json.dumps({'status': 'mapping_chunk', 'chunk': chunk})}\n\n"
-
-                # i dont think i need this anymore? but keep it here for now
-                # Extract component mapping
-                start_tag = "<component_mapping>"
-                end_tag = "</component_mapping>"
-                component_mapping_text = full_second_response[
-                    full_second_response.find(start_tag) : full_second_response.find(
-                        end_tag
+                # Components are parsed and checked against the tree as lines arrive
+                mapping_parser = MappingParser(github_data["file_tree_index"], body.repo)
+                route = route_phase("mapping", token_count, explanation_tokens)
+                with profiling.span("mapping_phase", model=route.model, max_tokens=route.max_tokens):
+                    async for chunk in o4_service.call_o4_api_stream(
+                        system_prompt=SYSTEM_SECOND_PROMPT,
+                        data={"explanation": explanation, "file_tree": file_tree},
+                        api_key=body.api_key,
+                        model=route.model,
+                        max_tokens=route.max_tokens,
+                    ):
+                        if not full_second_response:
+                            profiling.mark("mapping_first_token")
+                        full_second_response += chunk
+                        mapping_parser.feed(chunk)
+                        yield MAPPING_CHUNK_FRAME(chunk)
+                mapping_parser.flush()
+                if mapping_parser.rejected:
+                    print(
+                        f"Dropped {mapping_parser.rejected} unresolvable components for {body.username}/{body.repo}"
                     )
-                ]
+                component_mapping_text = mapping_parser.text()
+                mapping_tokens = await record_output(
+                    "mapping", token_count, full_second_response
+                )
 
                 # Phase 3: Generate Mermaid diagram
-                yield f"data: {json.dumps({'status': 'diagram_sent', 'message': 'Sending diagram generation request to o4-mini...'})}\n\n"
+                phases_started = 3
+                yield sse_event({'status': 'diagram_sent', 'message': 'Sending diagram generation request to o4-mini...'})
                 await asyncio.sleep(0.1)
-                yield f"data: {json.dumps({'status': 'diagram', 'message': 'Generating diagram...'})}\n\n"
+                yield sse_event({'status': 'diagram', 'message': 'Generating diagram...'})
                 mermaid_code = ""
+                # Click paths are resolved line by line while the diagram streams in
+                click_rewriter = ClickEventRewriter(
+                    body.username,
+                    body.repo,
+                    default_branch,
+                    github_data["file_tree_index"],
+                )
+                processed_diagram = ""
+                # Overviews are much shorter than full diagrams, their caps are kept apart
+                diagram_phase = "overview" if body.hierarchical else "diagram"
+                route = route_phase(
+                    diagram_phase, token_count, explanation_tokens + mapping_tokens
+                )
+                with profiling.span("diagram_phase", model=route.model, max_tokens=route.max_tokens):
+                    async for chunk in o4_service.call_o4_api_stream(
+                        system_prompt=third_system_prompt,
+                        data={
+                            "explanation": explanation,
+                            "component_mapping": component_mapping_text,
+                            "file_tree": file_tree, # Added for context
+                            "readme": readme, # Added for context
+                            "instructions": body.instructions,
+                        },
+                        api_key=body.api_key,
+                        model=route.model,
+                        max_tokens=route.max_tokens,
+                    ):
+                        if not mermaid_code:
+                            profiling.mark("diagram_first_token")
+                        mermaid_code += chunk
+                        processed_diagram += click_rewriter.feed(chunk)
+                        yield DIAGRAM_CHUNK_FRAME(chunk)
+                processed_diagram += click_rewriter.flush()
+
+                # Process final diagram
+                if "BAD_INSTRUCTIONS" in mermaid_code:
+                    yield sse_event({'error': 'Invalid or unclear instructions provided'})
+                    return
+                await record_output(diagram_phase, token_count, mermaid_code)
+
+                # Fix common LLM syntax mistakes locally instead of sending broken Mermaid
+                processed_diagram, fixes, remaining_errors = await run_cpu(
+                    "postprocess_diagram",
+                    finalize_diagram,
+                    processed_diagram,
+                    size=len(processed_diagram),
+                )
+                if fixes:
+                    print(f"Repaired diagram for {body.username}/{body.repo}: {fixes}")
+                if remaining_errors:
+                    print(f"Diagram still has errors after repair: {remaining_errors}")
+
+                # Send final result
+                # Compressed copy of all three results for storage without length limits
+                artifacts = await run_cpu(
+                    "encode_artifacts",
+                    encode_artifacts_base64,
+                    processed_diagram,
+                    explanation,
+                    component_mapping_text,
+                    size=len(processed_diagram)
+                    + len(explanation)
+                    + len(component_mapping_text),
+                )
+
+                completion = {
+                    "status": "complete",
+                    "diagram": processed_diagram,
+                    "explanation": explanation,
+                    "mapping": component_mapping_text,
+                    "artifacts": artifacts,
+                }
+
+                if body.hierarchical:
+                    # Drill-downs are generated later from this context
+                    areas = overview_areas(
+                        processed_diagram, body.username, body.repo, default_branch
+                    )
+                    await asyncio.to_thread(
+                        overview_store.put,
+                        body.username,
+                        body.repo,
+                        generation_scope(body.path, body.ref),
+                        branch=default_branch,
+                        commit=github_data.get("commit"),
+                        file_tree=github_data["file_tree"],
+                        directories=github_data.get("directories"),
+                        explanation=explanation,
+                        mapping=component_mapping_text,
+                        instructions=body.instructions,
+                        diagram=processed_diagram,
+                        overview_id=overview_id(processed_diagram),
+                        areas=areas,
+                    )
+                    completion["areas"] = [
+                        {"id": area_id, "label": area["label"]}
+                        for area_id, area in areas.items()
+                    ]
+
+                # Kept so push webhooks can refresh the diagram incrementally.
+                # Scoped and overview diagrams are not, they would replace the
+                # whole-repository one
+                if not (body.path or body.ref or body.hierarchical):
+                    await asyncio.to_thread(
+                        diagram_store.put,
+                        body.username,
+                        body.repo,
+                        branch=default_branch,
+                        commit=github_data.get("commit"),
+                        file_tree=github_data["file_tree"],
+                        explanation=explanation,
+                        mapping=component_mapping_text,
+                        instructions=body.instructions,
+                        diagram=processed_diagram,
+                    )
+
+                yield sse_event(completion)
+
+            except Exception as e:
+                yield sse_event({'error': str(e)})
+            finally:
+                # Early returns, errors and cancelled streams skip later phases
+                if reservation is not None:
+                    reservation.refund(sum(phase_costs[phases_started:]))
+
+        headers = {
+            "X-Accel-Buffering": "no",  # Hint to Nginx
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        }
+        stream = event_generator()
+        # Operators can profile a single request, see app.core.profiling
+        profile = profiling.start_profile(
+            request, "generate", repo=f"{body.username}/{body.repo}"
+        )
+        if profile is not None:
+            stream = profiling.profiled_stream(profile, stream)
+            headers["X-Profile-Id"] = profile.request_id
+
+        return StreamingResponse(
+            stream,
+            media_type="text/event-stream",
+            headers=headers,
+        )
+    except Exception as e:
+        return {"error": str(e)}
+
+
+class DrilldownRequest(BaseModel):
+    username: str
+    repo: str
+    # Subgraph ID from the "areas" of a hierarchical generation
+    area: str
+    path: str = ""
+    ref: str | None = None
+    api_key: str | None = None
+
+    @field_validator("path")
+    @classmethod
+    def normalize_path(cls, path: str) -> str:
+        return normalize_repo_path(path)
+
+
+@router.post("/drilldown")
+async def generate_drilldown(request: Request, body: DrilldownRequest):
+    try:
+        scope = generation_scope(body.path, body.ref)
+        overview = await asyncio.to_thread(
+            overview_store.get, body.username, body.repo, scope
+        )
+        if overview is None:
+            return {"error": "No hierarchical diagram has been generated for this repository"}
+        area = overview["areas"].get(body.area)
+        if area is None:
+            return {"error": f"Unknown area '{body.area}'"}
+        cache_scope = f"{scope}#{overview['overview_id']}/{body.area}"
+
+        async def event_generator():
+            # Each area is only generated once per overview
+            cached = await asyncio.to_thread(
+                drilldown_store.get, body.username, body.repo, cache_scope
+            )
+            if cached is not None:
+                yield sse_event(
+                    {"status": "complete", "area": body.area, "diagram": cached["diagram"]}
+                )
+                return
+
+            reservation = None
+            cost = 0
+            started = False
+            try:
+                context = scope_context(overview, area["paths"])
+                combined_content = "\n".join(context.values())
+                token_count = await run_cpu(
+                    "count_tokens",
+                    count_tokens,
+                    combined_content,
+                    size=len(combined_content),
+                )
+                token_limit = context_token_limit(body.api_key)
+                if token_count > token_limit:
+                    context["file_tree"], _, token_count = await run_cpu(
+                        "pack_context",
+                        pack_context,
+                        context["file_tree"],
+                        "",
+                        token_limit,
+                        size=len(combined_content),
+                    )
+
+                # Only the diagram phase runs for a drill-down
+                cost = estimate_phase_tokens(token_count)[2]
+                try:
+                    reservation = await asyncio.to_thread(
+                        reserve_tokens, request, body.api_key, cost
+                    )
+                except BudgetExceededError as e:
+                    yield sse_event({'error': str(e), 'retry_after': round(e.retry_after)})
+                    return
+
+                system_prompt = SYSTEM_THIRD_PROMPT
+                if overview["instructions"]:
+                    system_prompt += "\n" + ADDITIONAL_SYSTEM_INSTRUCTIONS_PROMPT
+                system_prompt += "\n" + SYSTEM_DRILLDOWN_PROMPT
+
+                yield sse_event({'status': 'diagram', 'message': f"Generating diagram of {area['label']}..."})
+                mermaid_code = ""
+                click_rewriter = ClickEventRewriter(
+                    body.username,
+                    body.repo,
+                    overview["branch"],
+                    _file_tree_index(overview["file_tree"], overview.get("directories")),
+                )
+                processed_diagram = ""
+                route = route_phase("drilldown", token_count)
+                started = True
                 async for chunk in o4_service.call_o4_api_stream(
-                    system_prompt=third_system_prompt,
+                    system_prompt=system_prompt,
                     data={
-                        "explanation": explanation,
-                        "component_mapping": component_mapping_text,
-                        "file_tree": file_tree, # Added for context
-                        "readme": readme, # Added for context
-                        "instructions": body.instructions,
+                        **context,
+                        "area": describe_area(area),
+                        "instructions": overview["instructions"],
                     },
                     api_key=body.api_key,
+                    model=route.model,
+                    max_tokens=route.max_tokens,
                 ):
                     mermaid_code += chunk
-                    yield f"data: {json.dumps({'status': 'diagram_chunk', 'chunk': chunk})}\n\n"
+                    processed_diagram += click_rewriter.feed(chunk)
+                    yield DIAGRAM_CHUNK_FRAME(chunk)
+                processed_diagram += click_rewriter.flush()
 
-                # Process final diagram
-                mermaid_code = mermaid_code.replace("```mermaid", "").replace("```", "")
                 if "BAD_INSTRUCTIONS" in mermaid_code:
-                    yield f"data: {json.dumps({'error': 'Invalid or unclear instructions provided'})}\n\n"
+                    yield sse_event({'error': 'Invalid or unclear instructions provided'})
                     return
+                await record_output("drilldown", token_count, mermaid_code)
 
-                processed_diagram = process_click_events(
-                    mermaid_code, body.username, body.repo, default_branch
+                processed_diagram, fixes, _ = await run_cpu(
+                    "postprocess_diagram",
+                    finalize_diagram,
+                    processed_diagram,
+                    size=len(processed_diagram),
+                )
+                if fixes:
+                    print(f"Repaired drill-down {body.area} of {body.username}/{body.repo}: {fixes}")
+
+                await asyncio.to_thread(
+                    drilldown_store.put,
+                    body.username,
+                    body.repo,
+                    cache_scope,
+                    diagram=processed_diagram,
+                )
+                yield sse_event(
+                    {"status": "complete", "area": body.area, "diagram": processed_diagram}
                 )
-
-                # Send final result
-                yield f"data: {json.dumps({
-                    'status': 'complete',
-                    'diagram': processed_diagram,
-                    'explanation': explanation,
-                    'mapping': component_mapping_text
-                })}\n\n"
-
             except Exception as e:
-                yield f"data: {json.dumps({'error': str(e)})}\n\n"
+                yield sse_event({'error': str(e)})
+            finally:
+                # Nothing was spent if the diagram request never went out
+                if reservation is not None and not started:
+                    reservation.refund(cost)
 
         return StreamingResponse(
             event_generator(),
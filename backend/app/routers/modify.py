@@ -1,16 +1,17 @@
-from fastapi import APIRouter, Request, HTTPException
-from dotenv import load_dotenv
+from fastapi import APIRouter, Request, Response, HTTPException
 
 # from app.services.claude_service import ClaudeService
 # from app.core.limiter import limiter
-from anthropic._exceptions import RateLimitError
 from app.prompts import SYSTEM_MODIFY_PROMPT
 from pydantic import BaseModel
 from app.services.o1_mini_openai_service import OpenAIO1Service
+from app.utils.mermaid import repair_mermaid
+from app.core.cost_limiter import BudgetExceededError, reserve_tokens
+from app.core import profiling
+from app.services.showcase import is_showcase_repo
+import asyncio
 
 
-load_dotenv()
-
 router = APIRouter(prefix="/modify", tags=["Claude"])
 
 # Initialize services
@@ -31,7 +32,15 @@ class ModifyRequest(BaseModel):
 
 @router.post("")
 # @limiter.limit("2/minute;10/day")
-async def modify(request: Request, body: ModifyRequest):
+async def modify(request: Request, response: Response, body: ModifyRequest):
+    reservation = None
+    # Operators can profile a single request, see app.core.profiling
+    profile = profiling.start_profile(
+        request, "modify", repo=f"{body.username}/{body.repo}"
+    )
+    # Also sent on errors, whose responses do not carry `response`'s headers
+    profile_headers = {"X-Profile-Id": profile.request_id} if profile is not None else {}
+    response.headers.update(profile_headers)
     try:
         # Check instructions length
         if not body.instructions or not body.current_diagram:
@@ -41,15 +50,31 @@ async def modify(request: Request, body: ModifyRequest):
         ):  # just being safe
             return {"error": "Instructions exceed maximum length of 1000 characters"}
 
-        if body.repo in [
-            "fastapi",
-            "streamlit",
-            "flask",
-            "api-analytics",
-            "monkeytype",
-        ]:
+        if is_showcase_repo(body.username, body.repo):
             return {"error": "Example repos cannot be modified"}
 
+        # Input plus a full rewritten diagram as output
+        estimated_tokens = (
+            o1_service.count_tokens(
+                body.instructions + body.explanation + body.current_diagram
+            )
+            + o1_service.count_tokens(body.current_diagram)
+            + 2000
+        )
+        try:
+            reservation = await asyncio.to_thread(
+                reserve_tokens, request, None, estimated_tokens
+            )
+        except BudgetExceededError as e:
+            raise HTTPException(
+                status_code=429,
+                detail=str(e),
+                headers={
+                    "Retry-After": str(max(1, round(e.retry_after))),
+                    **profile_headers,
+                },
+            )
+
         # modified_mermaid_code = claude_service.call_claude_api(
         #     system_prompt=SYSTEM_MODIFY_PROMPT,
         #     data={
@@ -59,24 +84,42 @@ async def modify(request: Request, body: ModifyRequest):
         #     },
         # )
 
-        modified_mermaid_code = o1_service.call_o1_api(
-            system_prompt=SYSTEM_MODIFY_PROMPT,
-            data={
-                "instructions": body.instructions,
-                "explanation": body.explanation,
-                "diagram": body.current_diagram,
-            },
-        )
+        with profiling.span("modify_call"):
+            modified_mermaid_code = o1_service.call_o1_api(
+                system_prompt=SYSTEM_MODIFY_PROMPT,
+                data={
+                    "instructions": body.instructions,
+                    "explanation": body.explanation,
+                    "diagram": body.current_diagram,
+                },
+            )
 
         # Check for BAD_INSTRUCTIONS response
         if "BAD_INSTRUCTIONS" in modified_mermaid_code:
             return {"error": "Invalid or unclear instructions provided"}
 
+        modified_mermaid_code, fixes = repair_mermaid(modified_mermaid_code)
+        if fixes:
+            print(f"Repaired modified diagram for {body.username}/{body.repo}: {fixes}")
+
         return {"diagram": modified_mermaid_code}
-    except RateLimitError as e:
-        raise HTTPException(
-            status_code=429,
-            detail="Service is currently experiencing high demand. Please try again in a few minutes.",
-        )
+    except HTTPException:
+        raise
     except Exception as e:
+        # Nothing was generated, so the budget goes back
+        if reservation is not None:
+            reservation.refund(estimated_tokens)
+
+        # Imported here so the SDK only loads once a request has used it
+        from openai import RateLimitError
+
+        if isinstance(e, RateLimitError):
+            raise HTTPException(
+                status_code=429,
+                detail="Service is currently experiencing high demand. Please try again in a few minutes.",
+                headers=profile_headers or None,
+            )
         return {"error": str(e)}
+    finally:
+        if profile is not None:
+            profile.finish()
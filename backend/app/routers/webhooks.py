@@ -0,0 +1,58 @@
+from fastapi import APIRouter, BackgroundTasks, Request, HTTPException
+from app.services.diagram_refresh import refresh_diagram, should_refresh
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+
+router = APIRouter(prefix="/webhooks", tags=["GitHub webhooks"])
+
+# Secret configured on the GitHub webhook, used to verify X-Hub-Signature-256
+GITHUB_WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET")
+
+
+def verify_signature(body: bytes, signature: str | None, secret: str) -> bool:
+    """Checks a `sha256=<hex>` signature of the raw request body."""
+    if not signature or not signature.startswith("sha256="):
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(signature.removeprefix("sha256="), expected)
+
+
+async def _run_refresh(username: str, repo: str, payload: dict):
+    try:
+        result = await refresh_diagram(username, repo, payload)
+        print(f"Webhook refresh of {username}/{repo}: {result}")
+    except Exception as e:
+        print(f"Webhook refresh of {username}/{repo} failed: {str(e)}")
+
+
+@router.post("/github")
+async def github_webhook(request: Request, background_tasks: BackgroundTasks):
+    if not GITHUB_WEBHOOK_SECRET:
+        raise HTTPException(status_code=503, detail="Webhooks are not configured")
+
+    body = await request.body()
+    if not verify_signature(
+        body, request.headers.get("X-Hub-Signature-256"), GITHUB_WEBHOOK_SECRET
+    ):
+        raise HTTPException(status_code=401, detail="Invalid signature")
+
+    event = request.headers.get("X-GitHub-Event")
+    if event == "ping":
+        return {"message": "pong"}
+    if event != "push":
+        return {"status": "ignored", "reason": f"Unhandled event {event}"}
+
+    payload = json.loads(body)
+    refresh, reason = await asyncio.to_thread(should_refresh, payload)
+    if not refresh:
+        return {"status": "skipped", "reason": reason}
+
+    repository = payload["repository"]
+    owner = repository["owner"]
+    username = owner.get("login") or owner.get("name")
+    # GitHub expects a quick response, so the refresh runs after replying
+    background_tasks.add_task(_run_refresh, username, repository["name"], payload)
+    return {"status": "scheduled"}
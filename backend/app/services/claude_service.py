@@ -1,9 +1,6 @@
 from anthropic import Anthropic
-from dotenv import load_dotenv
 from app.utils.format_message import format_user_message
 
-load_dotenv()
-
 
 class ClaudeService:
     def __init__(self):
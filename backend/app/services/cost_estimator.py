@@ -0,0 +1,90 @@
+from app.core.state_store import get_state_store
+import math
+
+# Heuristics turning repository metadata into a token count for the file
+# tree and README. The calibration below corrects their bias per source.
+TOKENS_PER_TREE_ENTRY = 10
+AVG_CODE_FILE_BYTES = 6000
+FILES_PER_UNEXPLORED_DIR = 8
+README_BYTES_PER_TOKEN = 4
+DEFAULT_README_TOKENS = 1500
+# Share of the REST "size" (whole repository on disk, history included) that is code
+REST_CODE_SHARE = 0.25
+
+# Until enough full ingestions were observed, assume estimates are within
+# roughly a factor of two
+DEFAULT_LOG_ERROR_STD = 0.7
+MIN_CALIBRATION_SAMPLES = 5
+# z-score of the reported range, about a 90% interval
+RANGE_Z = 1.64
+
+NAMESPACE = "cost_calibration"
+
+
+def estimate_context_tokens(metadata: dict) -> tuple[int, int]:
+    """
+    Estimates file tree and README tokens from `GitHubService.get_repository_metadata`
+    without any calibration applied.
+
+    Returns:
+        tuple[int, int]: Estimated file tree tokens and README tokens
+    """
+    if metadata["source"] == "graphql":
+        files = metadata["files_seen"] + metadata["dirs_unexplored"] * FILES_PER_UNEXPLORED_DIR
+        if metadata["code_bytes"]:
+            files = max(files, metadata["code_bytes"] / AVG_CODE_FILE_BYTES)
+    else:
+        disk_bytes = (metadata["disk_usage_kb"] or 0) * 1024
+        files = disk_bytes * REST_CODE_SHARE / AVG_CODE_FILE_BYTES
+
+    if metadata["readme_bytes"] is not None:
+        readme_tokens = metadata["readme_bytes"] / README_BYTES_PER_TOKEN
+    else:
+        readme_tokens = DEFAULT_README_TOKENS
+    return max(1, round(files * TOKENS_PER_TREE_ENTRY)), round(readme_tokens)
+
+
+def _calibration(source: str) -> tuple[float, float]:
+    """Returns the mean and standard deviation of log(actual / estimate)."""
+    stats = get_state_store().get(NAMESPACE, source)
+    if not stats or stats["n"] < MIN_CALIBRATION_SAMPLES:
+        return 0.0, DEFAULT_LOG_ERROR_STD
+    return stats["mean"], math.sqrt(stats["m2"] / (stats["n"] - 1))
+
+
+def calibrated_estimate(metadata: dict) -> tuple[tuple[int, int], float, float]:
+    """
+    Applies the observed bias for the metadata source to the raw estimate.
+
+    Returns:
+        tuple: (file tree tokens, README tokens), and the low and high factors
+               of the ~90% range around them
+    """
+    tree_tokens, readme_tokens = estimate_context_tokens(metadata)
+    mean, std = _calibration(metadata["source"])
+    correction = math.exp(mean)
+    return (
+        (round(tree_tokens * correction), round(readme_tokens * correction)),
+        math.exp(-RANGE_Z * std),
+        math.exp(RANGE_Z * std),
+    )
+
+
+def record_calibration(metadata: dict, actual_tokens: int):
+    """
+    Records how far the raw estimate was from the tokens counted after full
+    ingestion, as a running mean and variance of the log ratio (Welford).
+    """
+    estimate = sum(estimate_context_tokens(metadata))
+    if estimate <= 0 or actual_tokens <= 0:
+        return
+    sample = math.log(actual_tokens / estimate)
+
+    def add_sample(stats):
+        stats = stats or {"n": 0, "mean": 0.0, "m2": 0.0}
+        n = stats["n"] + 1
+        delta = sample - stats["mean"]
+        mean = stats["mean"] + delta / n
+        return {"n": n, "mean": mean, "m2": stats["m2"] + delta * (sample - mean)}, None
+
+    get_state_store().update(NAMESPACE, metadata["source"], add_sample)
@@ -0,0 +1,379 @@
+from app.services.github_service import GitHubService, should_include_file
+from app.services.diagram_store import diagram_store
+from app.services.o4_mini_openai_service import OpenAIo4Service
+from app.utils.click_events import ClickEventRewriter
+from app.utils.component_mapping import parse_mapping, render_mapping
+from app.utils.file_tree_index import FileTreeIndex
+from app.utils.mermaid import repair_mermaid
+from app.prompts import (
+    SYSTEM_FIRST_PROMPT,
+    SYSTEM_SECOND_PROMPT,
+    SYSTEM_MODIFY_PROMPT,
+    ADDITIONAL_SYSTEM_INSTRUCTIONS_PROMPT,
+)
+from app.core.state_store import get_state_store
+import asyncio
+import os
+import re
+
+# Top-level entry of the explanation's "Key Directories and Files" list
+SECTION_PATTERN = re.compile(r"^- `([^`]+)`")
+
+# Changed paths listed per category in the diagram update instructions
+MAX_LISTED_PATHS = 50
+
+o4_service = OpenAIo4Service()
+
+# One refresh per repository at a time across all workers, so pushes in quick
+# succession each diff against the result of the previous one. The claim
+# expires in case a worker dies mid-refresh.
+REFRESH_CLAIM_TTL = 600
+REFRESH_POLL_SECONDS = 1.0
+
+
+def _normalize(path: str) -> str:
+    return path.strip().removeprefix("./").strip("/")
+
+
+def _is_under(path: str, unit: str) -> bool:
+    return path == unit or path.startswith(unit + "/")
+
+
+def diff_file_trees(old_tree: str, new_tree: str) -> tuple[set[str], set[str]]:
+    """
+    Compares two newline-separated file trees.
+
+    Returns:
+        tuple[set[str], set[str]]: Paths only in the new tree, paths only in the old tree
+    """
+    old_paths = set(filter(None, old_tree.split("\n")))
+    new_paths = set(filter(None, new_tree.split("\n")))
+    return new_paths - old_paths, old_paths - new_paths
+
+
+def paths_from_push(payload: dict) -> tuple[set[str], set[str], bool]:
+    """
+    Collects the files touched by a push event.
+
+    GitHub lists at most 20 commits per push payload, so the lists are only
+    complete when every commit of the push is included.
+
+    Returns:
+        tuple[set[str], set[str], bool]: All touched paths, modified paths and
+                                         whether the lists are complete
+    """
+    commits = payload.get("commits") or []
+    touched, modified = set(), set()
+    for commit in commits:
+        touched.update(commit.get("added", []))
+        touched.update(commit.get("removed", []))
+        touched.update(commit.get("modified", []))
+        modified.update(commit.get("modified", []))
+    complete = bool(commits) and len(commits) >= payload.get("size", len(commits))
+    return touched, modified, complete
+
+
+def split_explanation(explanation: str) -> list[tuple[str | None, str]]:
+    """
+    Splits an explanation into blocks, one per top-level directory or file
+    entry. Text outside those entries (overview, summary) has a None key.
+    """
+    blocks: list[tuple[str | None, list[str]]] = [(None, [])]
+    for line in explanation.split("\n"):
+        match = SECTION_PATTERN.match(line)
+        if match:
+            blocks.append((_normalize(match.group(1)), [line]))
+        elif line and not line[0].isspace() and blocks[-1][0] is not None:
+            # Unindented text after an entry, e.g. "Overall Structure:"
+            blocks.append((None, [line]))
+        else:
+            blocks[-1][1].append(line)
+    return [(key, "\n".join(lines)) for key, lines in blocks if lines]
+
+
+def changed_units(changed_paths: set[str], explanation: str) -> set[str]:
+    """
+    Groups changed paths into the units the explanation is organised by: the
+    deepest explanation entry containing a path, otherwise its top-level
+    directory (or the file itself at the repository root).
+    """
+    entries = [key for key, _ in split_explanation(explanation) if key]
+    units = set()
+    for path in changed_paths:
+        containing = [entry for entry in entries if _is_under(path, entry)]
+        if containing:
+            units.add(max(containing, key=len))
+        else:
+            units.add(path.split("/", 1)[0])
+    # Nested units are covered by their parents
+    return {
+        unit
+        for unit in units
+        if not any(other != unit and _is_under(unit, other) for other in units)
+    }
+
+
+def patch_explanation(
+    explanation: str, updated: str, units: set[str], new_paths: set[str]
+) -> str:
+    """
+    Replaces the explanation entries for `units` with the entries of the
+    partial `updated` explanation. Entries for units that no longer exist are
+    dropped and new entries are added after the last existing one.
+    """
+    replacements = {
+        key: text
+        for key, text in split_explanation(updated)
+        if key and any(_is_under(key, unit) for unit in units)
+    }
+
+    blocks = split_explanation(explanation)
+    last_entry = max(
+        (i for i, (key, _) in enumerate(blocks) if key is not None), default=0
+    )
+    patched = []
+    for i, (key, text) in enumerate(blocks):
+        if key is not None and any(_is_under(key, unit) for unit in units):
+            if key in replacements:
+                patched.append(replacements.pop(key).rstrip("\n"))
+            elif any(_is_under(path, key) for path in new_paths):
+                # Still exists but the model did not describe it again
+                patched.append(text)
+        else:
+            patched.append(text)
+        if i == last_entry:
+            patched.extend(text.rstrip("\n") for text in replacements.values())
+            replacements.clear()
+    return "\n".join(patched)
+
+
+def patch_mapping(
+    mapping: str,
+    updated: str,
+    units: set[str],
+    changed_paths: set[str],
+    file_tree_index: FileTreeIndex | None = None,
+    repo: str = "",
+) -> str:
+    """
+    Merges the partial `updated` mapping for `units` into a component mapping.
+    Components of changed files and components the update maps again are
+    replaced; components of untouched files are kept. Paths in the update are
+    resolved against the new tree when an index is given.
+    """
+    added = [
+        component
+        for component in parse_mapping(updated, file_tree_index, repo)
+        if any(_is_under(component.path, unit) for unit in units)
+    ]
+    remapped = {component.path for component in added}
+    kept = [
+        component
+        for component in parse_mapping(mapping)
+        if component.path not in remapped
+        and component.path.split("#")[0] not in changed_paths
+    ]
+    return render_mapping(kept + added)
+
+
+def _list_paths(label: str, paths: set[str]) -> str:
+    listed = sorted(paths)[:MAX_LISTED_PATHS]
+    more = len(paths) - len(listed)
+    suffix = f"\n  ... ({more} more)" if more > 0 else ""
+    return f"{label}:\n" + "\n".join(f"  {path}" for path in listed) + suffix
+
+
+def _with_instructions(refresh_instructions: str, instructions: str) -> str:
+    """Appends the instructions the diagram was generated with to a refresh's own."""
+    if not instructions:
+        return refresh_instructions
+    return (
+        f"{refresh_instructions}\n\nKeep following the instructions the diagram "
+        f"was originally generated with:\n{instructions}"
+    )
+
+
+async def _complete(system_prompt: str, data: dict) -> str:
+    response = ""
+    async for chunk in o4_service.call_o4_api_stream(
+        system_prompt=system_prompt, data=data
+    ):
+        response += chunk
+    return response
+
+
+async def refresh_diagram(username: str, repo: str, payload: dict) -> dict:
+    """
+    Brings the stored diagram of a repository up to date with a push.
+
+    Only the explanation entries for directories whose paths changed are
+    regenerated; the mapping is patched for those directories and the diagram
+    is updated in place with the modify prompt, following the custom
+    instructions the diagram was generated with. Nothing is regenerated when
+    only excluded files changed.
+
+    Args:
+        username (str): Repository owner
+        repo (str): Repository name
+        payload (dict): GitHub push event payload
+
+    Returns:
+        dict: The outcome, with a "status" of "skipped" or "updated"
+    """
+    store = get_state_store()
+    key = f"{username}/{repo}".lower()
+    while not await asyncio.to_thread(
+        store.add, "jobs", f"refresh:{key}", os.getpid(), ttl=REFRESH_CLAIM_TTL
+    ):
+        await asyncio.sleep(REFRESH_POLL_SECONDS)
+    try:
+        return await _refresh_diagram(username, repo, payload)
+    finally:
+        await asyncio.to_thread(store.delete, "jobs", f"refresh:{key}")
+
+
+async def _refresh_diagram(username: str, repo: str, payload: dict) -> dict:
+    record = await asyncio.to_thread(diagram_store.get, username, repo)
+    if record is None:
+        return {"status": "skipped", "reason": "No diagram has been generated"}
+
+    commit = payload.get("after")
+    # Recorded under the refresh claim, so a refresh running for an earlier
+    # push is never overwritten with the record it started from
+    touched, modified, complete = paths_from_push(payload)
+    if complete and not any(should_include_file(path) for path in touched):
+        await asyncio.to_thread(
+            diagram_store.put, username, repo, **{**record, "commit": commit}
+        )
+        return {"status": "skipped", "reason": "Only excluded files changed"}
+
+    instructions = record.get("instructions", "")
+    github_service = GitHubService()
+    new_tree, directories = await asyncio.to_thread(
+        github_service.get_file_tree, username, repo, commit
+    )
+    added, removed = diff_file_trees(record["file_tree"], new_tree)
+    new_paths = set(filter(None, new_tree.split("\n")))
+    modified = {path for path in modified if path in new_paths}
+
+    changed = added | removed | modified
+    if not changed:
+        await asyncio.to_thread(
+            diagram_store.put, username, repo, **{**record, "commit": commit}
+        )
+        return {"status": "skipped", "reason": "Only excluded files changed"}
+
+    units = changed_units(changed, record["explanation"])
+    unit_tree = "\n".join(
+        path
+        for path in new_tree.split("\n")
+        if any(_is_under(path, unit) for unit in units)
+    )
+    unit_list = ", ".join(f"`{unit}`" for unit in sorted(units))
+    print(
+        f"Refreshing {username}/{repo} at {commit}: {len(changed)} changed paths in {unit_list}"
+    )
+
+    # Phase 1, scoped to the changed directories
+    explanation_update = await _complete(
+        SYSTEM_FIRST_PROMPT + "\n" + ADDITIONAL_SYSTEM_INSTRUCTIONS_PROMPT,
+        {
+            "file_tree": unit_tree,
+            "readme": "",
+            "instructions": _with_instructions(
+                f"The file tree only contains {unit_list}, which changed since the "
+                "last analysis. Describe each of them as its own top-level entry "
+                "under Key Directories and Files, using the exact path shown here.",
+                instructions,
+            ),
+        },
+    )
+    explanation = patch_explanation(
+        record["explanation"], explanation_update, units, new_paths
+    )
+
+    # Phase 2, scoped to the same directories
+    mapping_update = await _complete(
+        SYSTEM_SECOND_PROMPT,
+        {"explanation": explanation_update, "file_tree": unit_tree},
+    )
+    new_index = FileTreeIndex(new_tree, directories)
+    mapping = patch_mapping(
+        record["mapping"], mapping_update, units, changed, new_index, repo
+    )
+
+    # Phase 3 becomes an in-place edit of the existing diagram
+    change_summary = "\n".join(
+        _list_paths(label, paths)
+        for label, paths in (
+            ("Added", added),
+            ("Removed", removed),
+            ("Modified", modified),
+        )
+        if paths
+    )
+    diagram = await _complete(
+        SYSTEM_MODIFY_PROMPT,
+        {
+            "diagram": record["diagram"],
+            "explanation": explanation,
+            "component_mapping": mapping,
+            "instructions": _with_instructions(
+                f"The repository changed in {unit_list}.\n{change_summary}\n"
+                "Update only the parts of the diagram covering these paths so they "
+                "match the explanation and component mapping. Remove nodes and "
+                "click events for removed files and keep everything else unchanged.",
+                instructions,
+            ),
+        },
+    )
+    rewriter = ClickEventRewriter(
+        username, repo, record["branch"], new_index
+    )
+    diagram, fixes = repair_mermaid(rewriter.feed(diagram) + rewriter.flush())
+    if fixes:
+        print(f"Repaired refreshed diagram for {username}/{repo}: {fixes}")
+
+    await asyncio.to_thread(
+        diagram_store.put,
+        username,
+        repo,
+        branch=record["branch"],
+        commit=commit,
+        file_tree=new_tree,
+        explanation=explanation,
+        mapping=mapping,
+        instructions=instructions,
+        diagram=diagram,
+    )
+    return {
+        "status": "updated",
+        "units": sorted(units),
+        "changed_paths": len(changed),
+    }
+
+
+def should_refresh(payload: dict) -> tuple[bool, str]:
+    """
+    Decides from the push payload alone whether a refresh is needed, so pushes
+    to other branches cost nothing. Pushes touching only excluded files are
+    refreshed without API calls, which just records their commit.
+
+    Returns:
+        tuple[bool, str]: Whether to refresh, and the reason if not
+    """
+    repository = payload.get("repository") or {}
+    owner = repository.get("owner") or {}
+    username = owner.get("login") or owner.get("name")
+    repo = repository.get("name")
+    if not username or not repo:
+        return False, "Payload has no repository"
+
+    record = diagram_store.get(username, repo)
+    if record is None:
+        return False, "No diagram has been generated"
+    if payload.get("deleted"):
+        return False, "Branch was deleted"
+    if payload.get("ref") != f"refs/heads/{record['branch']}":
+        return False, "Push is not to the default branch"
+    return True, ""
@@ -0,0 +1,55 @@
+from app.core.state_store import get_state_store
+import os
+import time
+
+NAMESPACE = "diagrams"
+
+# Drill-down diagrams are regenerated on demand, so they need not live forever
+DRILLDOWN_CACHE_TTL = int(os.getenv("DRILLDOWN_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Records hold a whole file tree each, so repositories that are neither
+# regenerated nor refreshed by a push for this long are dropped
+DIAGRAM_CACHE_TTL = int(os.getenv("DIAGRAM_CACHE_TTL", str(30 * 24 * 3600)))
+
+
+class DiagramStore:
+    """
+    Latest generation result per repository, kept on the backend so push
+    webhooks can diff against the tree a diagram was generated from.
+
+    Records hold the branch, commit, filtered file tree, custom instructions
+    and the three artifacts (diagram, explanation, mapping). They live in the shared state
+    store, so every worker sees the same records, and expire unless rewritten. Keys are case-insensitive
+    since GitHub owner and repository names are; an optional scope (such as
+    a subdirectory and ref) is appended as is.
+    """
+
+    def __init__(self, namespace: str = NAMESPACE, ttl: float | None = None):
+        self.namespace = namespace
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(username: str, repo: str, scope: str = "") -> str:
+        return f"{username}/{repo}".lower() + scope
+
+    def get(self, username: str, repo: str, scope: str = "") -> dict | None:
+        """Returns the stored record, or None if nothing was generated yet."""
+        return get_state_store().get(self.namespace, self._key(username, repo, scope))
+
+    def put(self, username: str, repo: str, scope: str = "", **record) -> None:
+        """
+        Replaces the stored record for a repository. "updated_at" is set to
+        now unless the record carries one, which lets updates that leave the
+        artifacts unchanged (such as a new commit) keep it.
+        """
+        record.setdefault("updated_at", time.time())
+        get_state_store().set(
+            self.namespace, self._key(username, repo, scope), record, ttl=self.ttl
+        )
+
+
+diagram_store = DiagramStore(ttl=DIAGRAM_CACHE_TTL)
+# Top-level diagrams of hierarchical generations, with the context drill-downs need
+overview_store = DiagramStore("overviews", ttl=DIAGRAM_CACHE_TTL)
+# Detailed diagrams of single overview subgraphs
+drilldown_store = DiagramStore("drilldowns", ttl=DRILLDOWN_CACHE_TTL)
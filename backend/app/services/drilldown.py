@@ -0,0 +1,111 @@
+from app.services.diagram_refresh import split_explanation
+from app.utils.component_mapping import parse_mapping, render_mapping
+from app.utils.mermaid import parse_mermaid
+import hashlib
+
+# Paths listed per area in the drill-down prompt
+MAX_AREA_PATHS = 20
+
+
+def _is_under(path: str, area_path: str) -> bool:
+    return path == area_path or path.startswith(area_path + "/")
+
+
+def generation_scope(path: str = "", ref: str | None = None) -> str:
+    """Store key suffix for a subdirectory and ref, empty for the whole repository."""
+    return f"/{path}@{ref or ''}" if path or ref else ""
+
+
+def overview_id(diagram: str) -> str:
+    """Identifies an overview, so drill-downs of a regenerated one are not reused."""
+    return hashlib.sha256(diagram.encode()).hexdigest()[:16]
+
+
+def _click_path(target: str, username: str, repo: str, branch: str) -> str:
+    """Turns a click target back into a repository path."""
+    target = target.strip().strip("\"'")
+    for kind in ("blob", "tree"):
+        prefix = f"https://github.com/{username}/{repo}/{kind}/{branch}/"
+        if target.startswith(prefix):
+            return target[len(prefix) :]
+    return target.split("#")[0].strip("/")
+
+
+def overview_areas(diagram: str, username: str, repo: str, branch: str) -> dict:
+    """
+    Lists the subgraphs of an overview diagram that can be drilled into.
+
+    An area covers the click targets of the subgraph itself and of everything
+    inside it. Subgraphs without any click target are left out.
+
+    Returns:
+        dict: Subgraph ID -> {"label": str, "paths": list[str]}
+    """
+    parsed = parse_mermaid(diagram)
+    targets = {
+        node_id: _click_path(target, username, repo, branch)
+        for _, node_id, target in parsed.clicks
+    }
+
+    areas = {}
+    for subgraph in parsed.subgraphs:
+        paths = {
+            targets[member]
+            for member in [subgraph, *parsed.subgraph_members.get(subgraph, [])]
+            if targets.get(member)
+        }
+        # Paths inside another listed directory add nothing
+        paths = sorted(
+            path
+            for path in paths
+            if not any(other != path and _is_under(path, other) for other in paths)
+        )
+        if paths:
+            areas[subgraph] = {
+                "label": parsed.subgraph_labels.get(subgraph, subgraph),
+                "paths": paths,
+            }
+    return areas
+
+
+def scope_context(record: dict, paths: list[str]) -> dict:
+    """
+    Narrows the stored explanation, component mapping and file tree of an
+    overview to the paths of one area.
+
+    Returns:
+        dict: "explanation", "component_mapping" and "file_tree" for the area
+    """
+
+    def in_area(path: str) -> bool:
+        return any(_is_under(path, area_path) for area_path in paths)
+
+    # Entries for the area, its subdirectories or a directory containing it,
+    # plus the general text around them
+    explanation = "\n".join(
+        text
+        for key, text in split_explanation(record["explanation"])
+        if key is None
+        or in_area(key)
+        or any(_is_under(area_path, key) for area_path in paths)
+    )
+    components = [
+        component
+        for component in parse_mapping(record["mapping"])
+        if in_area(component.path.split("#")[0])
+    ]
+    file_tree = "\n".join(
+        path for path in record["file_tree"].split("\n") if path and in_area(path)
+    )
+    return {
+        "explanation": explanation,
+        "component_mapping": render_mapping(components),
+        "file_tree": file_tree,
+    }
+
+
+def describe_area(area: dict) -> str:
+    listed = area["paths"][:MAX_AREA_PATHS]
+    more = len(area["paths"]) - len(listed)
+    suffix = f"\n  ... ({more} more)" if more > 0 else ""
+    return f"{area['label']}, covering:\n" + "\n".join(f"  {path}" for path in listed) + suffix
@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+
+# Longest we block a request waiting for a rate limit to reset before giving up
+RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv("GITHUB_RATE_LIMIT_MAX_WAIT", "30"))
+
+
+class GitHubRateLimitError(Exception):
+    """Raised when every credential is out of GitHub API budget."""
+
+
+# Rate-limit resource of REST calls; GitHub budgets GraphQL ("graphql") and
+# a few other APIs separately and names the one a response counted against
+# in X-RateLimit-Resource
+DEFAULT_RESOURCE = "core"
+
+
+def request_resource(url: str) -> str:
+    """Returns the rate-limit resource a GitHub API call will count against."""
+    return "graphql" if url.rstrip("/").endswith("/graphql") else DEFAULT_RESOURCE
+
+
+def is_rate_limited(status: int, headers) -> bool:
+    """Whether a response was refused by a primary or secondary rate limit."""
+    return status == 429 or (
+        status == 403
+        and ("Retry-After" in headers or headers.get("X-RateLimit-Remaining") == "0")
+    )
+
+
+class RateLimitBudget:
+    """Last known budget of one rate-limit resource."""
+
+    def __init__(self):
+        self.limit: int | None = None
+        self.remaining: int | None = None
+        self.reset_at = 0.0
+
+
+class GitHubCredential:
+    """
+    A single way of authenticating to GitHub and its last known rate-limit
+    budget per resource ("core", "graphql", ...).
+
+    `kind` is "pat", "app" (a GitHub App installation) or "anonymous".
+    """
+
+    def __init__(self, kind: str, value: str | None = None):
+        self.kind = kind
+        self.value = value
+        self.budgets: dict[str, RateLimitBudget] = {}
+        # Secondary rate limits pause a credential for every resource
+        self.blocked_until = 0.0
+
+    @property
+    def label(self) -> str:
+        if self.kind == "pat":
+            return f"pat:...{self.value[-4:]}"  # type: ignore
+        if self.kind == "app":
+            return f"app:{self.value}"
+        return "anonymous"
+
+    def available_at(self, resource: str = DEFAULT_RESOURCE) -> float:
+        """Returns when this credential may be used again for `resource` (0 if now)."""
+        budget = self.budgets.get(resource)
+        exhausted_until = budget.reset_at if budget and budget.remaining == 0 else 0.0
+        return max(exhausted_until, self.blocked_until)
+
+
+class CredentialPool:
+    """
+    Spreads GitHub API traffic round-robin across credentials, skipping those
+    whose budget for the pending call's resource is spent until their
+    `X-RateLimit-Reset` time.
+    """
+
+    def __init__(self, credentials: list[GitHubCredential]):
+        self.credentials = credentials
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, resource: str = DEFAULT_RESOURCE) -> GitHubCredential:
+        """
+        Picks the next credential with budget left for `resource`, waiting for
+        a reset if it is close enough.
+
+        Raises:
+            GitHubRateLimitError: If every credential is exhausted for longer than the max wait.
+        """
+        while True:
+            with self._lock:
+                now = time.time()
+                for offset in range(len(self.credentials)):
+                    index = (self._next + offset) % len(self.credentials)
+                    credential = self.credentials[index]
+                    if credential.available_at(resource) <= now:
+                        self._next = index + 1
+                        return credential
+                wait = min(c.available_at(resource) for c in self.credentials) - now
+
+            if wait > RATE_LIMIT_MAX_WAIT_SECONDS:
+                raise GitHubRateLimitError(
+                    f"GitHub API rate limit exceeded. Try again in {int(wait // 60) + 1} minutes."
+                )
+            print(f"GitHub rate limit reached, waiting {wait:.1f}s for reset")
+            time.sleep(wait)
+
+    def record(
+        self, credential: GitHubCredential, headers, resource: str = DEFAULT_RESOURCE
+    ) -> None:
+        """
+        Updates a credential's budget from a response's rate-limit headers,
+        for the resource they name or else the one the request was sent for.
+        """
+        with self._lock:
+            if "X-RateLimit-Remaining" in headers:
+                resource = headers.get("X-RateLimit-Resource", resource)
+                budget = credential.budgets.setdefault(resource, RateLimitBudget())
+                budget.remaining = int(headers["X-RateLimit-Remaining"])
+                budget.limit = int(headers.get("X-RateLimit-Limit", 0)) or None
+                budget.reset_at = float(headers.get("X-RateLimit-Reset", 0))
+                if budget.remaining == 0:
+                    print(f"GitHub credential {credential.label} is out of {resource} budget")
+            if "Retry-After" in headers:
+                # Secondary rate limit: pause this credential for the requested time
+                credential.blocked_until = time.time() + float(headers["Retry-After"])
+
+    def snapshot(self) -> list[dict]:
+        """Returns each credential's remaining budget per resource, for metrics."""
+        with self._lock:
+            return [
+                {
+                    "credential": c.label,
+                    "budgets": {
+                        resource: {
+                            "limit": budget.limit,
+                            "remaining": budget.remaining,
+                            "reset_at": budget.reset_at or None,
+                        }
+                        for resource, budget in c.budgets.items()
+                    },
+                    "blocked_until": c.blocked_until or None,
+                }
+                for c in self.credentials
+            ]
+
+
+def _split_env(name: str) -> list[str]:
+    return [value.strip() for value in os.getenv(name, "").split(",") if value.strip()]
+
+
+_default_pool: CredentialPool | None = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_credential_pool() -> CredentialPool:
+    """
+    Returns the process-wide pool built from GITHUB_PAT, GITHUB_PATS and the
+    GitHub App installations in GITHUB_INSTALLATION_ID (comma-separated).
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            credentials = [
+                GitHubCredential("pat", pat)
+                for pat in dict.fromkeys(
+                    _split_env("GITHUB_PAT") + _split_env("GITHUB_PATS")
+                )
+            ]
+            if os.getenv("GITHUB_CLIENT_ID") and os.getenv("GITHUB_PRIVATE_KEY"):
+                credentials += [
+                    GitHubCredential("app", installation_id)
+                    for installation_id in _split_env("GITHUB_INSTALLATION_ID")
+                ]
+            if not credentials:
+                print(
+                    "\033[93mWarning: No GitHub credentials provided. Using unauthenticated requests with rate limit of 60 requests/hour.\033[0m"
+                )
+                credentials = [GitHubCredential("anonymous")]
+            _default_pool = CredentialPool(credentials)
+        return _default_pool
@@ -0,0 +1,244 @@
+from app.services.github_service import GITHUB_API_URL, MAX_REQUEST_ATTEMPTS, GitHubService
+from app.services.github_credentials import (
+    GitHubRateLimitError,
+    is_rate_limited,
+    request_resource,
+)
+from app.core import profiling
+from typing import TYPE_CHECKING, AsyncGenerator
+import asyncio
+import json
+
+if TYPE_CHECKING:
+    import aiohttp
+
+GRAPHQL_URL = f"{GITHUB_API_URL}/graphql"
+
+
+class GitHubFileReader:
+    """
+    Reads many files from a repository with batched GraphQL queries.
+
+    Each query fetches a batch of `object(expression: "ref:path")` blobs. The batch
+    size adapts to the observed payload size, and binary or truncated blobs are
+    fetched through the REST API instead. Requests take credentials from the
+    service's pool and follow the same rate-limit retries as its REST calls.
+    """
+
+    def __init__(
+        self,
+        github_service: GitHubService,
+        target_batch_bytes: int = 1_000_000,
+        initial_batch_size: int = 25,
+        max_batch_size: int = 100,
+        max_concurrency: int = 3,
+    ):
+        self.github_service = github_service
+        self.target_batch_bytes = target_batch_bytes
+        self.initial_batch_size = initial_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+
+    @staticmethod
+    def _build_query(count: int) -> str:
+        """Builds a query fetching `count` blobs through aliased `object` fields."""
+        variables = "".join(f", $e{i}: String!" for i in range(count))
+        fields = "\n".join(
+            f"f{i}: object(expression: $e{i}) {{ ... on Blob {{ text isBinary isTruncated byteSize }} }}"
+            for i in range(count)
+        )
+        return f"query($owner: String!, $name: String!{variables}) {{\n  repository(owner: $owner, name: $name) {{\n{fields}\n  }}\n}}"
+
+    async def _send(
+        self,
+        session: "aiohttp.ClientSession",
+        method: str,
+        url: str,
+        headers: dict | None = None,
+        **kwargs,
+    ) -> tuple[int, bytes]:
+        """
+        Async counterpart of `GitHubService._request`: sends a request with the
+        next credential that has budget left, records its rate-limit headers and
+        retries rate-limited responses with another credential.
+
+        Returns:
+            tuple: The response status and body.
+
+        Raises:
+            GitHubRateLimitError: If every credential is out of budget.
+        """
+        pool = self.github_service.credential_pool
+        resource = request_resource(url)
+        for _ in range(MAX_REQUEST_ATTEMPTS):
+            # Both can block, on a secondary limit or an installation token refresh
+            credential = await asyncio.to_thread(pool.acquire, resource)
+            request_headers = await asyncio.to_thread(
+                self.github_service._get_headers, credential
+            )
+            request_headers.update(headers or {})
+            with profiling.span("github", method=method, url=url):
+                async with session.request(
+                    method, url, headers=request_headers, **kwargs
+                ) as response:
+                    body = await response.read()
+            pool.record(credential, response.headers, resource)
+            if not is_rate_limited(response.status, response.headers):
+                return response.status, body
+        raise GitHubRateLimitError(
+            "GitHub API rate limit exceeded. Please try again in a few minutes."
+        )
+
+    async def _fetch_batch(
+        self,
+        session: "aiohttp.ClientSession",
+        username: str,
+        repo: str,
+        ref: str,
+        paths: list[str],
+    ) -> tuple[dict[str, dict | None], int]:
+        """
+        Fetches one batch of blobs.
+
+        Returns:
+            tuple: Blob data (or None for missing paths) keyed by path, and the payload size in bytes.
+        """
+        variables = {"owner": username, "name": repo}
+        variables.update({f"e{i}": f"{ref}:{path}" for i, path in enumerate(paths)})
+        payload = {"query": self._build_query(len(paths)), "variables": variables}
+
+        status, body = await self._send(session, "POST", GRAPHQL_URL, json=payload)
+        if status != 200:
+            raise ValueError(
+                f"GitHub GraphQL API returned status code {status}: {body.decode('utf-8', 'replace')}"
+            )
+
+        data = json.loads(body)
+        repository = (data.get("data") or {}).get("repository")
+        if repository is None:
+            raise ValueError(f"GitHub GraphQL query failed: {data.get('errors')}")
+        return {path: repository.get(f"f{i}") for i, path in enumerate(paths)}, len(
+            body
+        )
+
+    async def _fetch_rest(
+        self,
+        session: "aiohttp.ClientSession",
+        username: str,
+        repo: str,
+        ref: str,
+        path: str,
+    ) -> str | bytes | None:
+        """
+        Fetches a single file's raw contents through the REST Contents API,
+        as text, or as bytes if the file is binary.
+        """
+        api_url = f"{GITHUB_API_URL}/repos/{username}/{repo}/contents/{path}"
+        status, content = await self._send(
+            session,
+            "GET",
+            api_url,
+            params={"ref": ref},
+            headers={"Accept": "application/vnd.github.raw+json"},
+        )
+        if status == 404:
+            return None
+        if status != 200:
+            raise ValueError(
+                f"Failed to fetch file {path} from {username}/{repo}: {status}"
+            )
+        # Same test as git: a NUL byte near the start means binary
+        if b"\0" in content[:8000]:
+            return content
+        try:
+            return content.decode("utf-8")
+        except UnicodeDecodeError:
+            return content
+
+    def _next_batch_size(self, observed_bytes: int, observed_files: int) -> int:
+        """Sizes the next batch so its payload lands near the byte target."""
+        if not observed_files:
+            return self.initial_batch_size
+        bytes_per_file = max(observed_bytes / observed_files, 1)
+        size = int(self.target_batch_bytes / bytes_per_file)
+        return max(1, min(size, self.max_batch_size))
+
+    async def read_files(
+        self,
+        username: str,
+        repo: str,
+        paths: list[str],
+        ref: str = "HEAD",
+    ) -> AsyncGenerator[tuple[str, str | bytes | None], None]:
+        """
+        Reads files from a repository, yielding each one as its batch arrives.
+
+        Args:
+            username (str): The GitHub username or organization name
+            repo (str): The repository name
+            paths (list[str]): File paths relative to the repository root
+            ref (str): Branch, tag or commit SHA to read from
+
+        Yields:
+            tuple: (path, content) where content is text, bytes for binary files,
+                   or None if the path does not exist.
+        """
+        pending = list(dict.fromkeys(paths))
+        observed_bytes = 0
+        observed_files = 0
+        batch_size_cap = self.max_batch_size
+
+        import aiohttp
+
+        async with aiohttp.ClientSession() as session:
+            if not self.github_service._has_credentials():
+                # GraphQL requires authentication, so read everything over REST
+                for path in pending:
+                    yield path, await self._fetch_rest(
+                        session, username, repo, ref, path
+                    )
+                return
+
+            in_flight: dict[asyncio.Task, list[str]] = {}
+            try:
+                while pending or in_flight:
+                    while pending and len(in_flight) < self.max_concurrency:
+                        size = min(
+                            self._next_batch_size(observed_bytes, observed_files),
+                            batch_size_cap,
+                        )
+                        batch, pending = pending[:size], pending[size:]
+                        task = asyncio.create_task(
+                            self._fetch_batch(session, username, repo, ref, batch)
+                        )
+                        in_flight[task] = batch
+
+                    done, _ = await asyncio.wait(
+                        in_flight, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        batch = in_flight.pop(task)
+                        try:
+                            blobs, payload_bytes = task.result()
+                        except ValueError:
+                            if len(batch) == 1:
+                                raise
+                            # Oversized payloads time out server-side, so retry in halves
+                            batch_size_cap = max(1, len(batch) // 2)
+                            pending = batch + pending
+                            continue
+
+                        observed_bytes += payload_bytes
+                        observed_files += len(batch)
+                        for path, blob in blobs.items():
+                            if blob is None:
+                                yield path, None
+                            elif blob.get("isBinary") or blob.get("isTruncated"):
+                                yield path, await self._fetch_rest(
+                                    session, username, repo, ref, path
+                                )
+                            else:
+                                yield path, blob.get("text")
+            finally:
+                for task in in_flight:
+                    task.cancel()
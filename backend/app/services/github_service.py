@@ -1,38 +1,116 @@
 import requests
 import base64
-import jwt
 import time
-from datetime import datetime, timedelta
-from dotenv import load_dotenv
 import os
-
-load_dotenv()
+import tarfile
+import re
+from concurrent.futures import ThreadPoolExecutor
+from app.services.github_token_cache import installation_token_cache
+from app.core.cpu_executor import timed_stage
+from app.core import profiling
+from app.services.github_credentials import (
+    CredentialPool,
+    GitHubCredential,
+    GitHubRateLimitError,
+    get_default_credential_pool,
+    is_rate_limited,
+    request_resource,
+)
+
+# Base URL of the GitHub REST API, overridable to point at a local stand-in
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+
+# Attempts per API request before giving up on rate-limited responses
+MAX_REQUEST_ATTEMPTS = 3
+
+# File names GitHub shows as a directory's README, most preferred first.
+# Blob expressions are case-sensitive, so common spellings are listed.
+README_NAMES = (
+    "README.md",
+    "readme.md",
+    "Readme.md",
+    "README.rst",
+    "README.txt",
+    "README",
+    "README.markdown",
+)
+
+# Upper bound on concurrent subtree requests when a recursive tree is truncated
+TREE_WALK_MAX_WORKERS = int(os.getenv("GITHUB_TREE_MAX_WORKERS", "8"))
+
+# Size bounds for the file-content index built from a repository tarball
+TARBALL_MAX_FILE_BYTES = int(os.getenv("GITHUB_TARBALL_MAX_FILE_BYTES", "100000"))
+TARBALL_MAX_TOTAL_BYTES = int(os.getenv("GITHUB_TARBALL_MAX_TOTAL_BYTES", "2000000"))
+
+# Patterns to exclude from the file tree
+EXCLUDED_PATTERNS = [
+    # Dependencies
+    "node_modules/",
+    "vendor/",
+    "venv/",
+    # Compiled files
+    ".min.",
+    ".pyc",
+    ".pyo",
+    ".pyd",
+    ".so",
+    ".dll",
+    ".class",
+    # Asset files
+    ".jpg",
+    ".jpeg",
+    ".png",
+    ".gif",
+    ".ico",
+    ".svg",
+    ".ttf",
+    ".woff",
+    ".webp",
+    # Cache and temporary files
+    "__pycache__/",
+    ".cache/",
+    ".tmp/",
+    # Lock files and logs
+    "yarn.lock",
+    "poetry.lock",
+    "*.log",
+    # Configuration files
+    ".vscode/",
+    ".idea/",
+]
+
+
+# One alternation instead of a substring scan per pattern, which matters
+# when filtering repositories with hundreds of thousands of paths
+_EXCLUDED_RE = re.compile("|".join(re.escape(pattern) for pattern in EXCLUDED_PATTERNS))
+
+
+def should_include_file(path):
+    """Returns False for dependency, compiled, asset and cache paths."""
+    return _EXCLUDED_RE.search(path.lower()) is None
+
+
+def _tree_path(path, item):
+    """Marks directory entries of a git tree listing with a trailing slash."""
+    return f"{path}/" if item["type"] == "tree" else path
 
 
 class GitHubService:
     def __init__(self, pat: str | None = None):
-        # Try app authentication first
+        # App credentials, used by the installations in the shared credential pool
         self.client_id = os.getenv("GITHUB_CLIENT_ID")
         self.private_key = os.getenv("GITHUB_PRIVATE_KEY")
-        self.installation_id = os.getenv("GITHUB_INSTALLATION_ID")
-
-        # Use provided PAT if available, otherwise fallback to env PAT
-        self.github_token = pat or os.getenv("GITHUB_PAT")
-
-        # If no credentials are provided, warn about rate limits
-        if (
-            not all([self.client_id, self.private_key, self.installation_id])
-            and not self.github_token
-        ):
-            print(
-                "\033[93mWarning: No GitHub credentials provided. Using unauthenticated requests with rate limit of 60 requests/hour.\033[0m"
-            )
 
-        self.access_token = None
-        self.token_expires_at = None
+        # A user-provided PAT gets its own pool, otherwise share the env credentials
+        if pat:
+            self.credential_pool = CredentialPool([GitHubCredential("pat", pat)])
+        else:
+            self.credential_pool = get_default_credential_pool()
 
     # autopep8: off
     def _generate_jwt(self):
+        import jwt
+
         now = int(time.time())
         payload = {
             "iat": now,
@@ -44,53 +122,85 @@ class GitHubService:
 
     # autopep8: on
 
-    def _get_installation_token(self):
-        if self.access_token and self.token_expires_at > datetime.now():  # type: ignore
-            return self.access_token
-
+    def _request_installation_token(self, installation_id):
         jwt_token = self._generate_jwt()
         response = requests.post(
-            f"https://api.github.com/app/installations/{
-                self.installation_id}/access_tokens",
+            f"{GITHUB_API_URL}/app/installations/{installation_id}/access_tokens",
             headers={
                 "Authorization": f"Bearer {jwt_token}",
                 "Accept": "application/vnd.github+json",
             },
         )
         data = response.json()
-        self.access_token = data["token"]
-        self.token_expires_at = datetime.now() + timedelta(hours=1)
-        return self.access_token
-
-    def _get_headers(self):
-        # If no credentials are available, return basic headers
-        if (
-            not all([self.client_id, self.private_key, self.installation_id])
-            and not self.github_token
-        ):
+        if response.status_code != 201 or "token" not in data:
+            raise Exception(
+                f"Failed to create installation token: {response.status_code}, {data}"
+            )
+        return data
+
+    def _get_installation_token(self, installation_id):
+        # Shared across services and workers, so only the first cold request pays for it
+        return installation_token_cache.get_token(
+            installation_id,
+            lambda: self._request_installation_token(installation_id),
+        )
+
+    def _get_headers(self, credential: GitHubCredential | None = None):
+        if credential is None:
+            credential = self.credential_pool.acquire()
+
+        # Unauthenticated requests only need the basic headers
+        if credential.kind == "anonymous":
             return {"Accept": "application/vnd.github+json"}
 
-        # Use PAT if available
-        if self.github_token:
+        if credential.kind == "pat":
             return {
-                "Authorization": f"token {self.github_token}",
+                "Authorization": f"token {credential.value}",
                 "Accept": "application/vnd.github+json",
             }
 
-        # Otherwise use app authentication
-        token = self._get_installation_token()
+        token = self._get_installation_token(credential.value)
         return {
             "Authorization": f"Bearer {token}",
             "Accept": "application/vnd.github+json",
             "X-GitHub-Api-Version": "2022-11-28",
         }
 
+    def _request(self, method, url, **kwargs):
+        """
+        Sends a GitHub API request with the next credential that has budget left,
+        recording its rate-limit headers. Requests hitting a primary rate limit
+        move on to another credential, and secondary limits are retried once
+        their Retry-After has passed.
+
+        Raises:
+            GitHubRateLimitError: If every credential is out of budget.
+        """
+        resource = request_resource(url)
+        for _ in range(MAX_REQUEST_ATTEMPTS):
+            credential = self.credential_pool.acquire(resource)
+            with profiling.span("github", method=method, url=url):
+                response = requests.request(
+                    method, url, headers=self._get_headers(credential), **kwargs
+                )
+            self.credential_pool.record(credential, response.headers, resource)
+            if not is_rate_limited(response.status_code, response.headers):
+                return response
+            response.close()
+        raise GitHubRateLimitError(
+            "GitHub API rate limit exceeded. Please try again in a few minutes."
+        )
+
+    def _has_credentials(self):
+        # Pools hold either real credentials or the single anonymous one
+        return self.credential_pool.credentials[0].kind != "anonymous"
+
     def _check_repository_exists(self, username, repo):
         """
         Check if the repository exists using the GitHub API.
         """
-        api_url = f"https://api.github.com/repos/{username}/{repo}"
-        response = requests.get(api_url, headers=self._get_headers())
+        api_url = f"{GITHUB_API_URL}/repos/{username}/{repo}"
+        response = self._request("GET", api_url)
 
         if response.status_code == 404:
             raise ValueError("Repository not found.")
@@ -101,14 +211,237 @@ class GitHubService:
 
     def get_default_branch(self, username, repo):
         """Get the default branch of the repository."""
-        api_url = f"https://api.github.com/repos/{username}/{repo}"
-        response = requests.get(api_url, headers=self._get_headers())
+        api_url = f"{GITHUB_API_URL}/repos/{username}/{repo}"
+        response = self._request("GET", api_url)
 
         if response.status_code == 200:
             return response.json().get("default_branch")
         return None
 
-    def get_github_file_paths_as_list(self, username, repo):
+    def get_repository_metadata(self, username, repo):
+        """
+        Fetches what a cost estimate needs in a single API call: the default
+        branch, language byte counts, README size and the entries of the top
+        two directory levels. Uses GraphQL when a credential is available and
+        falls back to the REST repository endpoint (size and primary language
+        only) for anonymous access.
+
+        Returns:
+            dict: "source" ("graphql" or "rest"), "default_branch", "disk_usage_kb",
+                  "code_bytes", "readme_bytes", "files_seen" and "dirs_unexplored".
+                  Fields the source cannot provide are None.
+
+        Raises:
+            ValueError: If the repository does not exist.
+        """
+        if not self._has_credentials():
+            response = self._request("GET", f"{GITHUB_API_URL}/repos/{username}/{repo}")
+            if response.status_code == 404:
+                raise ValueError("Repository not found.")
+            if response.status_code != 200:
+                raise Exception(
+                    f"Failed to fetch repository: {response.status_code}, {response.json()}"
+                )
+            data = response.json()
+            return {
+                "source": "rest",
+                "default_branch": data.get("default_branch"),
+                "disk_usage_kb": data.get("size"),
+                "code_bytes": None,
+                "readme_bytes": None,
+                "files_seen": None,
+                "dirs_unexplored": None,
+            }
+
+        query = """
+        query($owner: String!, $name: String!) {
+          repository(owner: $owner, name: $name) {
+            diskUsage
+            defaultBranchRef { name }
+            languages(first: 1) { totalSize }
+            object(expression: "HEAD:") {
+              ... on Tree {
+                entries {
+                  name
+                  type
+                  object {
+                    ... on Blob { byteSize }
+                    ... on Tree { entries { name type } }
+                  }
+                }
+              }
+            }
+          }
+        }
+        """
+        response = self._request(
+            "POST",
+            f"{GITHUB_API_URL}/graphql",
+            json={"query": query, "variables": {"owner": username, "name": repo}},
+        )
+        if response.status_code != 200:
+            raise Exception(
+                f"Failed to fetch repository: {response.status_code}, {response.text}"
+            )
+        repository = (response.json().get("data") or {}).get("repository")
+        if repository is None:
+            raise ValueError("Repository not found.")
+
+        files_seen, dirs_unexplored, readme_bytes = 0, 0, None
+        root = repository.get("object") or {}
+        for entry in root.get("entries", []):
+            if not should_include_file(entry["name"] + ("/" if entry["type"] == "tree" else "")):
+                continue
+            if entry["type"] == "blob":
+                files_seen += 1
+                if readme_bytes is None and entry["name"].lower().startswith("readme"):
+                    readme_bytes = (entry.get("object") or {}).get("byteSize")
+            elif entry["type"] == "tree":
+                for child in (entry.get("object") or {}).get("entries", []):
+                    if child["type"] == "tree":
+                        if should_include_file(f"{entry['name']}/{child['name']}/"):
+                            dirs_unexplored += 1
+                    elif should_include_file(child["name"]):
+                        files_seen += 1
+
+        return {
+            "source": "graphql",
+            "default_branch": (repository.get("defaultBranchRef") or {}).get("name"),
+            "disk_usage_kb": repository.get("diskUsage"),
+            "code_bytes": (repository.get("languages") or {}).get("totalSize"),
+            "readme_bytes": readme_bytes,
+            "files_seen": files_seen,
+            "dirs_unexplored": dirs_unexplored,
+        }
+
+    def _fetch_tree(self, username, repo, tree_ref, recursive=True):
+        """
+        Fetches a single git tree object.
+
+        Args:
+            username (str): The GitHub username or organization name
+            repo (str): The repository name
+            tree_ref (str): A branch name or tree SHA
+            recursive (bool): Whether to ask GitHub for the full recursive listing
+
+        Returns:
+            dict | None: The tree response, or None if it could not be fetched.
+        """
+        api_url = f"{GITHUB_API_URL}/repos/{username}/{repo}/git/trees/{tree_ref}"
+        if recursive:
+            api_url += "?recursive=1"
+        response = self._request("GET", api_url)
+
+        if response.status_code == 200:
+            data = response.json()
+            if "tree" in data:
+                return data
+        return None
+
+    def _walk_truncated_tree(self, username, repo, tree_sha, executor, prefix=""):
+        """
+        Rebuilds the full path list of a tree whose recursive listing was truncated.
+
+        The tree is listed non-recursively, then every included subdirectory is
+        fetched recursively in parallel. Subtrees that are themselves truncated
+        are walked the same way, so only oversized directories cost extra calls.
+
+        Args:
+            username (str): The GitHub username or organization name
+            repo (str): The repository name
+            tree_sha (str): SHA of the tree to walk
+            executor (ThreadPoolExecutor): Pool bounding the request fan-out
+            prefix (str): Path of the tree relative to the repository root
+
+        Returns:
+            list[str]: Every path under the tree, in GitHub's recursive order,
+                       with a trailing slash on directories.
+        """
+        listing = self._fetch_tree(username, repo, tree_sha, recursive=False)
+        if listing is None:
+            raise ValueError(f"Could not fetch subtree '{prefix or '/'}'.")
+
+        # Skip directories whose contents would be filtered out anyway
+        subtrees = {
+            item["path"]: executor.submit(
+                self._fetch_tree, username, repo, item["sha"], True
+            )
+            for item in listing["tree"]
+            if item["type"] == "tree"
+            and should_include_file(f"{prefix}{item['path']}/")
+        }
+
+        paths = []
+        for item in listing["tree"]:
+            path = f"{prefix}{item['path']}"
+            paths.append(_tree_path(path, item))
+            if item["path"] not in subtrees:
+                continue
+
+            subtree = subtrees[item["path"]].result()
+            if subtree is None:
+                raise ValueError(f"Could not fetch subtree '{path}'.")
+            if subtree.get("truncated"):
+                paths.extend(
+                    self._walk_truncated_tree(
+                        username, repo, item["sha"], executor, f"{path}/"
+                    )
+                )
+            else:
+                paths.extend(
+                    _tree_path(f"{path}/{sub['path']}", sub) for sub in subtree["tree"]
+                )
+        return paths
+
+    def _get_tree_paths(self, username, repo, tree_ref, prefix=""):
+        """
+        Lists every path under a branch or tree, falling back to a parallel subtree
+        walk when GitHub truncates the recursive listing of very large repositories.
+
+        Args:
+            tree_ref (str): A branch name or tree SHA
+            prefix (str): Path of the tree relative to the repository root
+
+        Returns:
+            list[str] | None: All paths under the tree with a trailing slash on
+                              directories, or None if it was not found.
+        """
+        data = self._fetch_tree(username, repo, tree_ref)
+        if data is None:
+            return None
+
+        if not data.get("truncated"):
+            return [_tree_path(f"{prefix}{item['path']}", item) for item in data["tree"]]
+
+        print(
+            f"Recursive tree for {username}/{repo}/{prefix} is truncated, walking subtrees with up to {TREE_WALK_MAX_WORKERS} parallel requests"
+        )
+        with ThreadPoolExecutor(max_workers=TREE_WALK_MAX_WORKERS) as executor:
+            return self._walk_truncated_tree(
+                username, repo, data["sha"], executor, prefix
+            )
+
+    @staticmethod
+    def _format_file_tree(paths):
+        # Filter the paths and join them with newlines
+        with timed_stage("filter_tree"):
+            return "\n".join(
+                path
+                for path in (path.rstrip("/") for path in paths)
+                if should_include_file(path)
+            )
+
+    @staticmethod
+    def _format_directories(paths):
+        # The directories among the included paths, which become leaves of the
+        # file tree when everything in them is excluded
+        return "\n".join(
+            path[:-1]
+            for path in paths
+            if path.endswith("/") and should_include_file(path[:-1])
+        )
+
+    def get_file_tree(self, username, repo, ref=None):
         """
         Fetches the file tree of an open-source GitHub repository,
         excluding static files and generated code.
@@ -116,89 +449,193 @@ class GitHubService:
         Args:
             username (str): The GitHub username or organization name
             repo (str): The repository name
+            ref (str | None): Commit SHA or branch to list, defaults to the default branch
+
+        Returns:
+            tuple[str, str]: The filtered file tree, one path per line, and the
+                             paths in it that are directories, one per line.
+        """
+        if ref:
+            branches = [ref]
+        else:
+            # Try the default branch first, then common branch names
+            branches = ["main", "master"]
+            default_branch = self.get_default_branch(username, repo)
+            if default_branch:
+                branches.insert(0, default_branch)
+
+        for branch in branches:
+            paths = self._get_tree_paths(username, repo, branch)
+            if paths is not None:
+                return self._format_file_tree(paths), self._format_directories(paths)
+
+        raise ValueError(
+            "Could not fetch repository file tree. Repository might not exist, be empty or private."
+        )
+
+    def get_github_file_paths_as_list(self, username, repo, ref=None):
+        """
+        Fetches the file tree of an open-source GitHub repository,
+        excluding static files and generated code.
 
         Returns:
             str: A filtered and formatted string of file paths in the repository, one per line.
         """
+        return self.get_file_tree(username, repo, ref)[0]
 
-        def should_include_file(path):
-            # Patterns to exclude
-            excluded_patterns = [
-                # Dependencies
-                "node_modules/",
-                "vendor/",
-                "venv/",
-                # Compiled files
-                ".min.",
-                ".pyc",
-                ".pyo",
-                ".pyd",
-                ".so",
-                ".dll",
-                ".class",
-                # Asset files
-                ".jpg",
-                ".jpeg",
-                ".png",
-                ".gif",
-                ".ico",
-                ".svg",
-                ".ttf",
-                ".woff",
-                ".webp",
-                # Cache and temporary files
-                "__pycache__/",
-                ".cache/",
-                ".tmp/",
-                # Lock files and logs
-                "yarn.lock",
-                "poetry.lock",
-                "*.log",
-                # Configuration files
-                ".vscode/",
-                ".idea/",
-            ]
-
-            return not any(pattern in path.lower() for pattern in excluded_patterns)
-
-        # Try to get the default branch first
-        branch = self.get_default_branch(username, repo)
-        if branch:
-            api_url = f"https://api.github.com/repos/{
-                username}/{repo}/git/trees/{branch}?recursive=1"
-            response = requests.get(api_url, headers=self._get_headers())
+    def resolve_commit(self, username, repo, ref):
+        """
+        Resolves a branch, tag or commit SHA to the full commit SHA.
 
-            if response.status_code == 200:
-                data = response.json()
-                if "tree" in data:
-                    # Filter the paths and join them with newlines
-                    paths = [
-                        item["path"]
-                        for item in data["tree"]
-                        if should_include_file(item["path"])
-                    ]
-                    return "\n".join(paths)
-
-        # If default branch didn't work or wasn't found, try common branch names
-        for branch in ["main", "master"]:
-            api_url = f"https://api.github.com/repos/{
-                username}/{repo}/git/trees/{branch}?recursive=1"
-            response = requests.get(api_url, headers=self._get_headers())
+        Raises:
+            ValueError: If the repository or ref does not exist.
+        """
+        api_url = f"{GITHUB_API_URL}/repos/{username}/{repo}/commits/{ref}"
+        response = self._request("GET", api_url)
+
+        if response.status_code in (404, 422):
+            raise ValueError(f"Could not find ref '{ref}' in {username}/{repo}.")
+        elif response.status_code != 200:
+            raise Exception(
+                f"Failed to resolve ref: {response.status_code}, {response.text}"
+            )
+        return response.json()["sha"]
+
+    def get_subtree_snapshot(self, username, repo, path, commit):
+        """
+        Fetches the file tree of a single directory and its nearest README,
+        so monorepo packages are ingested without listing the whole repository.
+
+        Args:
+            username (str): The GitHub username or organization name
+            repo (str): The repository name
+            path (str): Directory relative to the repository root, without slashes at either end
+            commit (str): Commit SHA to read from
+
+        Returns:
+            dict: "commit", "file_tree" (filtered paths relative to the repository
+                  root, one per line), "directories" (the directories among them)
+                  and "readme" (contents of the README in the directory or its
+                  closest ancestor).
+
+        Raises:
+            ValueError: If the path is not a directory or contains no included files.
+        """
+        # The parent listing carries the directory's tree SHA
+        parent, _, name = path.rpartition("/")
+        response = self._request(
+            "GET",
+            f"{GITHUB_API_URL}/repos/{username}/{repo}/contents/{parent}",
+            params={"ref": commit},
+        )
+        if response.status_code == 404:
+            raise ValueError(f"Path '{path}' not found in {username}/{repo}.")
+        elif response.status_code != 200:
+            raise Exception(
+                f"Failed to list '{parent or '/'}': {response.status_code}, {response.text}"
+            )
+        listing = response.json()
+        tree_sha = next(
+            (
+                item["sha"]
+                for item in (listing if isinstance(listing, list) else [])
+                if item["name"] == name and item["type"] == "dir"
+            ),
+            None,
+        )
+        if tree_sha is None:
+            raise ValueError(f"Path '{path}' is not a directory in {username}/{repo}.")
+
+        paths = self._get_tree_paths(username, repo, tree_sha, f"{path}/")
+        if paths is None:
+            raise ValueError(f"Could not fetch the file tree of '{path}'.")
+        file_tree = self._format_file_tree(paths)
+        if not file_tree:
+            raise ValueError(f"No source files found under '{path}'.")
+
+        return {
+            "commit": commit,
+            "file_tree": file_tree,
+            "directories": self._format_directories(paths),
+            "readme": self.get_nearest_readme(username, repo, path, commit),
+        }
+
+    def get_nearest_readme(self, username, repo, path, ref):
+        """
+        Returns the README of a directory, or of its closest ancestor that has one.
+
+        Raises:
+            ValueError: If neither the directory nor any ancestor has a README.
+        """
+        # GraphQL reads every level's candidates in one round trip instead of
+        # one REST call per level, but it needs authentication
+        if path and self._has_credentials():
+            try:
+                readme = self._read_nearest_readme_graphql(username, repo, path, ref)
+            except Exception as e:
+                print(f"GraphQL README lookup failed, walking directories: {str(e)}")
+                readme = None
+            if readme is not None:
+                return readme
+
+        # README names outside the common spellings, binary READMEs and failed
+        # GraphQL lookups are found level by level
+        directory = path
+        while True:
+            api_url = f"{GITHUB_API_URL}/repos/{username}/{repo}/readme"
+            if directory:
+                api_url += f"/{directory}"
+            response = self._request("GET", api_url, params={"ref": ref})
 
             if response.status_code == 200:
-                data = response.json()
-                if "tree" in data:
-                    # Filter the paths and join them with newlines
-                    paths = [
-                        item["path"]
-                        for item in data["tree"]
-                        if should_include_file(item["path"])
-                    ]
-                    return "\n".join(paths)
+                content = response.json().get("content") or ""
+                return base64.b64decode(content).decode("utf-8", errors="replace")
+            elif response.status_code != 404:
+                raise Exception(
+                    f"Failed to fetch README: {response.status_code}, {response.text}"
+                )
+            if not directory:
+                raise ValueError("No README found for the specified repository.")
+            directory = directory.rpartition("/")[0]
+
+    def _read_nearest_readme_graphql(self, username, repo, path, ref):
+        """
+        Looks up every README candidate of a directory and its ancestors in a
+        single GraphQL query.
 
-        raise ValueError(
-            "Could not fetch repository file tree. Repository might not exist, be empty or private."
+        Returns:
+            str | None: The text of the deepest, most preferred README found, or
+                        None if no candidate exists as a text blob.
+        """
+        from app.services.github_file_reader import GitHubFileReader
+
+        parts = path.split("/")
+        directories = ["/".join(parts[:n]) for n in range(len(parts), -1, -1)]
+        candidates = [
+            f"{directory}/{name}" if directory else name
+            for directory in directories
+            for name in README_NAMES
+        ]
+        variables = {"owner": username, "name": repo}
+        variables.update({f"e{i}": f"{ref}:{candidate}" for i, candidate in enumerate(candidates)})
+        response = self._request(
+            "POST",
+            f"{GITHUB_API_URL}/graphql",
+            json={"query": GitHubFileReader._build_query(len(candidates)), "variables": variables},
         )
+        if response.status_code != 200:
+            raise ValueError(f"GitHub GraphQL API returned status code {response.status_code}")
+        data = response.json()
+        repository = (data.get("data") or {}).get("repository")
+        if repository is None:
+            raise ValueError(f"GitHub GraphQL query failed: {data.get('errors')}")
+
+        # Candidates are ordered deepest directory and preferred name first
+        for i in range(len(candidates)):
+            blob = repository.get(f"f{i}")
+            if blob and not blob.get("isBinary") and not blob.get("isTruncated"):
+                return blob.get("text")
+        return None
 
     def get_github_readme(self, username, repo):
         """
@@ -219,8 +656,8 @@ class GitHubService:
         self._check_repository_exists(username, repo)
 
         # Then attempt to fetch the README
-        api_url = f"https://api.github.com/repos/{username}/{repo}/readme"
-        response = requests.get(api_url, headers=self._get_headers())
+        api_url = f"{GITHUB_API_URL}/repos/{username}/{repo}/readme"
+        response = self._request("GET", api_url)
 
         if response.status_code == 404:
             raise ValueError("No README found for the specified repository.")
@@ -265,8 +702,8 @@ class GitHubService:
                 print(f"Warning: Default branch for {username}/{repo} not found, trying 'main'.")
                 actual_branch = "main" # Or raise ValueError("Could not determine default branch.")
 
-        api_url = f"https://api.github.com/repos/{username}/{repo}/contents/{filepath}?ref={actual_branch}"
-        response = requests.get(api_url, headers=self._get_headers())
+        api_url = f"{GITHUB_API_URL}/repos/{username}/{repo}/contents/{filepath}?ref={actual_branch}"
+        response = self._request("GET", api_url)
 
         if response.status_code == 200:
             data = response.json()
@@ -298,3 +735,101 @@ class GitHubService:
             raise Exception(
                 f"Failed to fetch file {filepath} from {username}/{repo} on branch {actual_branch}. Status: {response.status_code}. Details: {error_details}"
             )
+
+    def get_repository_snapshot(
+        self,
+        username: str,
+        repo: str,
+        ref: str | None = None,
+        max_file_bytes: int = TARBALL_MAX_FILE_BYTES,
+        max_total_bytes: int = TARBALL_MAX_TOTAL_BYTES,
+    ) -> dict:
+        """
+        Downloads the repository tarball once and stream-extracts it in memory,
+        building the file tree, README and a size-bounded index of file contents
+        in a single pass. The archive is never written to disk.
+
+        Args:
+            username (str): The GitHub username or organization name.
+            repo (str): The repository name.
+            ref (str | None): Branch, tag or commit to download. Defaults to the default branch.
+            max_file_bytes (int): Files larger than this are listed but not indexed.
+            max_total_bytes (int): Total size budget for indexed file contents.
+
+        Returns:
+            dict: "commit" (resolved SHA, if GitHub reports it), "file_tree" (filtered
+                  paths, one per line), "directories" (the directories among them),
+                  "readme" (root README contents) and "files" (path -> decoded text
+                  for indexed files).
+
+        Raises:
+            ValueError: If the repository is not found or has no README.
+            Exception: For other unexpected API errors.
+        """
+        api_url = f"{GITHUB_API_URL}/repos/{username}/{repo}/tarball"
+        if ref:
+            api_url += f"/{ref}"
+        response = self._request("GET", api_url, stream=True)
+
+        if response.status_code == 404:
+            raise ValueError("Repository not found.")
+        elif response.status_code != 200:
+            raise Exception(
+                f"Failed to download repository tarball: {response.status_code}, {response.text}"
+            )
+
+        paths = []
+        directories = []
+        files = {}
+        readmes = {}
+        indexed_bytes = 0
+        response.raw.decode_content = True
+        with response, tarfile.open(fileobj=response.raw, mode="r|gz") as archive:
+            for member in archive:
+                # Every entry is nested under a single "{owner}-{repo}-{sha}/" directory
+                _, _, path = member.name.partition("/")
+                if not path or not should_include_file(path):
+                    continue
+                paths.append(path.rstrip("/"))
+                if member.isdir():
+                    directories.append(path.rstrip("/"))
+
+                if not member.isfile():
+                    continue
+                is_readme = "/" not in path and path.lower().startswith("readme")
+                fits_budget = (
+                    member.size <= max_file_bytes
+                    and indexed_bytes + member.size <= max_total_bytes
+                )
+                if not (is_readme or fits_budget):
+                    continue
+
+                content = archive.extractfile(member).read()  # type: ignore
+                if b"\0" in content[:8000]:
+                    continue  # Binary file
+                try:
+                    text = content.decode("utf-8")
+                except UnicodeDecodeError:
+                    continue
+
+                if is_readme:
+                    readmes[path] = text
+                if fits_budget:
+                    files[path] = text
+                    indexed_bytes += member.size
+
+            # GitHub stores the archived commit SHA in the global pax header
+            commit = archive.pax_headers.get("comment")
+
+        if not readmes:
+            raise ValueError("No README found for the specified repository.")
+        # Prefer README.md like GitHub does when several READMEs exist
+        readme_path = min(readmes, key=lambda name: (not name.lower().endswith(".md"), name))
+
+        return {
+            "commit": commit,
+            "file_tree": "\n".join(paths),
+            "directories": "\n".join(directories),
+            "readme": readmes[readme_path],
+            "files": files,
+        }
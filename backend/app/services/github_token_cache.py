@@ -0,0 +1,186 @@
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+import json
+import os
+import stat
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to a per-process cache
+    fcntl = None
+
+# Symlinks planted at the token or lock path are never followed
+O_NOFOLLOW = getattr(os, "O_NOFOLLOW", 0)
+
+
+def default_cache_dir() -> str:
+    """A per-user directory under the temp dir, unless GITHUB_TOKEN_CACHE_DIR is set."""
+    uid = os.getuid() if hasattr(os, "getuid") else "user"
+    return os.getenv("GITHUB_TOKEN_CACHE_DIR") or os.path.join(
+        tempfile.gettempdir(), f"gitdiagram-github-tokens-{uid}"
+    )
+
+
+class InstallationTokenCache:
+    """
+    Caches GitHub App installation tokens for every GitHubService in the process,
+    and across uvicorn workers through a small token file guarded by a file lock.
+    Both live in a private directory (mode 0o700, owned by this user); if it
+    cannot be created or is accessible to others, tokens are cached per process.
+
+    Tokens are kept until shortly before the `expires_at` GitHub returns. Inside
+    the refresh margin the cached token is still served while a background thread
+    fetches a new one, and only one refresh per installation runs at a time.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | None = None,
+        refresh_margin: timedelta = timedelta(minutes=5),
+        min_validity: timedelta = timedelta(seconds=30),
+    ):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.refresh_margin = refresh_margin
+        self.min_validity = min_validity
+        self._entries: dict[str, tuple[str, datetime]] = {}
+        self._locks: dict[str, threading.Lock] = {}
+        self._refreshing: set[str] = set()
+        self._guard = threading.Lock()
+        self._shared: bool | None = None
+
+    def _can_share(self) -> bool:
+        """Creates the private cache directory once, and checks nobody else can use it."""
+        if fcntl is None:
+            return False
+        with self._guard:
+            if self._shared is None:
+                try:
+                    try:
+                        os.mkdir(self.cache_dir, 0o700)
+                    except FileExistsError:
+                        pass
+                    info = os.lstat(self.cache_dir)
+                    if not stat.S_ISDIR(info.st_mode):
+                        raise OSError(f"{self.cache_dir} is not a directory")
+                    if info.st_uid != os.getuid() or info.st_mode & 0o077:
+                        raise OSError(f"{self.cache_dir} is accessible to other users")
+                    self._shared = True
+                except OSError as e:
+                    print(f"GitHub installation tokens are cached per process: {str(e)}")
+                    self._shared = False
+            return self._shared
+
+    def _path(self, installation_id: str) -> str:
+        return os.path.join(
+            self.cache_dir, f"gitdiagram-github-token-{installation_id}.json"
+        )
+
+    def _lock_for(self, installation_id: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(installation_id, threading.Lock())
+
+    def _read_shared(self, installation_id: str) -> tuple[str, datetime] | None:
+        """Reads the token another worker may have stored."""
+        if not self._can_share():
+            return None
+        try:
+            fd = os.open(self._path(installation_id), os.O_RDONLY | O_NOFOLLOW)
+            with os.fdopen(fd) as f:
+                data = json.load(f)
+            return data["token"], datetime.fromisoformat(data["expires_at"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_shared(self, installation_id: str, token: str, expires_at: datetime):
+        """Atomically stores the token for other workers, readable only by us."""
+        if not self._can_share():
+            return
+        # Created with O_EXCL and mode 0o600; the rename replaces a symlink
+        # at the token path rather than following it
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"token": token, "expires_at": expires_at.isoformat()}, f)
+            os.replace(tmp_path, self._path(installation_id))
+        except OSError as e:
+            print(f"Could not share GitHub installation token: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _is_fresh(self, entry: tuple[str, datetime] | None, margin: timedelta):
+        return entry is not None and entry[1] > datetime.now(timezone.utc) + margin
+
+    def _refresh(self, installation_id: str, fetch: Callable[[], dict]) -> str:
+        """Fetches a new token unless another thread or worker just did."""
+        with self._lock_for(installation_id):
+            lock_fd = None
+            if self._can_share():
+                lock_fd = os.open(
+                    self._path(installation_id) + ".lock",
+                    os.O_RDWR | os.O_CREAT | O_NOFOLLOW,
+                    0o600,
+                )
+                fcntl.flock(lock_fd, fcntl.LOCK_EX)  # type: ignore
+            try:
+                entry = self._entries.get(installation_id)
+                if not self._is_fresh(entry, self.refresh_margin):
+                    entry = self._read_shared(installation_id)
+                if not self._is_fresh(entry, self.refresh_margin):
+                    data = fetch()
+                    expires_at = datetime.fromisoformat(data["expires_at"])
+                    entry = (data["token"], expires_at)
+                    self._write_shared(installation_id, *entry)
+                self._entries[installation_id] = entry  # type: ignore
+                return entry[0]  # type: ignore
+            finally:
+                if lock_fd is not None:
+                    fcntl.flock(lock_fd, fcntl.LOCK_UN)  # type: ignore
+                    os.close(lock_fd)
+
+    def _refresh_in_background(self, installation_id: str, fetch: Callable[[], dict]):
+        with self._guard:
+            if installation_id in self._refreshing:
+                return
+            self._refreshing.add(installation_id)
+
+        def run():
+            try:
+                self._refresh(installation_id, fetch)
+            except Exception as e:
+                print(f"Background GitHub token refresh failed: {str(e)}")
+            finally:
+                with self._guard:
+                    self._refreshing.discard(installation_id)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def get_token(self, installation_id: str, fetch: Callable[[], dict]) -> str:
+        """
+        Returns a valid installation token, fetching one only when needed.
+
+        Args:
+            installation_id (str): The GitHub App installation ID
+            fetch (Callable[[], dict]): Requests a new token; returns GitHub's
+                                        response with `token` and `expires_at`
+
+        Returns:
+            str: The installation access token
+        """
+        entry = self._entries.get(installation_id)
+        if not self._is_fresh(entry, self.refresh_margin):
+            entry = self._read_shared(installation_id) or entry
+            if entry is not None:
+                self._entries[installation_id] = entry
+
+        if self._is_fresh(entry, self.refresh_margin):
+            return entry[0]  # type: ignore
+        if self._is_fresh(entry, self.min_validity):
+            # Still usable: serve it and refresh before it actually expires
+            self._refresh_in_background(installation_id, fetch)
+            return entry[0]  # type: ignore
+        return self._refresh(installation_id, fetch)
+
+
+installation_token_cache = InstallationTokenCache()
@@ -0,0 +1,116 @@
+from app.core.state_store import get_state_store
+from typing import NamedTuple
+import math
+import os
+
+# Model every phase used before routing, and the fallback when nothing is configured
+DEFAULT_MODEL = "deepseek/deepseek-chat:free"
+# Longest output of any phase. Learned caps only size the first request: an
+# output that reaches one is continued up to this bound (see
+# OpenAIo4Service.call_o4_api_stream), so they never cut a response short.
+MAX_OUTPUT_TOKENS = 12000
+MIN_OUTPUT_TOKENS = 1500
+# Upper bound of a system prompt and the message framing around the context
+PROMPT_TOKENS = 4000
+
+# Models from fastest to longest context, as "model=context window" in
+# tokens; the last one may leave the window out. Each phase goes to the first
+# model whose window holds its input and output cap.
+MODEL_TIERS = os.getenv("MODEL_TIERS", DEFAULT_MODEL)
+
+# Outputs observed per phase and repository size before their cap is trusted
+MIN_OUTPUT_SAMPLES = 20
+# Cap at this many standard deviations above the mean output, and never
+# below this multiple of the mean
+OUTPUT_CAP_Z = 3.0
+OUTPUT_CAP_MIN_FACTOR = 1.5
+# Outputs that came this close to MAX_OUTPUT_TOKENS may have been cut off and
+# would drag the statistics down, so they are not recorded
+TRUNCATION_SHARE = 0.95
+
+NAMESPACE = "phase_outputs"
+
+
+class PhaseRoute(NamedTuple):
+    model: str
+    max_tokens: int
+
+
+def parse_tiers(spec: str) -> list[tuple[str, int | None]]:
+    """Parses MODEL_TIERS into (model, context window) pairs."""
+    tiers = []
+    for entry in spec.split(","):
+        model, _, window = entry.strip().partition("=")
+        if model:
+            tiers.append((model, int(window) if window else None))
+    return tiers or [(DEFAULT_MODEL, None)]
+
+
+_tiers = parse_tiers(MODEL_TIERS)
+
+
+def size_bucket(context_tokens: int) -> int:
+    """Groups repository contexts by powers of two, from 4k tokens up."""
+    return max(12, math.ceil(math.log2(max(1, context_tokens))))
+
+
+def _stats_key(phase: str, context_tokens: int) -> str:
+    return f"{phase}:{size_bucket(context_tokens)}"
+
+
+def output_cap(phase: str, context_tokens: int) -> int:
+    """
+    Output token cap of a phase for a repository context of `context_tokens`,
+    derived from the outputs observed for similar sizes.
+    """
+    stats = get_state_store().get(NAMESPACE, _stats_key(phase, context_tokens))
+    if not stats or stats["n"] < MIN_OUTPUT_SAMPLES:
+        return MAX_OUTPUT_TOKENS
+    std = math.sqrt(stats["m2"] / (stats["n"] - 1))
+    cap = max(stats["mean"] + OUTPUT_CAP_Z * std, stats["mean"] * OUTPUT_CAP_MIN_FACTOR)
+    return max(MIN_OUTPUT_TOKENS, min(MAX_OUTPUT_TOKENS, math.ceil(cap)))
+
+
+def route_phase(phase: str, context_tokens: int, extra_input_tokens: int = 0) -> PhaseRoute:
+    """
+    Picks the model and output cap of a phase. Learned caps only matter for
+    fitting a phase into a tier's context window, so with a single tier every
+    phase gets MAX_OUTPUT_TOKENS.
+
+    Args:
+        phase (str): Phase name, e.g. "explanation", "mapping" or "diagram"
+        context_tokens (int): Tokens of the repository context the phase sends
+        extra_input_tokens (int): Earlier phases' output the phase also sends
+
+    Returns:
+        PhaseRoute: The model and max_tokens to request
+    """
+    if len(_tiers) == 1:
+        return PhaseRoute(_tiers[0][0], MAX_OUTPUT_TOKENS)
+    max_tokens = output_cap(phase, context_tokens)
+    needed = context_tokens + extra_input_tokens + PROMPT_TOKENS + max_tokens
+    for model, window in _tiers:
+        if window is None or needed <= window:
+            return PhaseRoute(model, max_tokens)
+    # Nothing is large enough; the longest context model truncates least
+    return PhaseRoute(_tiers[-1][0], max_tokens)
+
+
+def record_phase_output(phase: str, context_tokens: int, output_tokens: int):
+    """
+    Records the length of a phase's output as a running mean and variance
+    (Welford) for its repository size. Outputs past a learned cap were
+    continued and count in full; outputs that may have hit MAX_OUTPUT_TOKENS
+    are skipped.
+    """
+    if output_tokens <= 0 or output_tokens >= MAX_OUTPUT_TOKENS * TRUNCATION_SHARE:
+        return
+
+    def add_sample(stats):
+        stats = stats or {"n": 0, "mean": 0.0, "m2": 0.0}
+        n = stats["n"] + 1
+        delta = output_tokens - stats["mean"]
+        mean = stats["mean"] + delta / n
+        return {"n": n, "mean": mean, "m2": stats["m2"] + delta * (output_tokens - mean)}, None
+
+    get_state_store().update(NAMESPACE, _stats_key(phase, context_tokens), add_sample)
@@ -1,28 +1,36 @@
-from openai import OpenAI
-from dotenv import load_dotenv
 from app.utils.format_message import format_user_message
-import tiktoken
+from app.utils.tokenizer import get_encoding
 import os
-import aiohttp
 import json
 from typing import AsyncGenerator, Literal
 
-load_dotenv()
-
 
 class OpenAIo3Service:
     def __init__(self):
-        self.default_client = OpenAI(
-            api_key=os.getenv("OPENROUTER_API_KEY"),
-            base_url="https://openrouter.ai/api/v1/chat/completions",
-            default_headers={
-                "HTTP-Referer": "http://localhost:3000",
-                "X-Title": "GitVisibility",
-            },
-        )
-        self.encoding = tiktoken.get_encoding("o200k_base")  # Encoder for OpenAI models
+        self.api_key = os.getenv("OPENROUTER_API_KEY")
+        self._default_client = None
         self.base_url = "https://openrouter.ai/api/v1/chat/completions" # For streaming
 
+    @property
+    def default_client(self):
+        # The SDK is imported on first use to keep worker startup fast
+        if self._default_client is None:
+            from openai import OpenAI
+
+            self._default_client = OpenAI(
+                api_key=self.api_key,
+                base_url="https://openrouter.ai/api/v1/chat/completions",
+                default_headers={
+                    "HTTP-Referer": "http://localhost:3000",
+                    "X-Title": "GitVisibility",
+                },
+            )
+        return self._default_client
+
+    @property
+    def encoding(self):
+        return get_encoding()
+
     def call_o3_api(
         self,
         system_prompt: str,
@@ -45,6 +53,8 @@ class OpenAIo3Service:
 
         # Use custom client if API key provided, otherwise use default
         if api_key:
+            from openai import OpenAI
+
             client = OpenAI(
                 api_key=api_key,
                 base_url="https://openrouter.ai/api/v1/chat/completions",
@@ -104,7 +114,7 @@ class OpenAIo3Service:
 
         headers = {
             "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key or self.default_client.api_key}",
+            "Authorization": f"Bearer {api_key or self.api_key}",
             "HTTP-Referer": "http://localhost:3000",
             "X-Title": "GitVisibility",
         }
@@ -138,6 +148,8 @@ class OpenAIo3Service:
             "stream": True,
         }
 
+        import aiohttp
+
         try:
             async with aiohttp.ClientSession() as session:
                 async with session.post(
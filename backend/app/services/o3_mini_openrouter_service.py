@@ -1,24 +1,32 @@
-from openai import OpenAI
-from dotenv import load_dotenv
 from app.utils.format_message import format_user_message
-import tiktoken
+from app.utils.tokenizer import get_encoding
 import os
-import aiohttp
 import json
 from typing import Literal, AsyncGenerator
 
-load_dotenv()
-
 
 class OpenRouterO3Service:
     def __init__(self):
-        self.default_client = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=os.getenv("OPENROUTER_API_KEY"),
-        )
-        self.encoding = tiktoken.get_encoding("o200k_base")
+        self.api_key = os.getenv("OPENROUTER_API_KEY")
+        self._default_client = None
         self.base_url = "https://openrouter.ai/api/v1/chat/completions"
 
+    @property
+    def default_client(self):
+        # The SDK is imported on first use to keep worker startup fast
+        if self._default_client is None:
+            from openai import OpenAI
+
+            self._default_client = OpenAI(
+                base_url="https://openrouter.ai/api/v1",
+                api_key=self.api_key,
+            )
+        return self._default_client
+
+    @property
+    def encoding(self):
+        return get_encoding()
+
     def call_o3_api(
         self,
         system_prompt: str,
@@ -41,11 +49,12 @@ class OpenRouterO3Service:
         user_message = format_user_message(data)
 
         # Use custom client if API key provided, otherwise use default
-        client = (
-            OpenAI(base_url="https://openrouter.ai/api/v1", api_key=api_key)
-            if api_key
-            else self.default_client
-        )
+        if api_key:
+            from openai import OpenAI
+
+            client = OpenAI(base_url="https://openrouter.ai/api/v1", api_key=api_key)
+        else:
+            client = self.default_client
 
         completion = client.chat.completions.create(
             extra_headers={
@@ -91,7 +100,7 @@ class OpenRouterO3Service:
         headers = {
             "HTTP-Referer": "https://gitdiagram.com",
             "X-Title": "gitdiagram",
-            "Authorization": f"Bearer {api_key or self.default_client.api_key}",
+            "Authorization": f"Bearer {api_key or self.api_key}",
             "Content-Type": "application/json",
         }
 
@@ -107,6 +116,8 @@ class OpenRouterO3Service:
             "reasoning_effort": reasoning_effort,
         }
 
+        import aiohttp
+
         buffer = ""
         async with aiohttp.ClientSession() as session:
             async with session.post(
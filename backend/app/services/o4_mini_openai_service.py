@@ -1,33 +1,68 @@
-from openai import OpenAI
-from dotenv import load_dotenv
 from app.utils.format_message import format_user_message
-import tiktoken
+from app.core.cpu_executor import run_cpu
+from app.core import profiling
+from app.utils.tokenizer import count_tokens, get_encoding
+from app.utils.sse import DONE, UpstreamStreamError, finish_reason, parse_delta
+from app.services.model_router import DEFAULT_MODEL, MAX_OUTPUT_TOKENS
+import asyncio
 import os
-import aiohttp
-import json
+import random
 from typing import AsyncGenerator, Literal
+import orjson
 
-load_dotenv()
+# A stream that breaks off is resumed this many times, each time after an
+# exponentially growing delay, before the error reaches the caller
+STREAM_RETRIES = int(os.getenv("STREAM_RETRIES", "3"))
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 20.0
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class TransientStreamError(Exception):
+    """A failure of one streaming request that a retry may get past."""
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class OutputCapReached(Exception):
+    """A streaming request ended because it reached its max_completion_tokens."""
 
 
 class OpenAIo4Service:
     def __init__(self):
-        self.default_client = OpenAI(
-            api_key=os.getenv("OPENROUTER_API_KEY"),
-            base_url="https://openrouter.ai/api/v1/chat/completions",
-            default_headers={
-                "HTTP-Referer": "http://localhost:3000",
-                "X-Title": "GitVisibility",
-            },
-        )
-        self.encoding = tiktoken.get_encoding("o200k_base")  # Encoder for OpenAI models
+        self.api_key = os.getenv("OPENROUTER_API_KEY")
+        self._default_client = None
         self.base_url = "https://openrouter.ai/api/v1/chat/completions" # For streaming
 
+    @property
+    def default_client(self):
+        # The SDK is imported on first use to keep worker startup fast
+        if self._default_client is None:
+            from openai import OpenAI
+
+            self._default_client = OpenAI(
+                api_key=self.api_key,
+                base_url="https://openrouter.ai/api/v1/chat/completions",
+                default_headers={
+                    "HTTP-Referer": "http://localhost:3000",
+                    "X-Title": "GitVisibility",
+                },
+            )
+        return self._default_client
+
+    @property
+    def encoding(self):
+        return get_encoding()
+
     def call_o4_api(
         self,
         system_prompt: str,
         data: dict,
         api_key: str | None = None,
+        model: str = DEFAULT_MODEL,
+        max_tokens: int = MAX_OUTPUT_TOKENS,
     ) -> str:
         """
         Makes an API call to OpenRouter and returns the response.
@@ -36,6 +71,8 @@ class OpenAIo4Service:
             system_prompt (str): The instruction/system prompt
             data (dict): Dictionary of variables to format into the user message
             api_key (str | None): Optional custom API key
+            model (str): OpenRouter model to call
+            max_tokens (int): Cap on the response length
 
         Returns:
             str: o4-mini's response text
@@ -45,6 +82,8 @@ class OpenAIo4Service:
 
         # Use custom client if API key provided, otherwise use default
         if api_key:
+            from openai import OpenAI
+
             client = OpenAI(
                 api_key=api_key,
                 base_url="https://openrouter.ai/api/v1/chat/completions",
@@ -58,16 +97,16 @@ class OpenAIo4Service:
 
         try:
             print(
-                f"Making non-streaming API call to deepseek/deepseek-chat:free with API key: {'custom key' if api_key else 'default key'}"
+                f"Making non-streaming API call to {model} with API key: {'custom key' if api_key else 'default key'}"
             )
 
             completion = client.chat.completions.create(
-                model="deepseek/deepseek-chat:free",
+                model=model,
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_message},
                 ],
-                max_completion_tokens=12000,  # Adjust as needed
+                max_completion_tokens=max_tokens,
                 temperature=0.2,
             )
 
@@ -87,24 +126,40 @@ class OpenAIo4Service:
         system_prompt: str,
         data: dict,
         api_key: str | None = None,
+        model: str = DEFAULT_MODEL,
+        max_tokens: int = MAX_OUTPUT_TOKENS,
     ) -> AsyncGenerator[str, None]:
         """
         Makes a streaming API call to OpenRouter and yields the responses.
 
+        Transient failures are retried with backoff. A stream that breaks off
+        partway is resumed from the text received so far rather than started
+        over, so nothing already generated is lost or sent twice. A response
+        that reaches a `max_tokens` below MAX_OUTPUT_TOKENS is continued the
+        same way, up to MAX_OUTPUT_TOKENS in total.
+
         Args:
             system_prompt (str): The instruction/system prompt
             data (dict): Dictionary of variables to format into the user message
             api_key (str | None): Optional custom API key
+            model (str): OpenRouter model to call
+            max_tokens (int): Output cap of the first request
 
         Yields:
             str: Chunks of o4-mini's response text
         """
-        # Create the user message with the data
-        user_message = format_user_message(data)
+        # Create the user message with the data; large file trees are
+        # formatted and serialized off the event loop
+        user_message = await run_cpu(
+            "format_message",
+            format_user_message,
+            data,
+            size=sum(len(str(value)) for value in data.values()),
+        )
 
         headers = {
             "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key or self.default_client.api_key}",
+            "Authorization": f"Bearer {api_key or self.api_key}",
             "HTTP-Referer": "http://localhost:3000",
             "X-Title": "GitVisibility",
         }
@@ -128,59 +183,123 @@ class OpenAIo4Service:
         #     "stream": True,
         # }
 
-        payload = {
-            "model": "deepseek/deepseek-chat:free",
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message},
-            ],
-            "max_completion_tokens": 12000,
-            "stream": True,
-        }
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message},
+        ]
+        partial = ""
+        attempt = 0
+        while True:
+            payload = {
+                "model": model,
+                "messages": messages,
+                "max_completion_tokens": max_tokens,
+                "stream": True,
+            }
+            if partial:
+                # Prefilled assistant message: the model carries on from the
+                # last received token, so the caller sees one continuous text
+                payload["messages"] = messages + [{"role": "assistant", "content": partial}]
+                used = await run_cpu("count_tokens", count_tokens, partial, size=len(partial))
+                payload["max_completion_tokens"] = max(1, max_tokens - used)
+
+            body = await run_cpu("encode_request", orjson.dumps, payload, size=len(user_message))
+            try:
+                async for content in self._stream_completion(headers, body):
+                    partial += content
+                    yield content
+                return
+            except OutputCapReached:
+                if max_tokens >= MAX_OUTPUT_TOKENS:
+                    return
+                # A learned cap was too low for this response
+                print(
+                    f"Output reached its cap of {max_tokens} tokens after {len(partial)} "
+                    f"characters, continuing up to {MAX_OUTPUT_TOKENS}"
+                )
+                profiling.mark("output_cap_continue")
+                max_tokens = MAX_OUTPUT_TOKENS
+            except TransientStreamError as e:
+                attempt += 1
+                if attempt > STREAM_RETRIES:
+                    raise ValueError(f"OpenRouter stream failed after {attempt} attempts: {str(e)}")
+                delay = e.retry_after or RETRY_BASE_DELAY * 2 ** (attempt - 1)
+                delay = min(RETRY_MAX_DELAY, delay) * random.uniform(1, 1.5)
+                print(
+                    f"Stream interrupted after {len(partial)} characters ({str(e)}), "
+                    f"{'continuing' if partial else 'retrying'} in {delay:.1f}s "
+                    f"(attempt {attempt} of {STREAM_RETRIES})"
+                )
+                profiling.mark("stream_retry")
+                await asyncio.sleep(delay)
+
+    async def _stream_completion(self, headers: dict, body: bytes) -> AsyncGenerator[str, None]:
+        """
+        Sends one streaming request and yields its content deltas.
+
+        Raises:
+            TransientStreamError: On failures a retry may get past: connection
+                                  errors, rate limits, server errors and
+                                  streams that break off before [DONE]
+            OutputCapReached: At [DONE], if the response was cut off by
+                              max_completion_tokens
+            ValueError: On errors a retry would repeat, e.g. a rejected key
+        """
+        import aiohttp
 
         try:
             async with aiohttp.ClientSession() as session:
                 async with session.post(
-                    self.base_url, headers=headers, json=payload
+                    self.base_url, headers=headers, data=body
                 ) as response:
 
                     if response.status != 200:
                         error_text = await response.text()
                         print(f"Error response: {error_text}")
-                        raise ValueError(
-                            f"OpenRouter API returned status code {response.status}: {error_text}"
-                        )
+                        message = f"OpenRouter API returned status code {response.status}: {error_text}"
+                        if response.status in RETRYABLE_STATUSES:
+                            retry_after = response.headers.get("Retry-After", "")
+                            raise TransientStreamError(
+                                message,
+                                float(retry_after) if retry_after.isdigit() else None,
+                            )
+                        raise ValueError(message)
 
                     line_count = 0
+                    truncated = False
+                    # Lines stay bytes and are parsed with orjson on this hot path
                     async for line in response.content:
-                        line = line.decode("utf-8").strip()
-                        if not line:
+                        if line.isspace():
                             continue
 
                         line_count += 1
 
-                        if line.startswith("data: "):
-                            if line == "data: [DONE]":
-                                break
-                            try:
-                                data = json.loads(line[6:])
-                                content = (
-                                    data.get("choices", [{}])[0]
-                                    .get("delta", {})
-                                    .get("content")
-                                )
-                                if content:
-                                    yield content
-                            except json.JSONDecodeError as e:
-                                print(f"JSON decode error: {e} for line: {line}")
-                                continue
+                        try:
+                            content = parse_delta(line)
+                        except UpstreamStreamError as e:
+                            raise TransientStreamError(f"Upstream error: {str(e)}")
+                        except ValueError as e:
+                            print(f"JSON decode error: {e} for line: {line!r}")
+                            continue
+                        if content is DONE:
+                            if truncated:
+                                raise OutputCapReached()
+                            return
+                        if content:
+                            yield content
+                        # Cheap byte check first, only the final chunk is parsed again
+                        if b'"length"' in line and finish_reason(line) == "length":
+                            truncated = True
 
                     if line_count == 0:
                         print("Warning: No lines received in stream response")
+                    raise TransientStreamError("Stream ended before [DONE]")
 
-        except aiohttp.ClientError as e:
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             print(f"Connection error: {str(e)}")
-            raise ValueError(f"Failed to connect to OpenRouter API: {str(e)}")
+            raise TransientStreamError(f"OpenRouter connection failed: {str(e)}")
+        except (TransientStreamError, OutputCapReached):
+            raise
         except Exception as e:
             print(f"Unexpected error in streaming API call: {str(e)}")
             raise
@@ -0,0 +1,139 @@
+from app.services.diagram_store import diagram_store
+from typing import NamedTuple
+import argparse
+import hashlib
+import os
+import time
+import orjson
+
+# Precomputed diagrams of the showcase repositories, the most viewed pages.
+# They are generated like any other repository, then bundled from the
+# diagram store with
+#
+#   python -m app.services.showcase rsrini7/gitvisibility rsrini7/aishell ...
+#
+# The bundle is loaded into memory at startup with every response body and
+# ETag computed once, so serving them touches neither the database, GitHub
+# nor the LLM. The repositories in the loaded bundle are the showcase set:
+# the frontend asks for every page it opens and falls back on a 404, and only
+# these repositories are refused regeneration and modification.
+SHOWCASE_BUNDLE_PATH = os.getenv("SHOWCASE_BUNDLE_PATH", "showcase.json")
+BUNDLE_FORMAT = 1
+ARTIFACT_FIELDS = ("diagram", "explanation", "mapping")
+
+
+class ShowcaseEntry(NamedTuple):
+    body: bytes
+    etag: str
+
+
+class ShowcaseStore:
+    """
+    Serialized responses of a loaded bundle, keyed by lowercase "owner/repo".
+
+    ETags are strong: they hash the exact response bytes, and the bundle
+    version is part of them so clients revalidate after every rebuild.
+    """
+
+    def __init__(self):
+        self.version = None
+        self._entries: dict[str, ShowcaseEntry] = {}
+
+    def load(self, path: str) -> int:
+        """
+        Replaces the entries with those of a bundle file.
+
+        Returns:
+            int: Number of repositories loaded, 0 when there is no bundle
+        """
+        try:
+            with open(path, "rb") as f:
+                bundle = orjson.loads(f.read())
+        except FileNotFoundError:
+            print(f"No showcase bundle at {path}, showcase repositories are not served")
+            return 0
+        if bundle.get("format") != BUNDLE_FORMAT:
+            raise ValueError(f"Unsupported showcase bundle format {bundle.get('format')}")
+
+        entries = {}
+        for name, record in bundle["repos"].items():
+            body = orjson.dumps(
+                {
+                    **{field: record[field] for field in ARTIFACT_FIELDS},
+                    "commit": record.get("commit"),
+                    "updated_at": record.get("updated_at"),
+                    "version": bundle["version"],
+                }
+            )
+            digest = hashlib.sha256(body).hexdigest()[:32]
+            entries[name.lower()] = ShowcaseEntry(body, f'"{bundle["version"]}-{digest}"')
+        self._entries = entries
+        self.version = bundle["version"]
+        print(f"Loaded showcase bundle version {self.version} with {len(entries)} repositories")
+        return len(entries)
+
+    def get(self, username: str, repo: str) -> ShowcaseEntry | None:
+        return self._entries.get(f"{username}/{repo}".lower())
+
+
+showcase_store = ShowcaseStore()
+
+
+def is_showcase_repo(username: str, repo: str) -> bool:
+    """Whether a repository is served from the loaded bundle, which cannot be regenerated."""
+    return showcase_store.get(username, repo) is not None
+
+
+def build_bundle(repos: list[str], path: str) -> dict:
+    """
+    Writes a bundle of the latest stored diagrams of `repos` ("owner/repo")
+    to `path`, one version above the bundle already there.
+
+    Returns:
+        dict: The bundle
+    """
+    version = 0
+    try:
+        with open(path, "rb") as f:
+            version = orjson.loads(f.read()).get("version", 0)
+    except FileNotFoundError:
+        pass
+
+    records = {}
+    for name in repos:
+        username, _, repo = name.partition("/")
+        record = diagram_store.get(username, repo)
+        if record is None:
+            raise ValueError(f"No diagram has been generated for {name}")
+        records[name] = {
+            **{field: record[field] for field in ARTIFACT_FIELDS},
+            "commit": record.get("commit"),
+            "updated_at": record.get("updated_at"),
+        }
+
+    bundle = {
+        "format": BUNDLE_FORMAT,
+        "version": version + 1,
+        "created_at": time.time(),
+        "repos": records,
+    }
+    # Written next to the target and renamed, so a running server never
+    # reads a partial file
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(orjson.dumps(bundle))
+    os.replace(temporary, path)
+    return bundle
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the showcase bundle from stored diagrams")
+    parser.add_argument("repos", nargs="+", help="Repositories as owner/repo")
+    parser.add_argument("--out", default=SHOWCASE_BUNDLE_PATH, help="Bundle path")
+    args = parser.parse_args()
+    bundle = build_bundle(args.repos, args.out)
+    print(f"Wrote showcase bundle version {bundle['version']} to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import struct
+import zlib
+
+# Storage format for a generated diagram, explanation and component mapping:
+#
+#   "GDA" | dictionary version (1 byte) | 3 x frame length (uint32, big endian) | frames
+#
+# Each artifact is its own zlib frame compressed against a shared preset
+# dictionary, so readers inflate only the artifact they need and short
+# artifacts still compress well. There is no length limit.
+#
+# The dictionary must stay byte-identical to ARTIFACT_DICTIONARY in
+# src/lib/artifacts.ts; bump DICTIONARY_VERSION on both sides when changing it.
+MAGIC = b"GDA"
+DICTIONARY_VERSION = 1
+FIELDS = ("diagram", "explanation", "mapping")
+HEADER = struct.Struct(">3sBIII")
+
+# Strings the prompts make the model repeat in every result, most frequent
+# last since zlib favours matches near the end of the dictionary
+ARTIFACT_DICTIONARY = (
+    "Project Overview: Key Directories and Files: Overall Structure: "
+    "Key functions/classes: Directory purpose File purpose "
+    "Contains Defines Handles Implements Provides Configures the main "
+    "application entry point API endpoints business logic utility functions "
+    "data models database configuration components services tests "
+    '<component type="file" path="" name="" /> '
+    '<component type="function" path="" name="" parent_file="" /> '
+    '<component type="class" path="" name="" parent_file="" /> '
+    "<component_mapping></component_mapping> "
+    "classDef fileStyle fill:#ECECFF,stroke:#9090D0,stroke-width:2px,color:#000;\n"
+    "classDef functionStyle fill:#D0F0D0,stroke:#70B070,stroke-width:2px,color:#000;\n"
+    "classDef codeClassStyle fill:#FFEDD0,stroke:#D0B070,stroke-width:2px,color:#000;\n"
+    "classDef serviceStyle fill:#E0E0E0,stroke:#A0A0A0,stroke-width:2px,color:#000;\n"
+    'graph TD\n    subgraph sg_src_ ["src/"]\n        direction LR\n    end\n'
+    '    class sg_ fileStyle\n    -->|"calls"| -->|"imports"| -->|"uses"| '
+    ":::functionStyle :::codeClassStyle :::fileStyle "
+    '    click n_ "https://github.com/" /blob/main/ /tree/main/ '
+)
+
+
+def encode_artifacts(diagram: str, explanation: str, mapping: str) -> bytes:
+    """
+    Compresses the three generation artifacts into a single blob.
+
+    Args:
+        diagram (str): Mermaid diagram code
+        explanation (str): Phase-one explanation
+        mapping (str): Component mapping
+
+    Returns:
+        bytes: The encoded blob
+    """
+    frames = []
+    for text in (diagram, explanation, mapping):
+        compressor = zlib.compressobj(
+            level=9, zdict=ARTIFACT_DICTIONARY.encode("utf-8")
+        )
+        frames.append(compressor.compress(text.encode("utf-8")) + compressor.flush())
+    header = HEADER.pack(MAGIC, DICTIONARY_VERSION, *(len(frame) for frame in frames))
+    return header + b"".join(frames)
+
+
+class ArtifactBundle:
+    """
+    Lazy reader for an encoded blob. Only the header is parsed up front, and
+    each artifact is inflated the first time it is accessed.
+    """
+
+    def __init__(self, blob: bytes):
+        if len(blob) < HEADER.size:
+            raise ValueError("Artifact blob is too short")
+        magic, version, *lengths = HEADER.unpack_from(blob)
+        if magic != MAGIC:
+            raise ValueError("Not an artifact blob")
+        if version != DICTIONARY_VERSION:
+            raise ValueError(f"Unsupported artifact dictionary version {version}")
+
+        self._blob = memoryview(blob)
+        self._frames = {}
+        offset = HEADER.size
+        for field, length in zip(FIELDS, lengths):
+            self._frames[field] = (offset, offset + length)
+            offset += length
+        self._decoded: dict[str, str] = {}
+
+    def get(self, field: str) -> str:
+        """Returns one artifact, inflating it on first access."""
+        if field not in self._decoded:
+            start, end = self._frames[field]
+            decompressor = zlib.decompressobj(zdict=ARTIFACT_DICTIONARY.encode("utf-8"))
+            data = decompressor.decompress(self._blob[start:end])
+            self._decoded[field] = data.decode("utf-8")
+        return self._decoded[field]
+
+    @property
+    def diagram(self) -> str:
+        return self.get("diagram")
+
+    @property
+    def explanation(self) -> str:
+        return self.get("explanation")
+
+    @property
+    def mapping(self) -> str:
+        return self.get("mapping")
@@ -0,0 +1,61 @@
+from app.utils.file_tree_index import FileTreeIndex
+import re
+
+# Match click events: click ComponentName "path/to/something"
+CLICK_PATTERN = re.compile(r'click ([^\s"]+)\s+"([^"]+)"')
+
+
+class ClickEventRewriter:
+    """
+    Rewrites the paths in Mermaid click events to full GitHub URLs in a single
+    pass, either over a whole diagram or incrementally as streamed chunks arrive.
+
+    Paths are resolved against the repository's file tree when an index is given,
+    so files without extensions and dotted directories get the right blob/tree
+    URL and hallucinated paths are corrected to the nearest real entry.
+    """
+
+    def __init__(
+        self,
+        username: str,
+        repo: str,
+        branch: str,
+        file_tree_index: FileTreeIndex | None = None,
+    ):
+        self.repo = repo
+        self.file_tree_index = file_tree_index
+        self.blob_url = f"https://github.com/{username}/{repo}/blob/{branch}/"
+        self.tree_url = f"https://github.com/{username}/{repo}/tree/{branch}/"
+        self._pending = ""
+
+    def _url_for(self, raw_path: str) -> str:
+        # The URL always points to the file itself, never to a #fragment
+        path = raw_path.strip("\"'").split("#")[0]
+
+        resolved = None
+        if self.file_tree_index is not None:
+            resolved = self.file_tree_index.resolve(path, self.repo)
+        if resolved is not None:
+            path, is_file = resolved
+        else:
+            # Unknown path: guess from whether the last segment has an extension
+            is_file = "." in path.split("/")[-1]
+        return (self.blob_url if is_file else self.tree_url) + path
+
+    def _replace(self, match: re.Match) -> str:
+        return f'click {match.group(1)} "{self._url_for(match.group(2))}"'
+
+    def feed(self, chunk: str) -> str:
+        """
+        Adds a chunk of diagram text and returns the rewritten complete lines.
+        An unfinished last line is held back until more text or `flush()`.
+        """
+        text = self._pending + chunk
+        cut = text.rfind("\n") + 1
+        self._pending = text[cut:]
+        return CLICK_PATTERN.sub(self._replace, text[:cut]) if cut else ""
+
+    def flush(self) -> str:
+        """Returns the rewritten remainder of the diagram."""
+        text, self._pending = self._pending, ""
+        return CLICK_PATTERN.sub(self._replace, text)
@@ -0,0 +1,124 @@
+from app.utils.file_tree_index import FileTreeIndex
+from typing import NamedTuple
+import orjson
+import re
+
+# Mappings used to be XML-like <component .../> tags. Models occasionally fall
+# back to that format and older stored mappings use it, so it is still read.
+COMPONENT_PATTERN = re.compile(r"<component\b[^>]*?/>")
+ATTRIBUTE_PATTERN = re.compile(r'\b(type|path|name)="([^"]*)"')
+
+
+class Component(NamedTuple):
+    name: str
+    kind: str
+    path: str
+
+
+def render_mapping(components: list[Component]) -> str:
+    """Serializes components as one `["name","kind","path"]` JSON line each."""
+    return "\n".join(orjson.dumps(list(component)).decode() for component in components)
+
+
+class MappingParser:
+    """
+    Builds a component mapping from phase 2 output, either in one pass or
+    incrementally as streamed chunks arrive.
+
+    Each complete line is parsed as soon as it arrives. With a file tree index,
+    paths are resolved against the tree: hallucinated file paths are corrected
+    to the nearest real file and components that match nothing are dropped.
+    Components repeating an earlier path are dropped too.
+    """
+
+    def __init__(self, file_tree_index: FileTreeIndex | None = None, repo: str = ""):
+        self.file_tree_index = file_tree_index
+        self.repo = repo
+        self.components: dict[str, Component] = {}
+        self.rejected = 0
+        self._pending = ""
+
+    def _resolve(self, path: str) -> str | None:
+        path = path.strip().removeprefix("./").strip("/")
+        file_path, _, fragment = path.partition("#")
+        if not file_path:
+            return None
+        if self.file_tree_index is None:
+            return path
+        resolved = self.file_tree_index.resolve(file_path, self.repo)
+        if resolved is None:
+            return None
+        resolved_path, is_file = resolved
+        # A directory only stands in for itself, not for a missing file in it
+        if not is_file and resolved_path.lower() != file_path.lower().removeprefix(
+            f"{self.repo.lower()}/"
+        ):
+            return None
+        return f"{resolved_path}#{fragment}" if fragment else resolved_path
+
+    def _add(self, name: str, kind: str, path: str):
+        resolved = self._resolve(path)
+        if resolved is None:
+            self.rejected += 1
+            return
+        if resolved not in self.components:
+            name = name.strip() or resolved.rpartition("#")[2].rpartition("/")[2]
+            self.components[resolved] = Component(name, kind.strip() or "file", resolved)
+
+    def _parse_line(self, line: str):
+        line = line.strip().rstrip(",")
+        if line.startswith("["):
+            try:
+                fields = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                self.rejected += 1
+                return
+            if (
+                isinstance(fields, list)
+                and len(fields) == 3
+                and all(isinstance(field, str) for field in fields)
+            ):
+                self._add(*fields)
+            else:
+                self.rejected += 1
+            return
+        for tag in COMPONENT_PATTERN.findall(line):
+            attributes = dict(ATTRIBUTE_PATTERN.findall(tag))
+            if "path" in attributes:
+                self._add(
+                    attributes.get("name", ""),
+                    attributes.get("type", ""),
+                    attributes["path"],
+                )
+
+    def feed(self, chunk: str):
+        """Adds a chunk of output. An unfinished last line waits for more text or `flush()`."""
+        text = self._pending + chunk
+        lines = text.split("\n")
+        self._pending = lines.pop()
+        for line in lines:
+            self._parse_line(line)
+
+    def flush(self):
+        """Parses the remainder of the output."""
+        text, self._pending = self._pending, ""
+        self._parse_line(text)
+
+    def text(self) -> str:
+        """The mapping parsed so far, in the compact format."""
+        return render_mapping(list(self.components.values()))
+
+
+def parse_mapping(
+    text: str, file_tree_index: FileTreeIndex | None = None, repo: str = ""
+) -> list[Component]:
+    """
+    Parses a whole mapping, in the compact or the XML-like format.
+
+    Returns:
+        list[Component]: The components in order of appearance
+    """
+    parser = MappingParser(file_tree_index, repo)
+    parser.feed(text)
+    parser.flush()
+    return list(parser.components.values())
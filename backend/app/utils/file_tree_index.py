@@ -0,0 +1,112 @@
+class FileTreeIndex:
+    """
+    Index over a repository's file tree for resolving paths the LLM writes in
+    click events.
+
+    Paths are kept in sets for O(1) exact lookups, in a lowercase map and a
+    basename map for correcting hallucinated paths, and in a trie of path
+    segments for finding the deepest directory that does exist.
+    """
+
+    def __init__(self, file_tree: str, directories: str | None = None):
+        """
+        Args:
+            file_tree (str): Paths of the tree, one per line
+            directories (str | None): The paths among them that are directories,
+                one per line, as listed by GitHub. Without them, leaf entries are
+                taken to be files.
+        """
+        self.files: set[str] = set()
+        self.directories: set[str] = set()
+        self._lowercase: dict[str, str] = {}
+        self._by_name: dict[str, list[str]] = {}
+        self._trie: dict = {}
+
+        paths = [path for path in file_tree.split("\n") if path]
+        for path in paths:
+            node = self._trie
+            parts = path.split("/")
+            for i, part in enumerate(parts[:-1]):
+                self.directories.add("/".join(parts[: i + 1]))
+                node = node.setdefault(part, {})
+            node.setdefault(parts[-1], {})
+
+        # Git does not track empty directories, but a directory whose contents
+        # were all filtered out is a leaf of the filtered tree
+        if directories is not None:
+            self.directories.update(path for path in directories.split("\n") if path)
+        for path in paths:
+            if path not in self.directories:
+                self.files.add(path)
+                self._by_name.setdefault(path.rsplit("/", 1)[-1].lower(), []).append(
+                    path
+                )
+        for path in self.files | self.directories:
+            self._lowercase.setdefault(path.lower(), path)
+
+    def _deepest_directory(self, parts: list[str]) -> str | None:
+        """Walks the trie as far as `parts` exist and returns that directory."""
+        node = self._trie
+        matched = []
+        for part in parts:
+            if part not in node:
+                break
+            node = node[part]
+            matched.append(part)
+        while matched and "/".join(matched) not in self.directories:
+            matched.pop()
+        return "/".join(matched) or None
+
+    def resolve(self, path: str, repo: str = "") -> tuple[str, bool] | None:
+        """
+        Resolves a possibly inaccurate path to an entry of the tree.
+
+        Args:
+            path (str): Path as written in the diagram, without any #fragment
+            repo (str): Repository name, stripped if the LLM prefixed paths with it
+
+        Returns:
+            tuple[str, bool] | None: The resolved path and whether it is a file,
+                                     or None if nothing in the tree is close.
+        """
+        path = path.strip().removeprefix("./").strip("/")
+        if repo and path.startswith(f"{repo}/") and path not in self._lowercase:
+            path = path[len(repo) + 1 :]
+
+        if path in self.files:
+            return path, True
+        if path in self.directories:
+            return path, False
+        exact = self._lowercase.get(path.lower())
+        if exact is not None:
+            return exact, exact in self.files
+
+        # Same file name elsewhere: prefer the candidate sharing the most
+        # trailing, then leading, path segments with what was asked for
+        parts = path.split("/")
+        candidates = self._by_name.get(parts[-1].lower())
+        if candidates:
+
+            def similarity(candidate: str):
+                candidate_parts = candidate.lower().split("/")
+                wanted = [part.lower() for part in parts]
+                suffix = 0
+                while (
+                    suffix < min(len(candidate_parts), len(wanted))
+                    and candidate_parts[-1 - suffix] == wanted[-1 - suffix]
+                ):
+                    suffix += 1
+                prefix = 0
+                while (
+                    prefix < min(len(candidate_parts), len(wanted))
+                    and candidate_parts[prefix] == wanted[prefix]
+                ):
+                    prefix += 1
+                return suffix, prefix, -len(candidate_parts)
+
+            return max(candidates, key=similarity), True
+
+        directory = self._deepest_directory(parts)
+        if directory is not None:
+            return directory, False
+        return None
@@ -23,5 +23,7 @@ def format_user_message(data: dict[str, str]) -> str:
             parts.append(f"<instructions>\n{value}\n</instructions>")
         elif key == "diagram":
             parts.append(f"<diagram>\n{value}\n</diagram>")
+        elif key == "area":
+            parts.append(f"<area>\n{value}\n</area>")
 
     return "\n\n".join(parts)
@@ -0,0 +1,632 @@
+import re
+
+# Words Mermaid's flowchart grammar reserves; using them as node IDs or class
+# names breaks rendering (the prompts warn about `class` in particular)
+RESERVED_WORDS = {
+    "end",
+    "graph",
+    "flowchart",
+    "subgraph",
+    "class",
+    "classdef",
+    "click",
+    "style",
+    "linkstyle",
+    "direction",
+    "call",
+    "href",
+}
+
+HEADER_PATTERN = re.compile(
+    r"^(?:graph|flowchart)(?:\s+(?:TB|TD|BT|RL|LR))?\s*;?$", re.IGNORECASE
+)
+NODE_ID_PATTERN = re.compile(r"[A-Za-z0-9_]+(?:-[A-Za-z0-9_]+)*")
+CLASS_SUFFIX_PATTERN = re.compile(r":::([A-Za-z0-9_\-]+)")
+# Links with an optional |label|, e.g. `-->`, `-.->`, `==>`, `<-->|"calls"|`
+PIPE_LINK_PATTERN = re.compile(
+    r"\s*(<?(?:-{2,}|={2,}|-\.+-)(?:>|[xo](?![A-Za-z0-9_]))?)\s*(?:\|([^|]*)\|)?\s*"
+)
+# Links with inline text, e.g. `-- calls -->`
+TEXT_LINK_PATTERN = re.compile(
+    r"\s*(<?--|<?==|<?-\.)\s+([^-=.|][^|]*?)\s+((?:-{2,}|={2,}|\.-+)(?:>|[xo](?![A-Za-z0-9_]))?)\s*"
+)
+AMPERSAND_PATTERN = re.compile(r"\s*&\s*")
+# Node shape delimiters, longest first so `((` wins over `(`
+SHAPES = [
+    ("(((", ")))"),
+    ("((", "))"),
+    ("([", "])"),
+    ("[[", "]]"),
+    ("[(", ")]"),
+    ("[/", "/]"),
+    ("[\\", "\\]"),
+    ("{{", "}}"),
+    ("[", "]"),
+    ("(", ")"),
+    ("{", "}"),
+    (">", "]"),
+]
+# Characters that must be quoted inside a node or edge label
+SPECIAL_LABEL_CHARACTERS = set('()[]{}<>|#;:"&')
+
+
+class MermaidNode:
+    def __init__(self, node_id: str, label: str | None = None, shape=None):
+        self.id = node_id
+        self.label = label
+        self.shape = shape
+        self.classes: list[str] = []
+
+
+class MermaidEdge:
+    def __init__(self, source: str, target: str, link: str, label: str | None):
+        self.source = source
+        self.target = target
+        self.link = link
+        self.label = label
+
+
+class MermaidDiagram:
+    """Node and edge model of a Mermaid flowchart, plus any problems found while parsing."""
+
+    def __init__(self):
+        self.direction: str | None = None
+        self.nodes: dict[str, MermaidNode] = {}
+        self.edges: list[MermaidEdge] = []
+        self.subgraphs: list[str] = []
+        self.subgraph_labels: dict[str, str] = {}
+        # Node and nested subgraph IDs inside each subgraph, at any depth
+        self.subgraph_members: dict[str, list[str]] = {}
+        self.class_defs: dict[str, str] = {}
+        # Statements that reference nodes, keyed by their line number
+        self.class_assignments: list[tuple[int, str, str]] = []
+        self.clicks: list[tuple[int, str, str]] = []
+        self.styles: list[tuple[int, str]] = []
+        self.errors: list[str] = []
+
+
+def _strip_inline_comment(line: str) -> str:
+    """
+    Removes `%% ...` comments that are not inside quotes, and `/* ... */`
+    comments that are not inside quotes or a node or `|edge|` label, where
+    text like `src/*.py` is common.
+    """
+    result = []
+    in_quotes = False
+    in_pipe_label = False
+    depth = 0
+    i = 0
+    while i < len(line):
+        char = line[i]
+        if char == '"':
+            in_quotes = not in_quotes
+        elif in_quotes:
+            pass
+        elif line.startswith("%%", i):
+            break
+        elif char in "([{":
+            depth += 1
+        elif char in ")]}":
+            depth = max(0, depth - 1)
+        elif char == "|":
+            in_pipe_label = not in_pipe_label
+        elif depth == 0 and not in_pipe_label and line.startswith("/*", i):
+            close = line.find("*/", i + 2)
+            i = len(line) if close == -1 else close + 2
+            continue
+        result.append(char)
+        i += 1
+    return "".join(result).rstrip()
+
+
+def _parse_label(text: str, start: int) -> tuple[str, tuple[str, str], int] | None:
+    """
+    Parses a node shape starting at `start`.
+
+    Returns:
+        tuple | None: (label, (open, close) delimiters, end index) or None if no shape starts here.
+    """
+    for opening, closing in SHAPES:
+        if not text.startswith(opening, start):
+            continue
+        i = start + len(opening)
+        if i < len(text) and text[i] == '"':
+            end_quote = text.find('"', i + 1)
+            if end_quote != -1 and text.startswith(closing, end_quote + 1):
+                return (
+                    text[i : end_quote + 1],
+                    (opening, closing),
+                    end_quote + 1 + len(closing),
+                )
+
+        # Unquoted label: find the closing delimiter outside any nested brackets
+        depth = 0
+        while i < len(text):
+            if depth <= 0 and text.startswith(closing, i):
+                return (
+                    text[start + len(opening) : i],
+                    (opening, closing),
+                    i + len(closing),
+                )
+            if text[i] in "([{":
+                depth += 1
+            elif text[i] in ")]}":
+                depth -= 1
+            i += 1
+        return None
+    return None
+
+
+def _parse_node(text: str, start: int) -> tuple[MermaidNode, int] | None:
+    """Parses `ID`, `ID[label]` or `ID[label]:::class` starting at `start`."""
+    match = NODE_ID_PATTERN.match(text, start)
+    if not match:
+        return None
+    node = MermaidNode(match.group(0))
+    i = match.end()
+    shape = _parse_label(text, i)
+    if shape:
+        node.label, node.shape, i = shape
+    while True:
+        suffix = CLASS_SUFFIX_PATTERN.match(text, i)
+        if not suffix:
+            break
+        node.classes.append(suffix.group(1))
+        i = suffix.end()
+    return node, i
+
+
+def _parse_node_group(text: str, start: int) -> tuple[list[MermaidNode], int] | None:
+    """Parses one or more nodes joined with `&`."""
+    nodes = []
+    i = start
+    while True:
+        while i < len(text) and text[i] == " ":
+            i += 1
+        parsed = _parse_node(text, i)
+        if parsed is None:
+            return None
+        node, i = parsed
+        nodes.append(node)
+        ampersand = AMPERSAND_PATTERN.match(text, i)
+        if not ampersand:
+            return nodes, i
+        i = ampersand.end()
+
+
+def _parse_statement(text: str):
+    """
+    Parses a node or edge chain statement such as `A["x"] -->|calls| B & C`.
+
+    Returns:
+        tuple | None: (node groups, links) where links are (link, label) pairs, or None if unparseable.
+    """
+    groups = []
+    links = []
+    parsed = _parse_node_group(text, 0)
+    if parsed is None:
+        return None
+    group, i = parsed
+    groups.append(group)
+    while i < len(text):
+        # Text links go first: their opening `--`, `==` or `-.` followed by
+        # a space would otherwise be read as a bare link
+        link = TEXT_LINK_PATTERN.match(text, i)
+        if link:
+            # `-- text -->` is the same link as `-->|text|`
+            arrow = link.group(3)
+            if arrow.startswith("."):
+                arrow = "-" + arrow
+            if link.group(1).startswith("<"):
+                arrow = "<" + arrow
+            links.append((arrow, link.group(2)))
+        else:
+            link = PIPE_LINK_PATTERN.match(text, i)
+            if not (link and link.group(1)):
+                break
+            links.append((link.group(1), link.group(2)))
+        parsed = _parse_node_group(text, link.end())
+        if parsed is None:
+            return None
+        group, i = parsed
+        groups.append(group)
+
+    if text[i:].strip(" ;"):
+        return None
+    return groups, links
+
+
+def _needs_quotes(label: str) -> bool:
+    return any(char in SPECIAL_LABEL_CHARACTERS for char in label)
+
+
+def _format_label(label: str) -> str:
+    """Quotes a label when it contains characters Mermaid would misparse."""
+    if label.startswith('"') and label.endswith('"') and len(label) > 1:
+        label = label[1:-1]
+    elif not _needs_quotes(label):
+        return label
+    return '"' + label.replace('"', "#quot;") + '"'
+
+
+def _keyword(line: str) -> str:
+    """Returns the statement keyword; `end` only counts when it stands alone."""
+    keyword = line.split(None, 1)[0].lower()
+    if keyword == "end" and line.strip(" ;").lower() != "end":
+        return ""
+    return keyword
+
+
+def _split_lines(code: str) -> list[str]:
+    """Splits code into statement lines, dropping code fences."""
+    return [line for line in code.split("\n") if not line.strip().startswith("```")]
+
+
+def parse_mermaid(code: str) -> MermaidDiagram:
+    """
+    Parses a Mermaid flowchart into a node and edge model and records syntax
+    errors, undefined references and invalid `classDef` names.
+
+    Args:
+        code (str): Mermaid flowchart code
+
+    Returns:
+        MermaidDiagram: The parsed model; `errors` is empty for a valid diagram.
+    """
+    diagram = MermaidDiagram()
+    open_subgraphs = 0
+    # IDs of the enclosing subgraphs, None for ones without a usable ID
+    subgraph_stack: list[str | None] = []
+    header_seen = False
+    text_before_header = False
+
+    def add_node(node: MermaidNode):
+        existing = diagram.nodes.get(node.id)
+        if existing is None:
+            # Like Mermaid, a node belongs to the subgraph it first appears in
+            for subgraph in subgraph_stack:
+                if subgraph is not None:
+                    diagram.subgraph_members[subgraph].append(node.id)
+            diagram.nodes[node.id] = node
+            return
+        if node.label is not None:
+            existing.label, existing.shape = node.label, node.shape
+        existing.classes.extend(node.classes)
+
+    for number, raw_line in enumerate(_split_lines(code), start=1):
+        line = _strip_inline_comment(raw_line).strip()
+        if not line or raw_line.strip().startswith("%%"):
+            continue
+        keyword = _keyword(line)
+
+        if HEADER_PATTERN.match(line):
+            if header_seen:
+                diagram.errors.append(f"Line {number}: duplicate header")
+            header_seen = True
+            parts = line.rstrip(";").split()
+            diagram.direction = parts[1].upper() if len(parts) > 1 else None
+            continue
+        if not header_seen:
+            if not text_before_header:
+                diagram.errors.append(
+                    f"Line {number}: expected a `graph` or `flowchart` header"
+                )
+                text_before_header = True
+            continue
+
+        if keyword == "subgraph":
+            open_subgraphs += 1
+            title = line[len("subgraph") :].strip()
+            match = NODE_ID_PATTERN.match(title)
+            subgraph = None
+            if match and (match.end() == len(title) or title[match.end()] in ' ["'):
+                subgraph = match.group(0)
+                diagram.subgraphs.append(subgraph)
+                label = title[match.end() :].strip()
+                if label.startswith("[") and label.endswith("]"):
+                    label = label[1:-1].strip()
+                diagram.subgraph_labels[subgraph] = label.strip('"') or subgraph
+                for parent in subgraph_stack:
+                    if parent is not None:
+                        diagram.subgraph_members[parent].append(subgraph)
+                diagram.subgraph_members.setdefault(subgraph, [])
+            subgraph_stack.append(subgraph)
+        elif keyword == "end":
+            open_subgraphs -= 1
+            if open_subgraphs < 0:
+                diagram.errors.append(
+                    f"Line {number}: `end` without a matching `subgraph`"
+                )
+                open_subgraphs = 0
+            if subgraph_stack:
+                subgraph_stack.pop()
+        elif keyword == "direction":
+            continue
+        elif keyword == "classdef":
+            parts = line.split(None, 2)
+            if len(parts) < 3:
+                diagram.errors.append(f"Line {number}: incomplete `classDef`")
+                continue
+            for name in parts[1].split(","):
+                if name.lower() in RESERVED_WORDS:
+                    diagram.errors.append(
+                        f"Line {number}: `classDef {name}` uses a reserved word as a class name"
+                    )
+                diagram.class_defs[name] = parts[2]
+        elif keyword == "class":
+            parts = line.rstrip(";").split()
+            if len(parts) < 3:
+                diagram.errors.append(f"Line {number}: incomplete `class` statement")
+                continue
+            for node_id in parts[1].split(","):
+                diagram.class_assignments.append((number, node_id, parts[2]))
+        elif keyword == "click":
+            parts = line.split(None, 2)
+            if len(parts) < 3:
+                diagram.errors.append(f"Line {number}: incomplete `click` statement")
+                continue
+            diagram.clicks.append((number, parts[1], parts[2]))
+        elif keyword == "style":
+            parts = line.split(None, 2)
+            if len(parts) < 3:
+                diagram.errors.append(f"Line {number}: incomplete `style` statement")
+                continue
+            diagram.styles.append((number, parts[1]))
+        elif keyword == "linkstyle":
+            continue
+        else:
+            statement = _parse_statement(line)
+            if statement is None:
+                diagram.errors.append(f"Line {number}: could not parse `{line}`")
+                continue
+            groups, links = statement
+            for group in groups:
+                for node in group:
+                    if node.id.lower() in RESERVED_WORDS:
+                        diagram.errors.append(
+                            f"Line {number}: node ID `{node.id}` is a reserved word"
+                        )
+                    if (
+                        node.label is not None
+                        and _format_label(node.label) != node.label
+                    ):
+                        diagram.errors.append(
+                            f"Line {number}: label of `{node.id}` has special characters and must be quoted"
+                        )
+                    add_node(node)
+            for (link, label), sources, targets in zip(links, groups, groups[1:]):
+                if label is not None and _format_label(label.strip()) != label.strip():
+                    diagram.errors.append(
+                        f"Line {number}: edge label `{label}` has special characters and must be quoted"
+                    )
+                for source in sources:
+                    for target in targets:
+                        diagram.edges.append(
+                            MermaidEdge(source.id, target.id, link, label)
+                        )
+
+    if not header_seen and not text_before_header:
+        diagram.errors.append("Diagram is empty")
+    elif not header_seen:
+        diagram.errors.append("Diagram has no `graph` or `flowchart` header")
+    if open_subgraphs > 0:
+        diagram.errors.append(f"{open_subgraphs} `subgraph` block(s) are missing `end`")
+
+    defined = set(diagram.nodes) | set(diagram.subgraphs)
+    for number, node_id, class_name in diagram.class_assignments:
+        if node_id not in defined:
+            diagram.errors.append(
+                f"Line {number}: `class` references undefined node `{node_id}`"
+            )
+        if class_name not in diagram.class_defs:
+            diagram.errors.append(
+                f"Line {number}: class `{class_name}` has no `classDef`"
+            )
+    for number, node_id, _ in diagram.clicks:
+        if node_id not in defined:
+            diagram.errors.append(
+                f"Line {number}: `click` references undefined node `{node_id}`"
+            )
+    for number, node_id in diagram.styles:
+        if node_id not in defined:
+            diagram.errors.append(
+                f"Line {number}: `style` references undefined node `{node_id}`"
+            )
+    for node in diagram.nodes.values():
+        for class_name in node.classes:
+            if class_name not in diagram.class_defs:
+                diagram.errors.append(
+                    f"Node `{node.id}` uses class `{class_name}` which has no `classDef`"
+                )
+    return diagram
+
+
+def validate_mermaid(code: str) -> list[str]:
+    """
+    Validates a Mermaid flowchart.
+
+    Args:
+        code (str): Mermaid flowchart code
+
+    Returns:
+        list[str]: Human-readable problems; empty when the diagram is valid.
+    """
+    return parse_mermaid(code).errors
+
+
+def _rename(name: str, renames: dict[str, str]) -> str:
+    return renames.get(name, name)
+
+
+def _statement_needs_repair(
+    groups, links, node_renames, class_renames, class_defs
+) -> bool:
+    """Checks whether a statement has labels to quote or IDs/classes to fix."""
+    labels = [label.strip() for _, label in links if label is not None]
+    for group in groups:
+        for node in group:
+            if node.id in node_renames:
+                return True
+            if any(
+                _rename(name, class_renames) != name or name not in class_defs
+                for name in node.classes
+            ):
+                return True
+            if node.label is not None:
+                labels.append(node.label)
+    return any(_format_label(label) != label for label in labels)
+
+
+def _format_statement(groups, links, node_renames, class_renames, class_defs) -> str:
+    """Re-emits a parsed statement with quoted labels and renamed IDs/classes."""
+
+    def format_node(node: MermaidNode) -> str:
+        text = _rename(node.id, node_renames)
+        if node.label is not None:
+            opening, closing = node.shape
+            text += f"{opening}{_format_label(node.label)}{closing}"
+        for class_name in node.classes:
+            class_name = _rename(class_name, class_renames)
+            if class_name in class_defs:
+                text += f":::{class_name}"
+        return text
+
+    parts = [" & ".join(format_node(node) for node in groups[0])]
+    for (link, label), group in zip(links, groups[1:]):
+        label_text = f"|{_format_label(label.strip())}|" if label is not None else ""
+        parts.append(
+            f" {link}{label_text} " + " & ".join(format_node(node) for node in group)
+        )
+    return "".join(parts)
+
+
+def repair_mermaid(code: str) -> tuple[str, list[str]]:
+    """
+    Fixes the mistakes LLMs commonly make in Mermaid flowcharts: code fences and
+    prose around the diagram, a missing header, unquoted labels with special
+    characters, reserved words as class names or node IDs, inline comments,
+    unbalanced `subgraph`/`end`, and references to undefined nodes or classes.
+
+    Args:
+        code (str): Mermaid flowchart code
+
+    Returns:
+        tuple[str, list[str]]: The repaired code and a description of each fix applied.
+    """
+    fixes = []
+    lines = _split_lines(code)
+    if len(lines) != len(code.split("\n")):
+        fixes.append("removed code fences")
+
+    # Drop any prose before the header
+    header_index = next(
+        (
+            i
+            for i, line in enumerate(lines)
+            if HEADER_PATTERN.match(_strip_inline_comment(line).strip())
+        ),
+        None,
+    )
+    if header_index is None:
+        lines.insert(0, "flowchart TD")
+        fixes.append("added missing flowchart header")
+    elif any(
+        line.strip() and not line.strip().startswith("%%")
+        for line in lines[:header_index]
+    ):
+        lines = lines[header_index:]
+        fixes.append("removed text before the flowchart header")
+
+    diagram = parse_mermaid("\n".join(lines))
+
+    # Rename reserved class names and node IDs everywhere they are used
+    class_renames = {
+        name: f"{name}Style"
+        for name in diagram.class_defs
+        if name.lower() in RESERVED_WORDS
+    }
+    node_renames = {
+        node_id: f"{node_id}_node"
+        for node_id in diagram.nodes
+        if node_id.lower() in RESERVED_WORDS
+    }
+    for old, new in {**class_renames, **node_renames}.items():
+        fixes.append(f"renamed reserved word `{old}` to `{new}`")
+    class_defs = {_rename(name, class_renames) for name in diagram.class_defs}
+    defined = {_rename(node_id, node_renames) for node_id in diagram.nodes} | set(
+        diagram.subgraphs
+    )
+
+    repaired = []
+    open_subgraphs = 0
+    for line in lines:
+        stripped = line.strip()
+        indent = line[: len(line) - len(line.lstrip())]
+        if not stripped or stripped.startswith("%%") or HEADER_PATTERN.match(stripped):
+            repaired.append(line)
+            continue
+
+        text = _strip_inline_comment(stripped)
+        if text != stripped:
+            fixes.append("removed inline comment")
+        if not text:
+            continue
+        keyword = _keyword(text)
+
+        if keyword == "subgraph":
+            open_subgraphs += 1
+        elif keyword == "end":
+            if open_subgraphs == 0:
+                fixes.append("removed unmatched `end`")
+                continue
+            open_subgraphs -= 1
+        elif keyword == "classdef":
+            parts = text.split(None, 2)
+            if len(parts) == 3:
+                names = ",".join(
+                    _rename(name, class_renames) for name in parts[1].split(",")
+                )
+                text = f"{parts[0]} {names} {parts[2]}"
+        elif keyword == "class":
+            parts = text.rstrip(";").split()
+            if len(parts) >= 3:
+                class_name = _rename(parts[2], class_renames)
+                node_ids = [
+                    _rename(node_id, node_renames)
+                    for node_id in parts[1].split(",")
+                    if _rename(node_id, node_renames) in defined
+                ]
+                if class_name not in class_defs or not node_ids:
+                    fixes.append(
+                        f"removed `class` statement for undefined class or nodes: `{text}`"
+                    )
+                    continue
+                text = f"class {','.join(node_ids)} {class_name}"
+        elif keyword in ("click", "style"):
+            parts = text.split(None, 2)
+            if len(parts) == 3:
+                node_id = _rename(parts[1], node_renames)
+                if node_id not in defined:
+                    fixes.append(f"removed `{keyword}` for undefined node `{parts[1]}`")
+                    continue
+                text = f"{parts[0]} {node_id} {parts[2]}"
+        elif keyword not in ("direction", "linkstyle"):
+            statement = _parse_statement(text)
+            if statement is not None and _statement_needs_repair(
+                *statement, node_renames, class_renames, class_defs
+            ):
+                formatted = _format_statement(
+                    *statement, node_renames, class_renames, class_defs
+                )
+                fixes.append(f"rewrote `{text}` as `{formatted}`")
+                text = formatted
+
+        repaired.append(indent + text)
+
+    if open_subgraphs:
+        while repaired and not repaired[-1].strip():
+            repaired.pop()
+        repaired.extend(["end"] * open_subgraphs)
+        fixes.append(f"closed {open_subgraphs} unterminated subgraph(s)")
+
+    return "\n".join(repaired).strip() + "\n", fixes
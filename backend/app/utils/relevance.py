@@ -0,0 +1,237 @@
+from app.utils.token_packer import count_by_directory, summarize_paths, tree_line_order
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from functools import lru_cache
+import math
+import re
+
+# BM25 parameters; paths are short, so length normalization is kept mild
+BM25_K1 = 1.2
+BM25_B = 0.5
+# Query terms that only match a path token by prefix count for less
+PREFIX_MATCH_WEIGHT = 0.7
+# Share of a directory's best file score its other files inherit
+DIRECTORY_PROPAGATION = 0.3
+
+# Trees smaller than this are sent whole; pruning would save little
+MIN_PRUNE_PATHS = 300
+MAX_FOCUSED_PATHS = 1500
+# Paths scoring below this share of the best match are collapsed
+RELATIVE_SCORE_CUTOFF = 0.2
+MAX_SUMMARY_LINES = 200
+
+TOKEN_SPLIT_PATTERN = re.compile(r"[^A-Za-z0-9]+")
+CAMEL_CASE_PATTERN = re.compile(r"(?<=[a-z])(?=[A-Z])|(?<=[A-Za-z])(?=[0-9])")
+
+# Words in instructions that say what to draw rather than where to look
+STOPWORDS = {
+    "a",
+    "an",
+    "and",
+    "are",
+    "as",
+    "at",
+    "be",
+    "by",
+    "for",
+    "from",
+    "how",
+    "in",
+    "into",
+    "is",
+    "it",
+    "its",
+    "of",
+    "on",
+    "or",
+    "the",
+    "this",
+    "that",
+    "to",
+    "with",
+    "only",
+    "just",
+    "all",
+    "more",
+    "less",
+    "please",
+    "show",
+    "focus",
+    "focusing",
+    "highlight",
+    "include",
+    "including",
+    "diagram",
+    "draw",
+    "make",
+    "detail",
+    "details",
+    "detailed",
+    "flow",
+    "flows",
+    "part",
+    "parts",
+    "code",
+    "file",
+    "files",
+    "folder",
+    "directory",
+    "module",
+    "modules",
+    "component",
+    "components",
+    "repo",
+    "repository",
+    "project",
+}
+
+
+def tokenize(text: str) -> list[str]:
+    """Splits paths or prose into lowercase terms, including camelCase parts."""
+    terms = []
+    for word in TOKEN_SPLIT_PATTERN.split(text):
+        for part in CAMEL_CASE_PATTERN.split(word):
+            if len(part) > 1:
+                terms.append(part.lower())
+    return terms
+
+
+class PathIndex:
+    """
+    BM25 index over the tokens of every file path in a tree, so a set of
+    instructions can be matched against the tree without re-tokenizing it.
+
+    Built once per tree and reused for every instruction variant.
+    """
+
+    def __init__(self, file_tree: str):
+        self.paths = [path for path in file_tree.split("\n") if path]
+        directories = {path.rpartition("/")[0] for path in self.paths}
+        # Only files are scored; directories get the scores of their files
+        self.files = [i for i, path in enumerate(self.paths) if path not in directories]
+        self.parent_files: dict[str, list[int]] = defaultdict(list)
+        self.postings: dict[str, list[tuple[int, int]]] = defaultdict(list)
+        self.lengths: dict[int, int] = {}
+
+        # Directory names repeat across thousands of paths, tokenize each once
+        segment_terms: dict[str, list[str]] = {}
+        for i in self.files:
+            path = self.paths[i]
+            directory, _, name = path.rpartition("/")
+            self.parent_files[directory].append(i)
+            terms = []
+            for segment in path.split("/"):
+                if segment not in segment_terms:
+                    segment_terms[segment] = tokenize(segment)
+                terms.extend(segment_terms[segment])
+            # The file name counts twice, it says the most about the file
+            terms.extend(segment_terms[name])
+            self.lengths[i] = len(terms)
+            for term, count in Counter(terms).items():
+                self.postings[term].append((i, count))
+        self.average_length = sum(self.lengths.values()) / max(1, len(self.files))
+        # Sorted for prefix lookups with bisect
+        self.vocabulary = sorted(self.postings)
+
+    def _expand(self, term: str) -> list[tuple[str, float]]:
+        """Path terms matching a query term exactly or by prefix ("auth", "authentication")."""
+        matches = [(term, 1.0)] if term in self.postings else []
+        # Longer path terms starting with the query term
+        if len(term) >= 3:
+            i = bisect_right(self.vocabulary, term)
+            while i < len(self.vocabulary) and self.vocabulary[i].startswith(term):
+                matches.append((self.vocabulary[i], PREFIX_MATCH_WEIGHT))
+                i += 1
+        # Shorter path terms the query term starts with
+        for length in range(4, len(term)):
+            if term[:length] in self.postings:
+                matches.append((term[:length], PREFIX_MATCH_WEIGHT))
+        return matches
+
+    def score(self, query: str) -> dict[int, float]:
+        """
+        Scores files against a query, with each file also inheriting part of
+        the best score in its directory.
+
+        Returns:
+            dict[int, float]: Path index -> score, for files with a positive score
+        """
+        terms = {term for term in tokenize(query) if term not in STOPWORDS}
+        scores: dict[int, float] = defaultdict(float)
+        total = len(self.files)
+        for term in terms:
+            for candidate, weight in self._expand(term):
+                postings = self.postings[candidate]
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for i, count in postings:
+                    norm = 1 - BM25_B + BM25_B * self.lengths[i] / self.average_length
+                    scores[i] += (
+                        weight * idf * count * (BM25_K1 + 1) / (count + BM25_K1 * norm)
+                    )
+
+        # Siblings of matching files are likely part of the same feature
+        best_in_directory: dict[str, float] = {}
+        for i, value in scores.items():
+            directory = self.paths[i].rpartition("/")[0]
+            best_in_directory[directory] = max(best_in_directory.get(directory, 0.0), value)
+        for directory, best in best_in_directory.items():
+            for i in self.parent_files[directory]:
+                scores[i] += DIRECTORY_PROPAGATION * best
+        return scores
+
+
+@lru_cache(maxsize=32)
+def _path_index(file_tree: str) -> PathIndex:
+    return PathIndex(file_tree)
+
+
+def prune_file_tree(file_tree: str, instructions: str) -> str:
+    """
+    Narrows a file tree to the paths relevant to custom instructions. The
+    best-scoring files and all root-level entries are kept, and everything
+    else is collapsed into per-directory summaries with entry counts.
+
+    Args:
+        file_tree (str): Paths separated by newlines
+        instructions (str): The user's instructions
+
+    Returns:
+        str: The pruned tree, or the tree unchanged when it is small or
+             nothing in it matches the instructions
+    """
+    index = _path_index(file_tree)
+    if len(index.paths) < MIN_PRUNE_PATHS:
+        return file_tree
+    scores = index.score(instructions)
+    if not scores:
+        return file_tree
+
+    cutoff = max(scores.values()) * RELATIVE_SCORE_CUTOFF
+    ranked = sorted(
+        (i for i, value in scores.items() if value >= cutoff),
+        key=scores.__getitem__,
+        reverse=True,
+    )
+    kept = set(ranked[:MAX_FOCUSED_PATHS])
+    # Root-level entries keep the overall layout visible
+    kept.update(i for i, path in enumerate(index.paths) if "/" not in path)
+    # Directories leading to kept files stay, so nothing appears orphaned
+    kept_directories = set()
+    for i in kept:
+        parts = index.paths[i].split("/")[:-1]
+        kept_directories.update("/".join(parts[: n + 1]) for n in range(len(parts)))
+    kept.update(i for i, path in enumerate(index.paths) if path in kept_directories)
+
+    dropped = count_by_directory(
+        [path for i, path in enumerate(index.paths) if i not in kept]
+    )
+    depth = max((directory.count("/") + 1 for directory in dropped if directory), default=0)
+    summaries = summarize_paths(dropped, depth)
+    while len(summaries) > MAX_SUMMARY_LINES and depth > 0:
+        depth -= 1
+        summaries = summarize_paths(dropped, depth)
+
+    lines = [index.paths[i] for i in sorted(kept)]
+    lines.extend(summaries)
+    lines.sort(key=tree_line_order)
+    return "\n".join(lines)
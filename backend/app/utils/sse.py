@@ -0,0 +1,79 @@
+import orjson
+
+# Server-sent event framing for the generation stream. Frames are built as
+# bytes so the token hot path never round-trips through str and the stdlib
+# json module.
+DATA_PREFIX = b"data: "
+DONE_LINE = b"data: [DONE]"
+FRAME_END = b"\n\n"
+
+# Marks the end of an upstream stream, distinct from a line without content
+DONE = object()
+
+
+class UpstreamStreamError(Exception):
+    """An error the upstream reported inside an already started stream."""
+
+
+def parse_delta(line: bytes):
+    """
+    Extracts the content delta from one upstream OpenAI-compatible SSE line.
+
+    Args:
+        line (bytes): A raw line from the response body, newline included
+
+    Returns:
+        str | None | DONE: The delta text, None for lines without content
+                           (comments, role or finish chunks), or DONE
+
+    Raises:
+        UpstreamStreamError: If the line reports an error, e.g. the provider
+                             failed partway through the response
+    """
+    line = line.strip()
+    if not line.startswith(DATA_PREFIX):
+        return None
+    if line == DONE_LINE:
+        return DONE
+    data = orjson.loads(line[6:])
+    if data.get("error"):
+        error = data["error"]
+        raise UpstreamStreamError(
+            error.get("message", str(error)) if isinstance(error, dict) else str(error)
+        )
+    choices = data.get("choices")
+    if not choices:
+        return None
+    return (choices[0].get("delta") or {}).get("content") or None
+
+
+def finish_reason(line: bytes) -> str | None:
+    """
+    Returns the finish reason of one upstream SSE line, None for every chunk
+    but the last. Parses the line again, so callers only pass lines that can
+    hold the reason they look for.
+    """
+    line = line.strip()
+    if not line.startswith(DATA_PREFIX) or line == DONE_LINE:
+        return None
+    choices = orjson.loads(line[6:]).get("choices")
+    return choices[0].get("finish_reason") if choices else None
+
+
+def sse_event(payload: dict) -> bytes:
+    """Encodes a dict as one `data:` frame."""
+    return DATA_PREFIX + orjson.dumps(payload) + FRAME_END
+
+
+class ChunkFrame:
+    """
+    Preallocated frame template for `{"status": <status>, "chunk": <text>}`
+    events, so each token only costs one string encode and a concatenation.
+    """
+
+    def __init__(self, status: str):
+        self._head = DATA_PREFIX + b'{"status":' + orjson.dumps(status) + b',"chunk":'
+        self._tail = b"}" + FRAME_END
+
+    def __call__(self, chunk: str) -> bytes:
+        return self._head + orjson.dumps(chunk) + self._tail
@@ -0,0 +1,310 @@
+import re
+from collections import Counter
+
+# File names that usually mark an entry point or central configuration
+ENTRY_POINT_NAMES = {
+    "main",
+    "index",
+    "app",
+    "server",
+    "cli",
+    "__init__",
+    "__main__",
+    "manage",
+    "setup",
+    "mod",
+    "lib",
+    "package.json",
+    "pyproject.toml",
+    "cargo.toml",
+    "go.mod",
+    "pom.xml",
+    "build.gradle",
+    "dockerfile",
+    "docker-compose.yml",
+    "makefile",
+}
+
+SOURCE_EXTENSIONS = {
+    ".py",
+    ".js",
+    ".jsx",
+    ".ts",
+    ".tsx",
+    ".go",
+    ".rs",
+    ".java",
+    ".kt",
+    ".rb",
+    ".php",
+    ".c",
+    ".h",
+    ".cc",
+    ".cpp",
+    ".hpp",
+    ".cs",
+    ".swift",
+    ".scala",
+    ".ex",
+    ".exs",
+    ".vue",
+    ".svelte",
+    ".sql",
+    ".proto",
+    ".graphql",
+}
+DOC_EXTENSIONS = {".md", ".mdx", ".rst", ".txt", ".adoc"}
+TEST_DIR_NAMES = {"test", "tests", "__tests__", "spec", "specs", "e2e", "testing"}
+DOC_DIR_NAMES = {"docs", "doc", "documentation", "examples", "example", "samples"}
+
+# README sections worth keeping first, and ones that rarely describe the architecture
+IMPORTANT_SECTION_WORDS = (
+    "overview",
+    "architecture",
+    "structure",
+    "design",
+    "how it works",
+    "features",
+    "usage",
+    "getting started",
+    "about",
+    "introduction",
+)
+UNIMPORTANT_SECTION_WORDS = (
+    "license",
+    "contributing",
+    "contributors",
+    "changelog",
+    "acknowledg",
+    "sponsor",
+    "backers",
+    "support",
+    "star history",
+    "citation",
+    "faq",
+)
+
+# Share of the budget held for the README before the file tree is packed
+README_BUDGET_SHARE = 0.25
+# Share of the tree budget reserved for collapsed directory summaries
+SUMMARY_BUDGET_SHARE = 0.1
+
+HEADING_PATTERN = re.compile(r"^#{1,6}\s", re.MULTILINE)
+
+
+def score_path(path: str, is_directory: bool) -> float:
+    """
+    Scores a tree entry by structural importance. Shallow paths, entry points
+    and source files rank above tests, docs and deeply nested files.
+
+    Args:
+        path (str): Path relative to the repository root
+        is_directory (bool): Whether the entry is a directory
+
+    Returns:
+        float: Higher scores are kept first
+    """
+    parts = path.lower().split("/")
+    depth = len(parts) - 1
+    name = parts[-1]
+    stem, dot, extension = name.rpartition(".")
+    if not stem:
+        # Dotfiles and extensionless names have no extension
+        stem, extension = name, ""
+    else:
+        extension = dot + extension
+
+    score = 10.0 - depth * 1.5
+    if is_directory:
+        score += 4.0
+    elif name in ENTRY_POINT_NAMES or stem in ENTRY_POINT_NAMES:
+        score += 5.0
+    elif extension in SOURCE_EXTENSIONS:
+        score += 2.0
+    elif extension in DOC_EXTENSIONS:
+        score -= 2.0
+
+    directories = parts[:-1] if not is_directory else parts
+    if (
+        not TEST_DIR_NAMES.isdisjoint(directories)
+        or ".test." in name
+        or ".spec." in name
+        or name.startswith("test_")
+    ):
+        score -= 4.0
+    elif not DOC_DIR_NAMES.isdisjoint(directories):
+        score -= 3.0
+    return score
+
+
+def _count_each(encoding, texts: list[str]) -> list[int]:
+    """Counts the tokens of every text in one batched tokenizer call."""
+    return [len(tokens) for tokens in encoding.encode_ordinary_batch(texts)]
+
+
+def count_by_directory(paths: list[str]) -> Counter:
+    """Counts paths per parent directory, the input of `summarize_paths`."""
+    return Counter(path.rpartition("/")[0] for path in paths)
+
+
+def summarize_paths(directory_counts: Counter, depth: int) -> list[str]:
+    """
+    Collapses dropped paths, counted per parent directory, into one summary
+    line per ancestor directory at `depth`. Works on the counts so trying
+    several depths does not rescan every path.
+    """
+    counts = Counter()
+    for directory, count in directory_counts.items():
+        counts["/".join(directory.split("/")[:depth])] += count
+    return [
+        f"{directory + '/' if directory else ''}... ({count} more {'entry' if count == 1 else 'entries'})"
+        for directory, count in counts.items()
+    ]
+
+
+def tree_line_order(line: str) -> str:
+    """Sort key placing each summary line after the kept paths of its directory."""
+    return line.replace("... (", "\uffff", 1)
+
+
+def pack_file_tree(file_tree: str, budget: int, encoding) -> tuple[str, int]:
+    """
+    Fits a newline-separated file tree into a token budget. The highest-scoring
+    paths are kept and the rest are collapsed into per-directory summaries with
+    entry counts.
+
+    Each path is tokenized once, so packing stays linear in the number of paths
+    instead of re-encoding the whole tree after every decision.
+
+    Args:
+        file_tree (str): Paths separated by newlines
+        budget (int): Maximum number of tokens for the packed tree
+        encoding: A tiktoken encoding
+
+    Returns:
+        tuple[str, int]: The packed tree and its approximate token count
+    """
+    paths = file_tree.split("\n") if file_tree else []
+    # Each line also costs roughly one token for its newline
+    costs = [count + 1 for count in _count_each(encoding, paths)]
+    if sum(costs) <= budget:
+        return file_tree, sum(costs)
+
+    directories = {path.rpartition("/")[0] for path in paths}
+    ranked = sorted(
+        range(len(paths)),
+        key=lambda i: score_path(paths[i], paths[i] in directories),
+        reverse=True,
+    )
+
+    path_budget = int(budget * (1 - SUMMARY_BUDGET_SHARE))
+    kept = set()
+    used = 0
+    for i in ranked:
+        if used + costs[i] <= path_budget:
+            kept.add(i)
+            used += costs[i]
+
+    # Summarize dropped entries by their parent directory, collapsing to
+    # shallower ancestors until the summaries fit in what is left
+    dropped = count_by_directory(
+        [paths[i] for i in range(len(paths)) if i not in kept]
+    )
+    depth = max((directory.count("/") + 1 for directory in dropped if directory), default=0)
+    while True:
+        summaries = summarize_paths(dropped, depth)
+        summary_tokens = sum(count + 1 for count in _count_each(encoding, summaries))
+        if used + summary_tokens <= budget or depth == 0:
+            break
+        depth -= 1
+
+    lines = [paths[i] for i in sorted(kept)]
+    lines.extend(summaries)
+    lines.sort(key=tree_line_order)
+    return "\n".join(lines), used + summary_tokens
+
+
+def _section_score(section: str, position: int) -> float:
+    """Scores a README section; the intro and architecture sections rank first."""
+    if position == 0:
+        return 100.0
+    heading = section.split("\n", 1)[0].lower()
+    score = 10.0 - position * 0.1
+    if any(word in heading for word in IMPORTANT_SECTION_WORDS):
+        score += 20.0
+    elif any(word in heading for word in UNIMPORTANT_SECTION_WORDS):
+        score -= 20.0
+    return score
+
+
+def pack_readme(readme: str, budget: int, encoding) -> tuple[str, int]:
+    """
+    Fits a README into a token budget by dropping its least useful Markdown
+    sections, keeping the rest in their original order.
+
+    Args:
+        readme (str): README contents
+        budget (int): Maximum number of tokens for the packed README
+        encoding: A tiktoken encoding
+
+    Returns:
+        tuple[str, int]: The packed README and its approximate token count
+    """
+    starts = [0] + [
+        m.start() for m in HEADING_PATTERN.finditer(readme) if m.start() > 0
+    ]
+    sections = [
+        readme[start:end] for start, end in zip(starts, starts[1:] + [len(readme)])
+    ]
+    costs = _count_each(encoding, sections)
+    if sum(costs) <= budget:
+        return readme, sum(costs)
+
+    note = "\n\n[README sections omitted to fit the context limit]"
+    ranked = sorted(
+        range(len(sections)),
+        key=lambda i: _section_score(sections[i], i),
+        reverse=True,
+    )
+    kept = set()
+    used = len(encoding.encode_ordinary(note))
+    for i in ranked:
+        if used + costs[i] <= budget:
+            kept.add(i)
+            used += costs[i]
+
+    if not kept:
+        # Not even the intro fits, so keep as much of it as the budget allows
+        tokens = encoding.encode_ordinary(sections[0])[:budget]
+        return encoding.decode(tokens), len(tokens)
+
+    packed = "".join(sections[i] for i in sorted(kept))
+    return packed.rstrip() + note, used
+
+
+def pack_repository_context(
+    file_tree: str, readme: str, budget: int, encoding
+) -> tuple[str, str, int]:
+    """
+    Fits the file tree and README into a combined token budget. A quarter of
+    the budget is held for the README, the tree gets the rest, and whatever
+    the tree leaves unused goes back to the README.
+
+    Args:
+        file_tree (str): Paths separated by newlines
+        readme (str): README contents
+        budget (int): Maximum combined number of tokens
+        encoding: A tiktoken encoding
+
+    Returns:
+        tuple[str, str, int]: The packed file tree, packed README and their approximate token count
+    """
+    reserved = int(budget * README_BUDGET_SHARE)
+    packed_readme, readme_tokens = pack_readme(readme, reserved, encoding)
+    file_tree, tree_tokens = pack_file_tree(file_tree, budget - readme_tokens, encoding)
+    # A README cut to its share is packed again into what the tree left over
+    if packed_readme != readme and tree_tokens < budget - reserved:
+        packed_readme, readme_tokens = pack_readme(
+            readme, budget - tree_tokens, encoding
+        )
+    return file_tree, packed_readme, tree_tokens + readme_tokens
@@ -0,0 +1,42 @@
+import threading
+
+# Encoder for OpenAI models, shared by every service in the process
+ENCODING_NAME = "o200k_base"
+
+_encoding = None
+_lock = threading.Lock()
+
+
+def get_encoding():
+    """
+    Returns the process-wide tiktoken encoding, loading it on first use.
+
+    tiktoken is imported here rather than at module level, and the encoding is
+    only built once however many services count tokens.
+    """
+    global _encoding
+    if _encoding is None:
+        with _lock:
+            if _encoding is None:
+                import tiktoken
+
+                _encoding = tiktoken.get_encoding(ENCODING_NAME)
+    return _encoding
+
+
+def warm_encoding() -> None:
+    """Loads the encoding in a background thread so startup does not wait for it."""
+
+    def load():
+        try:
+            get_encoding()
+        except Exception as e:
+            # The first request that needs the encoding will retry and report
+            print(f"Failed to preload tokenizer: {str(e)}")
+
+    threading.Thread(target=load, name="tokenizer-warmup", daemon=True).start()
+
+
+def count_tokens(text: str) -> int:
+    """Counts tokens with the shared encoding. Picklable, for the CPU executor."""
+    return len(get_encoding().encode(text))
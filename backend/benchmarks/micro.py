@@ -0,0 +1,277 @@
+"""
+Microbenchmarks for the backend's pure hot functions: tree filtering, token
+counting, prompt formatting, click event rewriting, component mapping
+parsing, relevance pruning and SSE framing, on synthetic repositories of
+1k, 50k and 500k paths and READMEs of 1 KB to 1 MB. Reports the median time
+per call and the peak memory allocated by one call.
+
+    python -m benchmarks.micro [--scales 1k,50k,500k] [--only filter_tree,sse]
+    python -m benchmarks.micro --save baseline.json
+    python -m benchmarks.micro --compare baseline.json [--tolerance 1.25]
+
+Run from the backend directory. With --compare, exits non-zero when a case is
+slower or allocates more than the baseline times the tolerance. Cases whose
+dependencies are unavailable (e.g. the tokenizer cannot be downloaded) are
+reported as skipped.
+"""
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+SCALES = {"1k": 1_000, "50k": 50_000, "500k": 500_000}
+README_SIZES = {"1kb": 1_000, "32kb": 32_000, "1mb": 1_000_000}
+
+# Each case runs until this much time has passed, at least MIN_RUNS times
+MIN_SECONDS = 0.5
+MIN_RUNS = 3
+
+DIRECTORY_NAMES = [
+    "src", "lib", "app", "api", "core", "services", "utils", "components",
+    "models", "handlers", "auth", "billing", "web", "cmd", "internal", "pkg",
+]
+EXTENSIONS = [".py", ".ts", ".tsx", ".go", ".rs", ".md", ".json", ".png", ".min.js"]
+EXCLUDED_DIRECTORIES = ["node_modules", "vendor", "__pycache__"]
+WORDS = (
+    "the service reads the repository tree and streams a diagram of its "
+    "architecture to the browser while the user waits for the result"
+).split()
+
+
+def synthetic_paths(count: int, seed: int = 0) -> list[str]:
+    """Repository-like paths: nested directories, mixed extensions, some excluded."""
+    rng = random.Random(seed)
+    paths = []
+    while len(paths) < count:
+        depth = rng.randint(1, 6)
+        directories = [rng.choice(DIRECTORY_NAMES) for _ in range(depth)]
+        if rng.random() < 0.1:
+            directories.insert(rng.randint(0, depth), rng.choice(EXCLUDED_DIRECTORIES))
+        stem = f"{rng.choice(WORDS)}{rng.choice(['', 'Handler', '_utils', 'Service'])}{len(paths)}"
+        paths.append("/".join(directories) + "/" + stem + rng.choice(EXTENSIONS))
+    return paths
+
+
+def synthetic_readme(size: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts, length = [], 0
+    while length < size:
+        if rng.random() < 0.05:
+            part = f"\n\n## {rng.choice(WORDS).title()} {len(parts)}\n\n"
+        else:
+            part = " ".join(rng.choice(WORDS) for _ in range(12)) + ".\n"
+        parts.append(part)
+        length += len(part)
+    return "".join(parts)[:size]
+
+
+def synthetic_diagram(paths: list[str], clicks: int = 300) -> str:
+    """A diagram with click events on real, mistyped and directory paths."""
+    rng = random.Random(1)
+    lines = ["flowchart TD"]
+    for i in range(clicks):
+        path = rng.choice(paths)
+        if i % 5 == 0:
+            path = path.rpartition("/")[0]
+        elif i % 7 == 0:
+            path = path.upper()
+        lines.append(f'    n{i}["{path.rpartition("/")[2]}"]')
+        lines.append(f'    click n{i} "{path}"')
+    return "\n".join(lines)
+
+
+def synthetic_mapping(paths: list[str]) -> str:
+    """Compact mapping lines for real and mistyped paths, as phase 2 streams them."""
+    lines = []
+    for i, path in enumerate(paths[:5000]):
+        if i % 7 == 0:
+            path = path.upper()
+        lines.append(f'["{path.rpartition("/")[2]}","file","{path}"]')
+    return "\n".join(lines)
+
+
+def build_cases(scales: list[str]) -> dict:
+    """Returns case name -> zero-argument callable. Inputs are built up front."""
+    from app.services.github_service import GitHubService
+    from app.utils.format_message import format_user_message
+    from app.utils.file_tree_index import FileTreeIndex
+    from app.utils.relevance import prune_file_tree
+    from app.utils.sse import ChunkFrame, sse_event
+    from app.utils.tokenizer import count_tokens
+    from app.utils.component_mapping import parse_mapping
+    from app.routers.generate import process_click_events
+
+    cases = {}
+    readme = synthetic_readme(README_SIZES["32kb"])
+    for scale in scales:
+        paths = synthetic_paths(SCALES[scale])
+        raw_tree = "\n".join(paths)
+        file_tree = GitHubService._format_file_tree(paths)
+        index = FileTreeIndex(file_tree)
+        diagram = synthetic_diagram(file_tree.split("\n"))
+        mapping = synthetic_mapping(file_tree.split("\n"))
+        data = {"file_tree": file_tree, "readme": readme, "instructions": "focus on auth"}
+
+        cases[f"filter_tree[{scale}]"] = (
+            lambda paths=paths: GitHubService._format_file_tree(paths)
+        )
+        cases[f"count_tokens[tree-{scale}]"] = lambda text=raw_tree: count_tokens(text)
+        cases[f"format_user_message[{scale}]"] = lambda data=data: format_user_message(data)
+        cases[f"file_tree_index[{scale}]"] = lambda tree=file_tree: FileTreeIndex(tree)
+        cases[f"process_click_events[{scale}]"] = (
+            lambda diagram=diagram, index=index: process_click_events(
+                diagram, "owner", "repo", "main", index
+            )
+        )
+        cases[f"parse_mapping[{scale}]"] = (
+            lambda mapping=mapping, index=index: parse_mapping(mapping, index, "repo")
+        )
+        # Timed calls reuse the cached index; the traced first call builds it
+        cases[f"prune_file_tree[{scale}]"] = (
+            lambda tree=file_tree: prune_file_tree(tree, "focus on the auth service")
+        )
+
+    for size_name, size in README_SIZES.items():
+        text = synthetic_readme(size)
+        cases[f"count_tokens[readme-{size_name}]"] = lambda text=text: count_tokens(text)
+
+    frame = ChunkFrame("diagram_chunk")
+    chunks = [" ".join(WORDS[i % len(WORDS) : i % len(WORDS) + 3]) for i in range(10_000)]
+    complete = {
+        "status": "complete",
+        "diagram": synthetic_diagram(synthetic_paths(1_000)),
+        "explanation": synthetic_readme(README_SIZES["32kb"]),
+        "mapping": synthetic_mapping(synthetic_paths(1_000)),
+    }
+    cases["sse_chunk_frames[10k]"] = lambda: [frame(chunk) for chunk in chunks]
+    cases["sse_complete_event"] = lambda: sse_event(complete)
+    return cases
+
+
+def measure(func) -> dict:
+    # Peak memory is taken from a separate call, tracing slows everything down
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings = []
+    deadline = time.perf_counter() + MIN_SECONDS
+    while len(timings) < MIN_RUNS or time.perf_counter() < deadline:
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {
+        "seconds": statistics.median(timings),
+        # The fastest run is least affected by other load, so it is what gets compared
+        "min_seconds": min(timings),
+        "peak_bytes": peak,
+        "runs": len(timings),
+    }
+
+
+def format_size(size: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def format_seconds(seconds: float) -> str:
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f} us"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds:.2f} s"
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Returns one message per case that regressed beyond the tolerance."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get("cases", {}).get(name)
+        if not before or "min_seconds" not in result or "min_seconds" not in before:
+            continue
+        if result["min_seconds"] > before["min_seconds"] * tolerance:
+            regressions.append(
+                f"{name}: {format_seconds(result['min_seconds'])} vs {format_seconds(before['min_seconds'])} (fastest run)"
+            )
+        if result["peak_bytes"] > max(before["peak_bytes"], 1024) * tolerance:
+            regressions.append(
+                f"{name}: peak {format_size(result['peak_bytes'])} vs {format_size(before['peak_bytes'])}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scales", default=",".join(SCALES), help="Comma-separated tree sizes")
+    parser.add_argument("--only", default="", help="Comma-separated case name prefixes")
+    parser.add_argument("--save", metavar="PATH", help="Write the results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="Baseline to compare against")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.25,
+        help="Slowdown or memory growth factor counted as a regression",
+    )
+    args = parser.parse_args()
+
+    scales = [scale for scale in args.scales.split(",") if scale]
+    unknown = set(scales) - set(SCALES)
+    if unknown:
+        parser.error(f"unknown scales: {', '.join(sorted(unknown))}")
+    prefixes = [prefix for prefix in args.only.split(",") if prefix]
+
+    print("Building synthetic inputs...", flush=True)
+    cases = build_cases(scales)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    results = {}
+    for name, func in cases.items():
+        if prefixes and not any(name.startswith(prefix) for prefix in prefixes):
+            continue
+        try:
+            result = measure(func)
+        except Exception as e:
+            results[name] = {"skipped": f"{type(e).__name__}: {e}"[:120]}
+            print(f"{name:<40} skipped ({results[name]['skipped']})", flush=True)
+            continue
+        results[name] = result
+        line = f"{name:<40} {format_seconds(result['seconds']):>10}  peak {format_size(result['peak_bytes']):>8}"
+        before = (baseline or {}).get("cases", {}).get(name)
+        if before and "min_seconds" in before:
+            line += f"  ({result['min_seconds'] / before['min_seconds']:.2f}x baseline)"
+        print(line, flush=True)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(
+                {
+                    "python": sys.version.split()[0],
+                    "platform": platform.platform(),
+                    "cases": results,
+                },
+                f,
+                indent=2,
+            )
+        print(f"Saved baseline to {args.save}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
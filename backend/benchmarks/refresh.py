@@ -0,0 +1,176 @@
+"""
+End-to-end push webhook refresh against local stand-ins: a GitHub tree API
+served over HTTP (through GITHUB_API_URL) and canned LLM responses. A signed
+push is posted to /webhooks/github, and the refreshed diagram must then be
+served by /generate/cached to a frontend whose copy is older.
+
+    python -m benchmarks.refresh
+
+Run from the backend directory. State is kept in memory, nothing is written
+to the configured state database.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SECRET = "refresh-benchmark"
+OWNER, REPO, BRANCH = "octo", "app", "main"
+OLD_COMMIT, NEW_COMMIT, ASSET_COMMIT = "a" * 40, "b" * 40, "c" * 40
+INSTRUCTIONS = "Colour every service node green."
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), BaseHTTPRequestHandler)
+os.environ["GITHUB_API_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+os.environ["GITHUB_WEBHOOK_SECRET"] = SECRET
+os.environ["STATE_BACKEND"] = "memory"
+os.environ.setdefault("OPENROUTER_API_KEY", "unused")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.prompts import SYSTEM_FIRST_PROMPT, SYSTEM_SECOND_PROMPT  # noqa: E402
+from app.services import diagram_refresh  # noqa: E402
+from app.services.diagram_store import diagram_store  # noqa: E402
+
+OLD_TREE = ["README.md", "src", "src/api", "src/api/routes.py"]
+NEW_TREE = OLD_TREE + ["src/jobs", "src/jobs/worker.py"]
+
+OLD_DIAGRAM = (
+    "graph TD\n"
+    '    API["API"]\n'
+    f'    click API "https://github.com/{OWNER}/{REPO}/blob/{BRANCH}/src/api/routes.py"'
+)
+NEW_DIAGRAM = OLD_DIAGRAM + (
+    '\n    Worker["Worker"]\n    API --> Worker\n'
+    f'    click Worker "https://github.com/{OWNER}/{REPO}/blob/{BRANCH}/src/jobs/worker.py"'
+)
+
+
+class GitHubStandIn(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == f"/repos/{OWNER}/{REPO}/git/trees/{NEW_COMMIT}":
+            body = json.dumps(
+                {
+                    "sha": NEW_COMMIT,
+                    "truncated": False,
+                    "tree": [
+                        {"path": p, "type": "blob" if "." in p else "tree"}
+                        for p in NEW_TREE
+                    ],
+                }
+            ).encode()
+            self.send_response(200)
+        else:
+            body = b'{"message": "Not Found"}'
+            self.send_response(404)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+prompts = []
+
+
+async def llm_stand_in(system_prompt, data, **kwargs):
+    prompts.append((system_prompt, data))
+    if system_prompt.startswith(SYSTEM_FIRST_PROMPT):
+        text = "- `src/jobs`: Background worker consuming queued jobs."
+    elif system_prompt.startswith(SYSTEM_SECOND_PROMPT):
+        text = '["Worker","file","src/jobs/worker.py"]'
+    else:
+        text = NEW_DIAGRAM
+    for i in range(0, len(text), 16):
+        yield text[i : i + 16]
+
+
+def push(client: TestClient, before: str, after: str, files: list[str]):
+    payload = json.dumps(
+        {
+            "ref": f"refs/heads/{BRANCH}",
+            "before": before,
+            "after": after,
+            "size": 1,
+            "commits": [{"added": files, "removed": [], "modified": []}],
+            "repository": {"name": REPO, "owner": {"login": OWNER}},
+        }
+    ).encode()
+    signature = hmac.new(SECRET.encode(), payload, hashlib.sha256).hexdigest()
+    return client.post(
+        "/webhooks/github",
+        content=payload,
+        headers={
+            "X-GitHub-Event": "push",
+            "X-Hub-Signature-256": f"sha256={signature}",
+        },
+    )
+
+
+def main():
+    server.RequestHandlerClass = GitHubStandIn
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    diagram_refresh.o4_service.call_o4_api_stream = llm_stand_in
+
+    diagram_store.put(
+        OWNER,
+        REPO,
+        branch=BRANCH,
+        commit=OLD_COMMIT,
+        file_tree="\n".join(OLD_TREE),
+        directories="src\nsrc/api",
+        explanation="- `src/api`: HTTP routes.",
+        mapping='["API","file","src/api/routes.py"]',
+        instructions=INSTRUCTIONS,
+        diagram=OLD_DIAGRAM,
+    )
+    # When the frontend cached its copy of the generated diagram
+    frontend_saved_at = diagram_store.get(OWNER, REPO)["updated_at"]
+
+    client = TestClient(app)
+    query = {"username": OWNER, "repo": REPO, "since": frontend_saved_at}
+    assert client.get("/generate/cached", params=query).status_code == 304
+
+    # Test clients run background tasks before returning the response
+    start = time.perf_counter()
+    response = push(client, OLD_COMMIT, NEW_COMMIT, ["src/jobs/worker.py"])
+    elapsed = time.perf_counter() - start
+    assert response.json() == {"status": "scheduled"}, response.json()
+
+    refreshed = client.get("/generate/cached", params=query)
+    assert refreshed.status_code == 200, refreshed.status_code
+    record = refreshed.json()
+    assert record["commit"] == NEW_COMMIT
+    assert "src/jobs/worker.py" in record["diagram"]
+    assert "src/jobs/worker.py" in record["mapping"]
+    assert "src/jobs" in record["explanation"]
+    assert record["artifacts"]
+    # The explanation and diagram phases keep the original instructions
+    instructed = [data for _, data in prompts if INSTRUCTIONS in data.get("instructions", "")]
+    assert len(instructed) == 2, prompts
+
+    # A push of excluded files only records its commit, without LLM calls
+    calls = len(prompts)
+    assert push(client, NEW_COMMIT, ASSET_COMMIT, ["logo.png"]).json() == {
+        "status": "scheduled"
+    }
+    latest = diagram_store.get(OWNER, REPO)
+    assert latest["commit"] == ASSET_COMMIT and len(prompts) == calls
+    assert latest["updated_at"] == record["updated_at"]
+    query["since"] = record["updated_at"]
+    assert client.get("/generate/cached", params=query).status_code == 304
+
+    print(f"webhook refresh: {elapsed * 1000:.1f} ms, {calls} LLM calls")
+    print("refreshed diagram is served to frontends holding the older copy")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
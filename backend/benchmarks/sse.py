@@ -0,0 +1,94 @@
+"""
+SSE relay microbenchmark: per-chunk CPU cost of parsing an upstream
+OpenRouter line and encoding the outgoing frame, for the previous str/json
+implementation and the bytes/orjson one in app.utils.sse.
+
+    python -m benchmarks.sse [--chunks 200000]
+
+Run from the backend directory.
+"""
+
+import argparse
+import json
+import time
+
+from app.utils.sse import DONE, ChunkFrame, parse_delta
+
+CHUNKS = ["def", " main", "():\n", "    return", ' "résumé"', " graph TD", "\n    A-->B"]
+
+
+def upstream_line(text: str) -> bytes:
+    # Shape of an OpenRouter streaming chunk
+    payload = {
+        "id": "gen-1730000000-abcdefghijklmnop",
+        "provider": "OpenAI",
+        "model": "openai/o4-mini",
+        "object": "chat.completion.chunk",
+        "created": 1730000000,
+        "choices": [
+            {
+                "index": 0,
+                "delta": {"role": "assistant", "content": text},
+                "finish_reason": None,
+                "native_finish_reason": None,
+                "logprobs": None,
+            }
+        ],
+    }
+    return b"data: " + json.dumps(payload).encode() + b"\n"
+
+
+def legacy_relay(line: bytes) -> bytes:
+    text = line.decode("utf-8").strip()
+    if text.startswith("data: "):
+        if text == "data: [DONE]":
+            return b""
+        data = json.loads(text[6:])
+        content = data.get("choices", [{}])[0].get("delta", {}).get("content")
+        if content:
+            frame = f"data: {json.dumps({'status': 'diagram_chunk', 'chunk': content})}\n\n"
+            # Starlette encodes str chunks before sending
+            return frame.encode("utf-8")
+    return b""
+
+
+frame = ChunkFrame("diagram_chunk")
+
+
+def fast_relay(line: bytes) -> bytes:
+    content = parse_delta(line)
+    if content is DONE or not content:
+        return b""
+    return frame(content)
+
+
+def bench(relay, lines: list[bytes]) -> float:
+    start = time.perf_counter()
+    for line in lines:
+        relay(line)
+    return (time.perf_counter() - start) / len(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--chunks", type=int, default=200000)
+    args = parser.parse_args()
+
+    lines = [upstream_line(CHUNKS[i % len(CHUNKS)]) for i in range(args.chunks)]
+
+    # Both relays must produce frames that decode to the same event
+    for line in lines[: len(CHUNKS)]:
+        legacy = json.loads(legacy_relay(line)[6:])
+        fast = json.loads(fast_relay(line)[6:])
+        assert legacy == fast, (legacy, fast)
+
+    for relay in (legacy_relay, fast_relay):
+        bench(relay, lines[:1000])  # warm up
+    legacy = bench(legacy_relay, lines)
+    fast = bench(fast_relay, lines)
+    print(f"legacy str/json relay: {legacy * 1e6:.2f} us/chunk")
+    print(f"bytes/orjson relay:    {fast * 1e6:.2f} us/chunk ({legacy / fast:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
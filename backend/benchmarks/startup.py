@@ -0,0 +1,81 @@
+"""
+Startup benchmark: times a cold `import app.main` in fresh interpreters and
+checks that provider SDKs stay out of the import path.
+
+    python -m benchmarks.startup [--runs 5] [--budget 1.5]
+
+Run from the backend directory. Exits non-zero when the median import time
+exceeds the budget (seconds) or a lazily imported module is loaded eagerly.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Modules that must only be imported once a request needs them
+LAZY_MODULES = ["openai", "anthropic", "aiohttp", "jwt", "tiktoken", "api_analytics"]
+
+PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": elapsed,
+    "eager": [name for name in {LAZY_MODULES!r} if name in sys.modules],
+}}))
+"""
+
+
+def measure(runs: int) -> tuple[list[float], set[str]]:
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    timings, eager = [], set()
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-W", "ignore", "-c", PROBE],
+            cwd=backend_dir,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        data = json.loads(result.stdout.strip().splitlines()[-1])
+        timings.append(data["seconds"])
+        eager.update(data["eager"])
+    return timings, eager
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=float(os.getenv("STARTUP_BUDGET_SECONDS", "1.5")),
+        help="Maximum median import time in seconds",
+    )
+    args = parser.parse_args()
+
+    timings, eager = measure(args.runs)
+    median = statistics.median(timings)
+    print(
+        f"import app.main: median {median:.3f}s, min {min(timings):.3f}s, "
+        f"max {max(timings):.3f}s over {args.runs} runs (budget {args.budget:.3f}s)"
+    )
+
+    failed = False
+    if eager:
+        print(f"FAIL: imported at startup: {', '.join(sorted(eager))}")
+        failed = True
+    if median > args.budget:
+        print("FAIL: median import time is over budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
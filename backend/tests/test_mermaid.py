@@ -0,0 +1,45 @@
+from app.utils.mermaid import parse_mermaid, repair_mermaid, validate_mermaid
+
+QUOTED_TEXT_LINK = """graph TD
+    A["API"] -- "HTTP POST" --> B["Worker"]
+    click B "backend/worker.py"
+    class B fileStyle
+    classDef fileStyle fill:#ECECFF
+"""
+
+UNQUOTED_TEXT_LINK = """graph TD
+    A -- calls --> C
+    A -. polls .-> D
+    click C "backend/calls.py"
+    click D "backend/poller.py"
+"""
+
+
+def test_quoted_text_link_label_keeps_click():
+    diagram = parse_mermaid(QUOTED_TEXT_LINK)
+    assert set(diagram.nodes) == {"A", "B"}
+    assert [(edge.source, edge.target, edge.label) for edge in diagram.edges] == [
+        ("A", "B", '"HTTP POST"')
+    ]
+    assert validate_mermaid(QUOTED_TEXT_LINK) == []
+    repaired, fixes = repair_mermaid(QUOTED_TEXT_LINK)
+    assert 'click B "backend/worker.py"' in repaired
+    assert fixes == []
+
+
+def test_unquoted_text_link_label_is_not_a_node():
+    diagram = parse_mermaid(UNQUOTED_TEXT_LINK)
+    assert set(diagram.nodes) == {"A", "C", "D"}
+    assert [edge.label for edge in diagram.edges] == ["calls", "polls"]
+    repaired, fixes = repair_mermaid(UNQUOTED_TEXT_LINK)
+    assert 'click C "backend/calls.py"' in repaired
+    assert 'click D "backend/poller.py"' in repaired
+    assert fixes == []
+
+
+def test_comment_start_inside_label_is_kept():
+    code = 'graph TD\n    A[src/*.py] -->|"reads */"| B /* trailing */\n'
+    repaired, fixes = repair_mermaid(code)
+    assert "A[src/*.py]" in repaired
+    assert "trailing" not in repaired
+    assert fixes == ["removed inline comment"]
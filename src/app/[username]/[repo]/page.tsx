@@ -33,6 +33,7 @@ export default function Repo() {
     handleCloseApiKeyDialog,
     handleOpenApiKeyDialog,
     handleExportImage,
+    loadCachedDetails,
     state,
   } = useDiagram(params.username.toLowerCase(), params.repo.toLowerCase());
 
@@ -75,7 +76,15 @@ export default function Repo() {
         />
       </div>
       <div className="mt-8 flex w-[90%] flex-col gap-8">
-        <Accordion.Root type="multiple" defaultValue={['item-2']} className="w-full">
+        <Accordion.Root
+          type="multiple"
+          defaultValue={['item-2']}
+          onValueChange={(value) => {
+            // Cached diagrams load their explanation and mapping on demand
+            if (value.includes('item-1')) void loadCachedDetails();
+          }}
+          className="w-full"
+        >
           <Accordion.Item value="item-1" className="bg-white border border-gray-300 rounded-lg mb-3 shadow-md overflow-hidden transition-shadow hover:shadow-lg">
             <Accordion.Header>
               <Accordion.Trigger className="flex items-center justify-between w-full p-4 font-medium text-left group text-lg text-purple-700 hover:bg-purple-50 transition-colors">
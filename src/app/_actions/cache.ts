@@ -4,22 +4,29 @@ import { db } from "~/server/db";
 import { eq, and } from "drizzle-orm";
 import { diagramCache } from "~/server/db/schema";
 import { sql } from "drizzle-orm";
+import { readArtifact } from "~/lib/artifacts";
 
 export async function getCachedDiagram(username: string, repo: string) {
   try {
     const cached = await db
-      .select()
+      .select({
+        diagram: diagramCache.diagram,
+        updatedAt: diagramCache.updatedAt,
+        createdAt: diagramCache.createdAt,
+      })
       .from(diagramCache)
       .where(
         and(eq(diagramCache.username, username), eq(diagramCache.repo, repo)),
       )
       .limit(1);
 
+    // Every page view reads this, so the explanation and mapping stay
+    // compressed until getCachedExplanationAndMapping asks for them
     if (cached[0]) {
       return {
         diagram: cached[0].diagram,
-        explanation: cached[0].explanation,
-        mapping: cached[0].mapping,
+        // Same as getLastGeneratedDate, without another query
+        lastGenerated: cached[0].updatedAt ?? cached[0].createdAt,
       };
     }
     return null;
@@ -39,13 +46,33 @@ export async function getCachedExplanationAndMapping(username: string, repo: str
       )
       .limit(1);
 
-    return cached[0] ?? null;
+    if (!cached[0]) {
+      return null;
+    }
+    return {
+      ...cached[0],
+      explanation: readCachedArtifact(cached[0], "explanation"),
+      mapping: readCachedArtifact(cached[0], "mapping"),
+    };
   } catch (error) {
     console.error("Error fetching cached explanation:", error);
     return null;
   }
 }
 
+// Rows with compressed artifacts leave the plain columns empty, so only the
+// requested artifact is inflated from the blob
+function readCachedArtifact(
+  row: typeof diagramCache.$inferSelect,
+  field: "explanation" | "mapping",
+) {
+  const value = row[field];
+  if (value || !row.artifacts) {
+    return value ?? "";
+  }
+  return readArtifact(row.artifacts, field);
+}
+
 export async function cacheDiagramAndExplanation(
   username: string,
   repo: string,
@@ -53,24 +80,27 @@ export async function cacheDiagramAndExplanation(
   explanation: string,
   mapping: string,
   usedOwnKey = false,
+  artifacts?: string,
 ) {
+  // With a compressed blob, store only the diagram uncompressed since it is
+  // what every page view reads
+  const columns = artifacts
+    ? { diagram, explanation: "", mapping: null, artifacts }
+    : { diagram, explanation, mapping, artifacts: null };
+
   try {
     await db
       .insert(diagramCache)
       .values({
         username,
         repo,
-        diagram,
-        explanation,
-        mapping,
+        ...columns,
         usedOwnKey,
       })
       .onConflictDoUpdate({
         target: [diagramCache.username, diagramCache.repo],
         set: {
-          diagram,
-          explanation,
-          mapping,
+          ...columns,
           usedOwnKey,
           updatedAt: new Date(),
         },
@@ -12,5 +12,6 @@ export async function getLastGeneratedDate(username: string, repo: string) {
       and(eq(diagramCache.username, username), eq(diagramCache.repo, repo)),
     );
 
-  return result[0]?.updatedAt;
+  // Rows that were never updated only have their creation time
+  return result[0]?.updatedAt ?? result[0]?.createdAt;
 }
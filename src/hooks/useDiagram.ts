@@ -2,10 +2,14 @@ import { useState, useEffect, useCallback } from "react";
 import {
   cacheDiagramAndExplanation,
   getCachedDiagram,
+  getCachedExplanationAndMapping,
 } from "~/app/_actions/cache";
 import { getLastGeneratedDate } from "~/app/_actions/repo";
-import { getCostOfGeneration } from "~/lib/fetch-backend";
-import { exampleRepos } from "~/lib/exampleRepos";
+import {
+  getCostOfGeneration,
+  getRefreshedDiagram,
+  getShowcaseDiagram,
+} from "~/lib/fetch-backend";
 
 interface StreamState {
   status:
@@ -27,6 +31,9 @@ interface StreamState {
   loadingMapping?: string;
   loadingDiagramText?: string;
   finalDiagram?: string;
+  artifacts?: string;
+  // Loaded from the cache rather than generated, so nothing is written back
+  fromCache?: boolean;
   error?: string;
 }
 
@@ -37,6 +44,7 @@ interface StreamResponse {
   explanation?: string;
   mapping?: string;
   diagram?: string;
+  artifacts?: string;
   error?: string;
 }
 
@@ -45,6 +53,8 @@ export function useDiagram(username: string, repo: string) {
   const [error, setError] = useState<string>("");
   const [loading, setLoading] = useState<boolean>(true);
   const [lastGenerated, setLastGenerated] = useState<Date | undefined>();
+  // Served from the backend's showcase bundle, which cannot be regenerated
+  const [isShowcase, setIsShowcase] = useState<boolean>(false);
   const [cost, setCost] = useState<string>("");
   const [showApiKeyDialog, setShowApiKeyDialog] = useState(false);
   // const [tokenCount, setTokenCount] = useState<number>(0);
@@ -198,7 +208,8 @@ export function useDiagram(username: string, repo: string) {
                           status: "complete",
                           // Use server's final explanation if sent; otherwise, keep the accumulated one from prev state.
                           loadingExplanation: data.explanation ?? prev.loadingExplanation,
-                          finalDiagram: data.diagram // Store the final diagram code from server payload
+                          finalDiagram: data.diagram, // Store the final diagram code from server payload
+                          artifacts: data.artifacts,
                         }));
                         const date = await getLastGeneratedDate(username, repo);
                         setLastGenerated(date ?? undefined);
@@ -241,7 +252,7 @@ export function useDiagram(username: string, repo: string) {
   );
 
   useEffect(() => {
-    if (state.status === "complete" && state.finalDiagram) {
+    if (state.status === "complete" && state.finalDiagram && !state.fromCache) {
       // Cache the completed diagram with the usedOwnKey flag
       const hasApiKey = !!localStorage.getItem("openrouter_key");
       void cacheDiagramAndExplanation(
@@ -251,6 +262,7 @@ export function useDiagram(username: string, repo: string) {
         state.loadingExplanation ?? "No explanation provided",
         state.loadingMapping ?? "No mapping provided",
         hasApiKey,
+        state.artifacts,
       );
       setDiagram(state.finalDiagram);
       void getLastGeneratedDate(username, repo).then((date) =>
@@ -259,7 +271,7 @@ export function useDiagram(username: string, repo: string) {
     } else if (state.status === "error") {
       setLoading(false);
     }
-  }, [state.status, state.finalDiagram, username, repo, state.loadingExplanation]);
+  }, [state.status, state.finalDiagram, state.fromCache, username, repo, state.loadingExplanation]);
 
   const getDiagram = useCallback(async () => {
     setLoading(true);
@@ -267,22 +279,75 @@ export function useDiagram(username: string, repo: string) {
     setCost("");
 
     try {
+      // Showcase repos come precomputed from the backend, without a DB
+      // query; for any other repository it answers 404. The cache is read
+      // at the same time, so neither lookup waits on the other
+      const [showcase, cached] = await Promise.all([
+        getShowcaseDiagram(username, repo),
+        getCachedDiagram(username, repo),
+      ]);
+      setIsShowcase(!!showcase);
+      if (showcase) {
+        setDiagram(showcase.diagram);
+        // Flagged as cached, so completing it writes nothing to the DB cache
+        setState({
+          status: "complete",
+          fromCache: true,
+          loadingExplanation: showcase.explanation,
+          loadingMapping: showcase.mapping,
+          loadingDiagramText: showcase.diagram,
+          finalDiagram: showcase.diagram,
+        });
+        setLastGenerated(
+          showcase.updated_at ? new Date(showcase.updated_at * 1000) : undefined,
+        );
+        return;
+      }
+
       // Check cache first - always allow access to cached diagrams
-      const cached = await getCachedDiagram(username, repo);
       const github_pat = localStorage.getItem("github_pat");
 
       if (cached?.diagram) { // Check for cached object and diagram property
         setDiagram(cached.diagram);
+        // The explanation and mapping are loaded with loadCachedDetails
+        // when the progress panel is opened
         setState(prev => ({
           ...prev,
           status: "complete",
-          loadingExplanation: cached.explanation || "Cached explanation not found.",
-          loadingMapping: cached.mapping ?? "Cached mapping not found.",
+          fromCache: true,
           loadingDiagramText: cached.diagram ?? "Diagram loaded from cache. Textual representation of diagram is not stored with cache.",
           finalDiagram: cached.diagram
         }));
-        const date = await getLastGeneratedDate(username, repo);
-        setLastGenerated(date ?? undefined);
+        setLastGenerated(cached.lastGenerated ?? undefined);
+
+        // Push webhooks refresh diagrams on the backend; a newer copy there
+        // replaces the cached one and is written through to the cache. The
+        // cached diagram is shown without waiting for this check
+        void getRefreshedDiagram(username, repo, cached.lastGenerated ?? undefined)
+          .then(async (refreshed) => {
+            if (!refreshed) return;
+            setDiagram(refreshed.diagram);
+            setState((prev) => ({
+              ...prev,
+              loadingExplanation: refreshed.explanation,
+              loadingMapping: refreshed.mapping,
+              loadingDiagramText: refreshed.diagram,
+              finalDiagram: refreshed.diagram,
+            }));
+            setLastGenerated(new Date(refreshed.updated_at * 1000));
+            await cacheDiagramAndExplanation(
+              username,
+              repo,
+              refreshed.diagram,
+              refreshed.explanation,
+              refreshed.mapping,
+              false,
+              refreshed.artifacts,
+            );
+          })
+          .catch((error) => {
+            console.error("Error refreshing cached diagram:", error);
+          });
         return;
       }
 
@@ -334,14 +399,8 @@ export function useDiagram(username: string, repo: string) {
     void getDiagram();
   }, [getDiagram]);
 
-  const isExampleRepo = (repoName: string): boolean => {
-    return Object.values(exampleRepos).some((value) =>
-      value.includes(repoName),
-    );
-  };
-
   const handleModify = async (instructions: string) => {
-    if (isExampleRepo(repo)) {
+    if (isShowcase) {
       setError("Example repositories cannot be modified.");
       return;
     }
@@ -361,7 +420,7 @@ export function useDiagram(username: string, repo: string) {
   };
 
   const handleRegenerate = async (instructions: string) => {
-    if (isExampleRepo(repo)) {
+    if (isShowcase) {
       setError("Example repositories cannot be regenerated.");
       return;
     }
@@ -404,6 +463,21 @@ export function useDiagram(username: string, repo: string) {
     }
   };
 
+  const loadCachedDetails = useCallback(async () => {
+    if (!state.fromCache || state.loadingExplanation !== undefined) return;
+    const cached = await getCachedExplanationAndMapping(username, repo);
+    // A backend refresh may have set newer details meanwhile
+    setState((prev) =>
+      prev.loadingExplanation !== undefined
+        ? prev
+        : {
+            ...prev,
+            loadingExplanation: cached?.explanation || "Cached explanation not found.",
+            loadingMapping: cached?.mapping ?? "Cached mapping not found.",
+          },
+    );
+  }, [state.fromCache, state.loadingExplanation, username, repo]);
+
   const handleCopy = async () => {
     try {
       await navigator.clipboard.writeText(diagram);
@@ -501,6 +575,7 @@ export function useDiagram(username: string, repo: string) {
     handleCloseApiKeyDialog,
     handleOpenApiKeyDialog,
     handleExportImage,
+    loadCachedDetails,
     state,
   };
 }
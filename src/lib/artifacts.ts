@@ -0,0 +1,83 @@
+import { inflateSync } from "node:zlib";
+
+// Reader for the compressed artifact blobs produced by
+// backend/app/utils/artifact_codec.py:
+//
+//   "GDA" | dictionary version (1 byte) | 3 x frame length (uint32 BE) | frames
+//
+// Each artifact is a separate zlib frame, so only the requested one is inflated.
+// ARTIFACT_DICTIONARY must stay byte-identical to the backend's dictionary.
+const MAGIC = "GDA";
+const DICTIONARY_VERSION = 1;
+const HEADER_SIZE = 16;
+const FIELDS = ["diagram", "explanation", "mapping"] as const;
+// Upper bound of an inflated artifact. Generations are far below it, so a
+// frame that inflates past it is corrupt or hostile and is rejected rather
+// than expanded in memory.
+const MAX_ARTIFACT_BYTES = 16 * 1024 * 1024;
+
+export type ArtifactField = (typeof FIELDS)[number];
+
+const ARTIFACT_DICTIONARY = Buffer.from(
+  "Project Overview: Key Directories and Files: Overall Structure: " +
+    "Key functions/classes: Directory purpose File purpose " +
+    "Contains Defines Handles Implements Provides Configures the main " +
+    "application entry point API endpoints business logic utility functions " +
+    "data models database configuration components services tests " +
+    '<component type="file" path="" name="" /> ' +
+    '<component type="function" path="" name="" parent_file="" /> ' +
+    '<component type="class" path="" name="" parent_file="" /> ' +
+    "<component_mapping></component_mapping> " +
+    "classDef fileStyle fill:#ECECFF,stroke:#9090D0,stroke-width:2px,color:#000;\n" +
+    "classDef functionStyle fill:#D0F0D0,stroke:#70B070,stroke-width:2px,color:#000;\n" +
+    "classDef codeClassStyle fill:#FFEDD0,stroke:#D0B070,stroke-width:2px,color:#000;\n" +
+    "classDef serviceStyle fill:#E0E0E0,stroke:#A0A0A0,stroke-width:2px,color:#000;\n" +
+    'graph TD\n    subgraph sg_src_ ["src/"]\n        direction LR\n    end\n' +
+    '    class sg_ fileStyle\n    -->|"calls"| -->|"imports"| -->|"uses"| ' +
+    ":::functionStyle :::codeClassStyle :::fileStyle " +
+    '    click n_ "https://github.com/" /blob/main/ /tree/main/ ',
+  "utf8",
+);
+
+/**
+ * Inflates a single artifact from a base64-encoded blob without touching the
+ * other two. Throws on malformed blobs and on artifacts over
+ * MAX_ARTIFACT_BYTES.
+ */
+export function readArtifact(blob: string, field: ArtifactField): string {
+  const buffer = Buffer.from(blob, "base64");
+  if (
+    buffer.length < HEADER_SIZE ||
+    buffer.toString("latin1", 0, 3) !== MAGIC
+  ) {
+    throw new Error("Not an artifact blob");
+  }
+  if (buffer.readUInt8(3) !== DICTIONARY_VERSION) {
+    throw new Error(`Unsupported artifact dictionary version ${buffer.readUInt8(3)}`);
+  }
+
+  let offset = HEADER_SIZE;
+  for (let i = 0; i < FIELDS.length; i++) {
+    const length = buffer.readUInt32BE(4 + i * 4);
+    if (offset + length > buffer.length) {
+      throw new Error("Truncated artifact blob");
+    }
+    if (FIELDS[i] === field) {
+      try {
+        return inflateSync(buffer.subarray(offset, offset + length), {
+          dictionary: ARTIFACT_DICTIONARY,
+          maxOutputLength: MAX_ARTIFACT_BYTES,
+        }).toString("utf8");
+      } catch (error) {
+        if (error instanceof RangeError) {
+          throw new Error(
+            `Artifact ${field} inflates to more than ${MAX_ARTIFACT_BYTES} bytes`,
+          );
+        }
+        throw error;
+      }
+    }
+    offset += length;
+  }
+  throw new Error(`Unknown artifact field ${field}`);
+}
@@ -81,7 +81,7 @@ export async function modifyAndCacheDiagram(
 ): Promise<ModifyApiResponse> {
   try {
     // First get the current diagram from cache
-    const currentDiagram = await getCachedDiagram(username, repo);
+    const currentDiagram = (await getCachedDiagram(username, repo))?.diagram;
     const cached = await getCachedExplanationAndMapping(username, repo);
     const explanation = cached?.explanation;
     const mapping = cached?.mapping;
@@ -170,3 +170,76 @@ export async function getCostOfGeneration(
     return { error: "Failed to get cost estimate." };
   }
 }
+
+interface ShowcaseApiResponse {
+  diagram: string;
+  explanation: string;
+  mapping: string;
+  commit: string | null;
+  updated_at: number | null;
+  version: number;
+}
+
+// Precomputed diagram of a showcase repository, or null if it is not one
+// (the backend answers 404). Served from backend memory with an ETag, so the
+// browser revalidates cheaply.
+export async function getShowcaseDiagram(
+  username: string,
+  repo: string,
+): Promise<ShowcaseApiResponse | null> {
+  try {
+    const baseUrl =
+      process.env.NEXT_PUBLIC_API_DEV_URL ?? "https://api.gitdiagram.com";
+    const url = new URL(
+      `${baseUrl}/generate/showcase/${encodeURIComponent(username)}/${encodeURIComponent(repo)}`,
+    );
+
+    const response = await fetch(url);
+    if (!response.ok) {
+      return null;
+    }
+    return (await response.json()) as ShowcaseApiResponse;
+  } catch (error) {
+    console.error("Error fetching showcase diagram:", error);
+    return null;
+  }
+}
+
+interface RefreshedDiagramResponse {
+  error?: string;
+  diagram: string;
+  explanation: string;
+  mapping: string;
+  artifacts: string;
+  commit: string | null;
+  updated_at: number;
+}
+
+// Backend copy of a diagram that push webhooks refreshed after `since`, or
+// null if the cached copy is current
+export async function getRefreshedDiagram(
+  username: string,
+  repo: string,
+  since?: Date,
+): Promise<RefreshedDiagramResponse | null> {
+  try {
+    const baseUrl =
+      process.env.NEXT_PUBLIC_API_DEV_URL ?? "https://api.gitdiagram.com";
+    const url = new URL(`${baseUrl}/generate/cached`);
+    url.searchParams.append("username", username);
+    url.searchParams.append("repo", repo);
+    if (since) {
+      url.searchParams.append("since", String(since.getTime() / 1000));
+    }
+
+    const response = await fetch(url);
+    if (response.status === 304 || !response.ok) {
+      return null;
+    }
+    const data = (await response.json()) as RefreshedDiagramResponse;
+    return data.error ? null : data;
+  } catch (error) {
+    console.error("Error fetching refreshed diagram:", error);
+    return null;
+  }
+}
@@ -6,6 +6,7 @@ import {
   pgTableCreator,
   timestamp,
   varchar,
+  text,
   primaryKey,
   boolean,
 } from "drizzle-orm/pg-core";
@@ -23,11 +24,14 @@ export const diagramCache = createTable(
   {
     username: varchar("username", { length: 256 }).notNull(),
     repo: varchar("repo", { length: 256 }).notNull(),
-    diagram: varchar("diagram", { length: 10000 }).notNull(), // Adjust length as needed
-    explanation: varchar("explanation", { length: 10000 })
+    diagram: text("diagram").notNull(),
+    explanation: text("explanation")
       .notNull()
       .default("No explanation provided"), // Default explanation to avoid data loss of existing rows
-    mapping: varchar("mapping", { length: 10000 }), // Added mapping column
+    mapping: text("mapping"), // Added mapping column
+    // Compressed diagram, explanation and mapping (see src/lib/artifacts.ts).
+    // When set, the explanation and mapping columns are left empty.
+    artifacts: text("artifacts"),
     createdAt: timestamp("created_at", { withTimezone: true })
       .default(sql`CURRENT_TIMESTAMP`)
       .notNull(),